@@ -24,6 +24,12 @@ if config.config_file_name is not None:
 
 target_metadata = Base.metadata
 
+# Migrate another database than sqlalchemy.url, like a shard:
+# alembic -x db_url=sqlite:///./app/task_shard_0.db upgrade head
+db_url = context.get_x_argument(as_dictionary=True).get("db_url")
+if db_url is not None:
+    config.set_main_option("sqlalchemy.url", db_url)
+
 # other values from the config, defined by the needs of env.py,
 # can be acquired:
 # my_important_option = config.get_main_option("my_important_option")
@@ -0,0 +1,40 @@
+"""Add indexes for sorting tasks
+
+Revision ID: 4a74d96105c9
+Revises: 62a356d1d574
+Create Date: 2024-06-08 11:26:40.518263
+
+"""
+
+from typing import Sequence, Union
+
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision: str = "4a74d96105c9"
+down_revision: Union[str, None] = "62a356d1d574"
+branch_labels: Union[str, Sequence[str], None] = None
+depends_on: Union[str, Sequence[str], None] = None
+
+
+def upgrade() -> None:
+    op.create_index("ix_task_user_id_name", "task", ["user_id", "name"], unique=False)
+    op.create_index(
+        "ix_task_user_id_status", "task", ["user_id", "status"], unique=False
+    )
+    # Tasks without a due date sort last, the expression has to match the one
+    # used in SqliteTaskManager's queries for sqlite to use this index
+    op.create_index(
+        "ix_task_user_id_due_date",
+        "task",
+        ["user_id", sa.text("coalesce(due_date, '9999-12-31')")],
+        unique=False,
+    )
+
+
+def downgrade() -> None:
+    op.drop_index("ix_task_user_id_due_date", table_name="task")
+    op.drop_index("ix_task_user_id_status", table_name="task")
+    op.drop_index("ix_task_user_id_name", table_name="task")
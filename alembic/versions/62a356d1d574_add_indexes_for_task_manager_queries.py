@@ -0,0 +1,42 @@
+"""Add indexes for task manager queries
+
+Revision ID: 62a356d1d574
+Revises: a2b25abf1c45
+Create Date: 2024-06-02 15:03:51.904217
+
+"""
+
+from typing import Sequence, Union
+
+from alembic import op
+
+
+# revision identifiers, used by Alembic.
+revision: str = "62a356d1d574"
+down_revision: Union[str, None] = "a2b25abf1c45"
+branch_labels: Union[str, Sequence[str], None] = None
+depends_on: Union[str, Sequence[str], None] = None
+
+
+def upgrade() -> None:
+    # Sqlite appends the rowid to every index entry, so tasks found through this
+    # index keep coming back in insertion order
+    op.create_index(op.f("ix_task_user_id"), "task", ["user_id"], unique=False)
+    op.create_index(
+        "ix_history_entity_id_type_created_at",
+        "history",
+        ["entity_id", "type", "created_at"],
+        unique=False,
+    )
+    op.create_index(
+        "ix_task_label_label_id_task_id",
+        "task_label",
+        ["label_id", "task_id"],
+        unique=False,
+    )
+
+
+def downgrade() -> None:
+    op.drop_index("ix_task_label_label_id_task_id", table_name="task_label")
+    op.drop_index("ix_history_entity_id_type_created_at", table_name="history")
+    op.drop_index(op.f("ix_task_user_id"), table_name="task")
@@ -0,0 +1,44 @@
+"""Add task versions
+
+Revision ID: 9e51c0d7a3f2
+Revises: 4a74d96105c9
+Create Date: 2024-06-09 10:12:05.331870
+
+"""
+
+from typing import Sequence, Union
+
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision: str = "9e51c0d7a3f2"
+down_revision: Union[str, None] = "4a74d96105c9"
+branch_labels: Union[str, Sequence[str], None] = None
+depends_on: Union[str, Sequence[str], None] = None
+
+
+def upgrade() -> None:
+    op.add_column(
+        "task",
+        sa.Column("version", sa.Integer(), server_default="1", nullable=False),
+    )
+    op.create_table(
+        "tasks_version",
+        sa.Column("user_id", sa.Uuid(), nullable=False),
+        sa.Column("version", sa.Integer(), nullable=False),
+        sa.PrimaryKeyConstraint("user_id"),
+    )
+    # Existing tasks are all at version 1, so the next write for each user has
+    # to move past it
+    op.execute(
+        "INSERT INTO tasks_version (user_id, version) "
+        "SELECT DISTINCT user_id, 1 FROM task"
+    )
+
+
+def downgrade() -> None:
+    op.drop_table("tasks_version")
+    with op.batch_alter_table("task") as batch_op:
+        batch_op.drop_column("version")
@@ -0,0 +1,56 @@
+"""Add unique index to label name
+
+Revision ID: a2b25abf1c45
+Revises: 4929c553b31a
+Create Date: 2024-06-02 10:41:08.172934
+
+"""
+
+from typing import Sequence, Union
+
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision: str = "a2b25abf1c45"
+down_revision: Union[str, None] = "4929c553b31a"
+branch_labels: Union[str, Sequence[str], None] = None
+depends_on: Union[str, Sequence[str], None] = None
+
+
+def upgrade() -> None:
+    connection = op.get_bind()
+
+    # Labels used to be created with a select-then-insert, so concurrent requests
+    # could create the same label twice. Merge duplicates into the first row for
+    # each name before the unique index can be created.
+    duplicates = connection.execute(
+        sa.text(
+            "SELECT label.id, survivor.id FROM label "
+            "JOIN (SELECT name, MIN(id) AS id FROM label GROUP BY name) AS survivor "
+            "ON survivor.name = label.name AND survivor.id != label.id"
+        )
+    ).all()
+    for duplicate_id, survivor_id in duplicates:
+        parameters = {"duplicate_id": duplicate_id, "survivor_id": survivor_id}
+        connection.execute(
+            sa.text(
+                "UPDATE OR IGNORE task_label SET label_id = :survivor_id "
+                "WHERE label_id = :duplicate_id"
+            ),
+            parameters,
+        )
+        connection.execute(
+            sa.text("DELETE FROM task_label WHERE label_id = :duplicate_id"),
+            parameters,
+        )
+        connection.execute(
+            sa.text("DELETE FROM label WHERE id = :duplicate_id"), parameters
+        )
+
+    op.create_index(op.f("ix_label_name"), "label", ["name"], unique=True)
+
+
+def downgrade() -> None:
+    op.drop_index(op.f("ix_label_name"), table_name="label")
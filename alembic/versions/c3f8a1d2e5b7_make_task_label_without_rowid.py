@@ -0,0 +1,58 @@
+"""Make task_label a WITHOUT ROWID table
+
+Revision ID: c3f8a1d2e5b7
+Revises: 9e51c0d7a3f2
+Create Date: 2024-06-12 18:40:27.519204
+
+"""
+
+from typing import Sequence, Union
+
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision: str = "c3f8a1d2e5b7"
+down_revision: Union[str, None] = "9e51c0d7a3f2"
+branch_labels: Union[str, Sequence[str], None] = None
+depends_on: Union[str, Sequence[str], None] = None
+
+
+def recreate_task_label(with_rowid: bool) -> None:
+    # SQLite can't change whether a table has a rowid, so copy it into a new one
+    op.create_table(
+        "task_label_new",
+        sa.Column("task_id", sa.Uuid(), nullable=False),
+        sa.Column("label_id", sa.Uuid(), nullable=False),
+        sa.ForeignKeyConstraint(
+            ["label_id"],
+            ["label.id"],
+        ),
+        sa.ForeignKeyConstraint(
+            ["task_id"],
+            ["task.id"],
+        ),
+        sa.PrimaryKeyConstraint("task_id", "label_id"),
+        sqlite_with_rowid=with_rowid,
+    )
+    op.execute(
+        "INSERT INTO task_label_new (task_id, label_id) "
+        "SELECT task_id, label_id FROM task_label ORDER BY task_id, label_id"
+    )
+    op.drop_table("task_label")
+    op.rename_table("task_label_new", "task_label")
+    op.create_index(
+        "ix_task_label_label_id_task_id",
+        "task_label",
+        ["label_id", "task_id"],
+        unique=False,
+    )
+
+
+def upgrade() -> None:
+    recreate_task_label(with_rowid=False)
+
+
+def downgrade() -> None:
+    recreate_task_label(with_rowid=True)
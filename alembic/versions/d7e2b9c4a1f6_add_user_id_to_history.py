@@ -0,0 +1,60 @@
+"""Add user id to history
+
+Revision ID: d7e2b9c4a1f6
+Revises: c3f8a1d2e5b7
+Create Date: 2024-06-14 09:21:43.108652
+
+"""
+
+from typing import Sequence, Union
+
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision: str = "d7e2b9c4a1f6"
+down_revision: Union[str, None] = "c3f8a1d2e5b7"
+branch_labels: Union[str, Sequence[str], None] = None
+depends_on: Union[str, Sequence[str], None] = None
+
+BACKFILL_BATCH_SIZE = 10000
+
+
+def upgrade() -> None:
+    op.add_column("history", sa.Column("user_id", sa.Uuid(), nullable=True))
+
+    # The event is the deleted task's JSON, stored as a JSON string. Uuid columns
+    # are stored as hex without hyphens. Backfill a range of rowids at a time so
+    # each statement only touches a batch of rows however big the table is.
+    connection = op.get_bind()
+    last_rowid = connection.execute(sa.text("SELECT max(rowid) FROM history")).scalar()
+    for start in range(0, last_rowid or 0, BACKFILL_BATCH_SIZE):
+        connection.execute(
+            sa.text(
+                "UPDATE history SET user_id = replace("
+                "json_extract(json_extract(event, '$'), '$.user_id'), '-', '') "
+                "WHERE rowid > :start AND rowid <= :end"
+            ),
+            {"start": start, "end": start + BACKFILL_BATCH_SIZE},
+        )
+
+    with op.batch_alter_table("history") as batch_op:
+        batch_op.alter_column("user_id", existing_type=sa.Uuid(), nullable=False)
+        batch_op.drop_index("ix_history_entity_id_type_created_at")
+        batch_op.create_index(
+            "ix_history_user_id_entity_id_type_created_at",
+            ["user_id", "entity_id", "type", "created_at"],
+            unique=False,
+        )
+
+
+def downgrade() -> None:
+    with op.batch_alter_table("history") as batch_op:
+        batch_op.drop_index("ix_history_user_id_entity_id_type_created_at")
+        batch_op.create_index(
+            "ix_history_entity_id_type_created_at",
+            ["entity_id", "type", "created_at"],
+            unique=False,
+        )
+        batch_op.drop_column("user_id")
@@ -0,0 +1,97 @@
+"""Add task positions
+
+Revision ID: e4b8d1f7a9c2
+Revises: d7e2b9c4a1f6
+Create Date: 2024-06-16 15:02:37.904118
+
+"""
+
+from typing import Sequence, Union
+
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision: str = "e4b8d1f7a9c2"
+down_revision: Union[str, None] = "d7e2b9c4a1f6"
+branch_labels: Union[str, Sequence[str], None] = None
+depends_on: Union[str, Sequence[str], None] = None
+
+BACKFILL_BATCH_SIZE = 10000
+
+
+def drop_task_indexes() -> None:
+    # if_exists, as databases created before the sorting indexes were migrated in
+    # may be missing some of them
+    op.drop_index("ix_task_user_id_due_date", table_name="task", if_exists=True)
+    op.drop_index("ix_task_user_id_status", table_name="task", if_exists=True)
+    op.drop_index("ix_task_user_id_name", table_name="task", if_exists=True)
+
+
+def upgrade() -> None:
+    op.add_column("task", sa.Column("position", sa.Integer(), nullable=True))
+    op.add_column(
+        "tasks_version",
+        sa.Column("next_position", sa.Integer(), server_default="0", nullable=False),
+    )
+
+    # Cursors handed out so far hold rowids, so existing tasks keep theirs as their
+    # position and every user's new tasks are positioned after all of them
+    connection = op.get_bind()
+    last_rowid = connection.execute(sa.text("SELECT max(rowid) FROM task")).scalar()
+    for start in range(0, last_rowid or 0, BACKFILL_BATCH_SIZE):
+        connection.execute(
+            sa.text(
+                "UPDATE task SET position = rowid "
+                "WHERE rowid > :start AND rowid <= :end"
+            ),
+            {"start": start, "end": start + BACKFILL_BATCH_SIZE},
+        )
+    connection.execute(
+        sa.text("UPDATE tasks_version SET next_position = :next_position"),
+        {"next_position": (last_rowid or 0) + 1},
+    )
+
+    drop_task_indexes()
+    op.drop_index("ix_task_user_id", table_name="task")
+    with op.batch_alter_table("task") as batch_op:
+        batch_op.alter_column("position", existing_type=sa.Integer(), nullable=False)
+    op.create_index(
+        "ix_task_user_id_position", "task", ["user_id", "position"], unique=True
+    )
+    op.create_index(
+        "ix_task_user_id_name", "task", ["user_id", "name", "position"], unique=False
+    )
+    op.create_index(
+        "ix_task_user_id_status",
+        "task",
+        ["user_id", "status", "position"],
+        unique=False,
+    )
+    op.create_index(
+        "ix_task_user_id_due_date",
+        "task",
+        ["user_id", sa.text("coalesce(due_date, '9999-12-31')"), "position"],
+        unique=False,
+    )
+
+
+def downgrade() -> None:
+    drop_task_indexes()
+    op.drop_index("ix_task_user_id_position", table_name="task")
+    with op.batch_alter_table("task") as batch_op:
+        batch_op.drop_column("position")
+    with op.batch_alter_table("tasks_version") as batch_op:
+        batch_op.drop_column("next_position")
+    op.create_index("ix_task_user_id", "task", ["user_id"], unique=False)
+    op.create_index("ix_task_user_id_name", "task", ["user_id", "name"], unique=False)
+    op.create_index(
+        "ix_task_user_id_status", "task", ["user_id", "status"], unique=False
+    )
+    op.create_index(
+        "ix_task_user_id_due_date",
+        "task",
+        ["user_id", sa.text("coalesce(due_date, '9999-12-31')")],
+        unique=False,
+    )
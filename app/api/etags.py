@@ -0,0 +1,48 @@
+import re
+from datetime import date
+from typing import Optional
+
+from app.domain.models import TaskQuery
+
+# Versions start at 1, so no task is ever at this version
+NO_VERSION = 0
+
+VERSION_ETAG = re.compile(r'^"(\d+)"$')
+
+
+def task_etag(version: int) -> str:
+    return f'"{version}"'
+
+
+def tasks_etag(version: int, query: TaskQuery) -> str:
+    if query.overdue:
+        # Which tasks are overdue changes with the date as well as with writes
+        return f'"{version}-{date.today().isoformat()}"'
+    return f'"{version}"'
+
+
+def etag_matches(if_none_match: Optional[str], etag: str) -> bool:
+    """Whether an If-None-Match header matches the etag, using the weak comparison
+    If-None-Match is defined with."""
+    if if_none_match is None:
+        return False
+    for candidate in if_none_match.split(","):
+        candidate = candidate.strip()
+        if candidate == "*" or candidate.removeprefix("W/") == etag:
+            return True
+    return False
+
+
+def if_match_version(if_match: Optional[str]) -> Optional[int]:
+    """The task version an If-Match header requires, None if it allows any version.
+
+    Only a single strong task ETag can match. Anything else, like a weak ETag or
+    a list of them, is NO_VERSION so the write is refused rather than risk a lost
+    update.
+    """
+    if if_match is None or if_match.strip() == "*":
+        return None
+    match = VERSION_ETAG.match(if_match.strip())
+    if match is None:
+        return NO_VERSION
+    return int(match.group(1))
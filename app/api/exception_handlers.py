@@ -1,6 +1,6 @@
 from fastapi import Request, status
 from fastapi.responses import JSONResponse
-from app.domain.errors import TaskAlreadyExists
+from app.domain.errors import InvalidCursor, TaskAlreadyExists, TaskVersionMismatch
 
 
 def task_already_exists_exception_handler(
@@ -12,3 +12,26 @@ def task_already_exists_exception_handler(
             "detail": {"key": "task_already_exists", "message": "task already exists"}
         },
     )
+
+
+def invalid_cursor_exception_handler(
+    request: Request, exc: InvalidCursor
+) -> JSONResponse:
+    return JSONResponse(
+        status_code=status.HTTP_400_BAD_REQUEST,
+        content={"detail": {"key": "invalid_cursor", "message": "cursor is invalid"}},
+    )
+
+
+def task_version_mismatch_exception_handler(
+    request: Request, exc: TaskVersionMismatch
+) -> JSONResponse:
+    return JSONResponse(
+        status_code=status.HTTP_412_PRECONDITION_FAILED,
+        content={
+            "detail": {
+                "key": "task_version_mismatch",
+                "message": "task has changed since it was read",
+            }
+        },
+    )
@@ -1,6 +1,7 @@
 from fastapi import APIRouter
 
-from app.api.routes import tasks
+from app.api.routes import metrics, tasks
 
 api_router = APIRouter()
 api_router.include_router(tasks.router, prefix="/tasks", tags=["tasks"])
+api_router.include_router(metrics.router, tags=["metrics"])
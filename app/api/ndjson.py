@@ -0,0 +1,51 @@
+from typing import AsyncIterator, List, Optional, Tuple
+
+
+async def ndjson_lines(
+    chunks: AsyncIterator[bytes], max_line_length: int
+) -> AsyncIterator[Tuple[int, Optional[bytes]]]:
+    """Splits a stream of bytes into numbered NDJSON lines, as the bytes arrive.
+
+    Line numbers start at 1 and count blank lines, which are skipped, so they
+    match what an editor shows for the file. A line longer than max_line_length
+    bytes is dropped as it arrives and yielded as None, so a body without newlines
+    can't fill up memory.
+    """
+    line_number = 0
+    # The current line's bytes from earlier chunks, only the unsplit tail is kept
+    pending: List[bytes] = []
+    pending_length = 0
+    too_long = False
+    async for chunk in chunks:
+        start = 0
+        end = chunk.find(b"\n")
+        while end != -1:
+            line_number += 1
+            if too_long or pending_length + end - start > max_line_length:
+                yield line_number, None
+            else:
+                line = b"".join(pending) + chunk[start:end]
+                if line.strip():
+                    yield line_number, line
+            pending = []
+            pending_length = 0
+            too_long = False
+            start = end + 1
+            end = chunk.find(b"\n", start)
+
+        if too_long or start == len(chunk):
+            continue
+        if pending_length + len(chunk) - start > max_line_length:
+            too_long = True
+            pending = []
+            pending_length = 0
+        else:
+            pending.append(chunk[start:])
+            pending_length += len(chunk) - start
+
+    if too_long:
+        yield line_number + 1, None
+        return
+    line = b"".join(pending)
+    if line.strip():
+        yield line_number + 1, line
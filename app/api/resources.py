@@ -1,13 +1,19 @@
-from datetime import date
+from datetime import date, datetime
 from typing import Generic, List, Optional, Set, TypeVar
 from uuid import UUID
 
-from pydantic import BaseModel
+from pydantic import BaseModel, Field, model_validator
 
 from app.domain.models import TaskStatus
 
 M = TypeVar("M", bound=BaseModel)
 
+MAX_BATCH_SIZE = 1000
+# The most line errors an import reports, the rest are only counted
+MAX_IMPORT_ERRORS = 1000
+# The longest line an import reads, longer lines are reported and skipped
+MAX_IMPORT_LINE_LENGTH = 64 * 1024
+
 
 class StandardResponse(BaseModel, Generic[M]):
     """This allows for having the same response structure across all api endpoints"""
@@ -15,6 +21,36 @@ class StandardResponse(BaseModel, Generic[M]):
     data: M
 
 
+class PaginatedResponse(BaseModel, Generic[M]):
+    """The standard response for endpoints returning a page of resources. Pass
+    next_cursor back as the cursor query parameter to get the next page, it is
+    null on the last page."""
+
+    data: List[M]
+    next_cursor: Optional[str] = None
+
+
+class BatchError(BaseModel):
+    key: str
+    message: str
+
+
+class BatchItemResult(BaseModel, Generic[M]):
+    """The outcome of one item in a batch request, status is the status code the
+    item would have had as a single request."""
+
+    status: int
+    data: Optional[M] = None
+    error: Optional[BatchError] = None
+
+
+class BatchResponse(BaseModel, Generic[M]):
+    """The response for batch endpoints, with a result for each item in the same
+    order as the request."""
+
+    data: List[BatchItemResult[M]]
+
+
 class CreateTaskRequestBody(BaseModel):
     name: str
     status: TaskStatus = TaskStatus.PENDING
@@ -39,3 +75,45 @@ class TaskResource(BaseModel):
     labels: Set[str] = set()
     due_date: Optional[date] = None
     sub_tasks: List = []
+
+
+class BatchUpdateTaskRequestBody(UpdateTaskRequestBody):
+    id: UUID
+
+
+class BatchCreateTasksRequestBody(BaseModel):
+    tasks: List[CreateTaskRequestBody] = Field(max_length=MAX_BATCH_SIZE)
+
+
+class BatchUpdateTasksRequestBody(BaseModel):
+    tasks: List[BatchUpdateTaskRequestBody] = Field(max_length=MAX_BATCH_SIZE)
+
+
+class BatchDeleteTasksRequestBody(BaseModel):
+    task_ids: List[UUID] = Field(max_length=MAX_BATCH_SIZE)
+
+
+class BatchRestoreTasksRequestBody(BaseModel):
+    """Restores the deleted tasks with these ids, or every task deleted since
+    deleted_since. Given both, only the tasks matching both are restored."""
+
+    task_ids: Optional[List[UUID]] = Field(default=None, max_length=MAX_BATCH_SIZE)
+    deleted_since: Optional[datetime] = None
+
+    @model_validator(mode="after")
+    def check_filtered(self) -> "BatchRestoreTasksRequestBody":
+        if self.task_ids is None and self.deleted_since is None:
+            raise ValueError("one of task_ids or deleted_since is required")
+        return self
+
+
+class ImportLineError(BaseModel):
+    line: int
+    key: str
+    message: str
+
+
+class ImportResult(BaseModel):
+    imported: int
+    failed: int
+    errors: List[ImportLineError]
@@ -0,0 +1,21 @@
+from dependency_injector.wiring import inject, Provide
+from fastapi import APIRouter, Depends, HTTPException, Response, status
+
+from app.containers import Container
+from app.metrics import CONTENT_TYPE, Metrics
+
+router = APIRouter()
+
+
+@router.get("/metrics", include_in_schema=False)
+@inject
+async def get_metrics(
+    enabled: bool = Depends(Provide[Container.config.metrics.enabled]),
+    metrics: Metrics = Depends(Provide[Container.metrics]),
+) -> Response:
+    if not enabled:
+        raise HTTPException(
+            status_code=status.HTTP_404_NOT_FOUND,
+            detail={"key": "metrics_disabled", "message": "metrics are disabled"},
+        )
+    return Response(metrics.render(), media_type=CONTENT_TYPE)
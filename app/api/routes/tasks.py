@@ -1,21 +1,68 @@
+from datetime import date
 from uuid import UUID, uuid4
-from typing import List
+from typing import List, Optional
 
 from dependency_injector.wiring import inject, Provide
-from fastapi import APIRouter, Depends, status, HTTPException
+from pydantic import ValidationError
+from fastapi import (
+    APIRouter,
+    Depends,
+    Header,
+    HTTPException,
+    Query,
+    Request,
+    Response,
+    status,
+)
+from fastapi.responses import StreamingResponse
 
+from app.api.etags import etag_matches, if_match_version, task_etag, tasks_etag
+from app.api.ndjson import ndjson_lines
 from app.api.resources import (
+    BatchCreateTasksRequestBody,
+    BatchDeleteTasksRequestBody,
+    BatchItemResult,
+    BatchResponse,
+    BatchRestoreTasksRequestBody,
+    BatchUpdateTasksRequestBody,
     CreateTaskRequestBody,
+    ImportLineError,
+    ImportResult,
+    MAX_IMPORT_ERRORS,
+    MAX_IMPORT_LINE_LENGTH,
+    PaginatedResponse,
     StandardResponse,
     TaskResource,
     UpdateTaskRequestBody,
 )
+from app.api.serialization import (
+    TASK_ALREADY_EXISTS_ERROR,
+    TASK_NOT_FOUND_RESULT,
+    task_batch_response,
+    task_json,
+    task_page_response,
+    task_response,
+)
 from app.containers import Container
-from app.domain.task_managers import TaskManager
-from app.domain.models import CreateTask, UpdateTask
+from app.domain.async_task_managers import AsyncTaskManager
+from app.domain.models import (
+    CreateTask,
+    Task,
+    TaskQuery,
+    TaskSortField,
+    TaskStatus,
+    UpdateTask,
+)
+from app.domain.pagination import DEFAULT_PAGE_SIZE, MAX_PAGE_SIZE
 
 router = APIRouter()
 
+# Tasks per chunk of an export, so the response is written in a few large
+# chunks rather than a line at a time
+EXPORT_CHUNK_SIZE = 500
+# Tasks created per transaction by an import
+IMPORT_BATCH_SIZE = 5000
+
 
 @router.post(
     "",
@@ -23,34 +70,293 @@ router = APIRouter()
     status_code=status.HTTP_201_CREATED,
 )
 @inject
-def create_task(
+async def create_task(
     create_task_request_body: CreateTaskRequestBody,
-    task_manager: TaskManager = Depends(Provide[Container.task_manager]),
+    task_manager: AsyncTaskManager = Depends(Provide[Container.async_task_manager]),
     user_id: UUID = uuid4(),
-) -> StandardResponse[TaskResource]:
-    created_task = task_manager.create_task(
+) -> Response:
+    created_task = await task_manager.create_task(
         CreateTask(**create_task_request_body.model_dump(), user_id=user_id)
     )
-    response = StandardResponse[TaskResource](
-        data=TaskResource(**created_task.model_dump())
-    )
-    return response
+    return task_response(created_task, status_code=status.HTTP_201_CREATED)
 
 
 @router.get(
     "",
-    response_model=StandardResponse[List[TaskResource]],
+    response_model=PaginatedResponse[TaskResource],
+    status_code=status.HTTP_200_OK,
+)
+@inject
+async def get_tasks(
+    user_id: UUID,
+    limit: int = Query(default=DEFAULT_PAGE_SIZE, ge=1, le=MAX_PAGE_SIZE),
+    cursor: Optional[str] = None,
+    status: List[TaskStatus] = Query(default=[]),
+    labels_any: List[str] = Query(default=[]),
+    labels_all: List[str] = Query(default=[]),
+    due_after: Optional[date] = None,
+    due_before: Optional[date] = None,
+    overdue: bool = False,
+    sort: TaskSortField = TaskSortField.CREATED,
+    if_none_match: Optional[str] = Header(default=None),
+    task_manager: AsyncTaskManager = Depends(Provide[Container.async_task_manager]),
+) -> Response:
+    query = TaskQuery(
+        statuses=set(status),
+        labels_any=set(labels_any),
+        labels_all=set(labels_all),
+        due_after=due_after,
+        due_before=due_before,
+        overdue=overdue,
+        sort=sort,
+    )
+    # The ETag covers every page and query of the user's tasks, since the URL
+    # already distinguishes them
+    etag = tasks_etag(await task_manager.get_tasks_version(user_id), query)
+    if etag_matches(if_none_match, etag):
+        return Response(status_code=304, headers={"ETag": etag})
+
+    task_page = await task_manager.get_tasks_page(user_id, limit, cursor, query)
+    return task_page_response(task_page.tasks, task_page.next_cursor, etag)
+
+
+@router.get(
+    "/export",
+    response_class=StreamingResponse,
+    status_code=status.HTTP_200_OK,
+)
+@inject
+async def export_tasks(
+    user_id: UUID,
+    task_manager: AsyncTaskManager = Depends(Provide[Container.async_task_manager]),
+) -> StreamingResponse:
+    """All of the user's tasks as NDJSON, one task per line in the order they were
+    created. The tasks are streamed, so memory stays constant however many there
+    are."""
+
+    async def lines():
+        chunk = []
+        async for task in task_manager.iter_tasks(user_id):
+            chunk.append(task_json(task))
+            if len(chunk) == EXPORT_CHUNK_SIZE:
+                yield b"\n".join(chunk) + b"\n"
+                chunk = []
+        if chunk:
+            yield b"\n".join(chunk) + b"\n"
+
+    return StreamingResponse(lines(), media_type="application/x-ndjson")
+
+
+@router.post(
+    "/import",
+    response_model=StandardResponse[ImportResult],
+    status_code=status.HTTP_200_OK,
+)
+@inject
+async def import_tasks(
+    user_id: UUID,
+    request: Request,
+    task_manager: AsyncTaskManager = Depends(Provide[Container.async_task_manager]),
+) -> StandardResponse[ImportResult]:
+    """Creates a task for each line of an NDJSON request body, each line being a
+    create task request body.
+
+    The body is read as it arrives and the tasks are created in batches, each in
+    its own transaction. Invalid lines, and lines over MAX_IMPORT_LINE_LENGTH
+    bytes, are reported and skipped, they don't stop the rest of the import.
+    """
+    imported = 0
+    failed = 0
+    errors: List[ImportLineError] = []
+    batch: List[CreateTask] = []
+
+    async for line_number, line in ndjson_lines(
+        request.stream(), MAX_IMPORT_LINE_LENGTH
+    ):
+        if line is None:
+            failed += 1
+            if len(errors) < MAX_IMPORT_ERRORS:
+                errors.append(
+                    ImportLineError(
+                        line=line_number,
+                        key="line_too_long",
+                        message=f"Lines can be at most {MAX_IMPORT_LINE_LENGTH} bytes",
+                    )
+                )
+            continue
+        try:
+            create_task_request_body = CreateTaskRequestBody.model_validate_json(line)
+        except ValidationError as exc:
+            failed += 1
+            if len(errors) < MAX_IMPORT_ERRORS:
+                error = exc.errors(include_url=False)[0]
+                location = ".".join(str(part) for part in error["loc"])
+                errors.append(
+                    ImportLineError(
+                        line=line_number,
+                        key="invalid_task",
+                        message=(
+                            f"{location}: {error['msg']}" if location else error["msg"]
+                        ),
+                    )
+                )
+            continue
+
+        # The line was just validated, so skip validating it again
+        batch.append(
+            CreateTask.model_construct(
+                **dict(create_task_request_body), user_id=user_id
+            )
+        )
+        if len(batch) == IMPORT_BATCH_SIZE:
+            imported += len(await task_manager.create_tasks(batch))
+            batch = []
+
+    if batch:
+        imported += len(await task_manager.create_tasks(batch))
+
+    return StandardResponse[ImportResult](
+        data=ImportResult(imported=imported, failed=failed, errors=errors)
+    )
+
+
+@router.post(
+    "/batch/create",
+    response_model=BatchResponse[TaskResource],
     status_code=status.HTTP_200_OK,
 )
 @inject
-def get_tasks(
+async def create_tasks(
+    batch_create_tasks_request_body: BatchCreateTasksRequestBody,
+    task_manager: AsyncTaskManager = Depends(Provide[Container.async_task_manager]),
+    user_id: UUID = uuid4(),
+) -> Response:
+    created_tasks = await task_manager.create_tasks(
+        [
+            CreateTask(**create_task_request_body.model_dump(), user_id=user_id)
+            for create_task_request_body in batch_create_tasks_request_body.tasks
+        ]
+    )
+    return task_batch_response(
+        [
+            BatchItemResult[Task].model_construct(
+                status=status.HTTP_201_CREATED, data=task
+            )
+            for task in created_tasks
+        ]
+    )
+
+
+@router.post(
+    "/batch/update",
+    response_model=BatchResponse[TaskResource],
+    status_code=status.HTTP_200_OK,
+)
+@inject
+async def update_tasks(
+    user_id: UUID,
+    batch_update_tasks_request_body: BatchUpdateTasksRequestBody,
+    task_manager: AsyncTaskManager = Depends(Provide[Container.async_task_manager]),
+) -> Response:
+    updated_tasks = await task_manager.update_tasks(
+        [
+            UpdateTask(**update_task_request_body.model_dump())
+            for update_task_request_body in batch_update_tasks_request_body.tasks
+        ],
+        user_id,
+    )
+    return task_batch_response(
+        [
+            (
+                BatchItemResult[Task].model_construct(
+                    status=status.HTTP_200_OK, data=task
+                )
+                if task is not None
+                else TASK_NOT_FOUND_RESULT
+            )
+            for task in updated_tasks
+        ]
+    )
+
+
+@router.post(
+    "/batch/delete",
+    response_model=BatchResponse[TaskResource],
+    status_code=status.HTTP_200_OK,
+)
+@inject
+async def delete_tasks(
     user_id: UUID,
-    task_manager: TaskManager = Depends(Provide[Container.task_manager]),
-) -> StandardResponse[List[TaskResource]]:
-    tasks = task_manager.get_tasks(user_id)
-    return StandardResponse[List[TaskResource]](
-        data=[TaskResource(**task.model_dump()) for task in tasks]
+    batch_delete_tasks_request_body: BatchDeleteTasksRequestBody,
+    task_manager: AsyncTaskManager = Depends(Provide[Container.async_task_manager]),
+) -> Response:
+    deleted_tasks = await task_manager.delete_tasks(
+        batch_delete_tasks_request_body.task_ids, user_id
     )
+    return task_batch_response(
+        [
+            (
+                BatchItemResult[Task].model_construct(status=status.HTTP_204_NO_CONTENT)
+                if task is not None
+                else TASK_NOT_FOUND_RESULT
+            )
+            for task in deleted_tasks
+        ]
+    )
+
+
+@router.post(
+    "/batch/restore",
+    response_model=BatchResponse[TaskResource],
+    status_code=status.HTTP_200_OK,
+)
+@inject
+async def restore_tasks(
+    user_id: UUID,
+    batch_restore_tasks_request_body: BatchRestoreTasksRequestBody,
+    task_manager: AsyncTaskManager = Depends(Provide[Container.async_task_manager]),
+) -> Response:
+    """Restores every task at once. Given task_ids, there is a result for each id
+    in the same order. Otherwise there is one for each task deleted since
+    deleted_since, the restored tasks first and then the conflicts, each in the
+    order they were deleted."""
+    deleted_since = batch_restore_tasks_request_body.deleted_since
+    if deleted_since is not None and deleted_since.tzinfo is not None:
+        # History entries are created with naive local times
+        deleted_since = deleted_since.astimezone().replace(tzinfo=None)
+
+    restored_tasks = await task_manager.restore_tasks(
+        user_id, batch_restore_tasks_request_body.task_ids, deleted_since
+    )
+    restored = {task.id: task for task in restored_tasks.restored}
+    conflicts = {task.id: task for task in restored_tasks.conflicts}
+
+    task_ids = batch_restore_tasks_request_body.task_ids
+    if task_ids is None:
+        task_ids = [*restored, *conflicts]
+    results = []
+    for task_id in task_ids:
+        task = restored.pop(task_id, None)
+        if task is not None:
+            # Like restoring one at a time, the id conflicts if it is given again
+            conflicts[task_id] = task
+            results.append(
+                BatchItemResult[Task].model_construct(
+                    status=status.HTTP_200_OK, data=task
+                )
+            )
+        elif task_id in conflicts:
+            # The task as it was deleted, for comparing with the one that exists
+            results.append(
+                BatchItemResult[Task].model_construct(
+                    status=status.HTTP_400_BAD_REQUEST,
+                    data=conflicts[task_id],
+                    error=TASK_ALREADY_EXISTS_ERROR,
+                )
+            )
+        else:
+            results.append(TASK_NOT_FOUND_RESULT)
+    return task_batch_response(results)
 
 
 @router.get(
@@ -59,18 +365,33 @@ def get_tasks(
     status_code=status.HTTP_200_OK,
 )
 @inject
-def get_task(
+async def get_task(
     task_id: UUID,
     user_id: UUID,
-    task_manager: TaskManager = Depends(Provide[Container.task_manager]),
-) -> StandardResponse[TaskResource]:
-    task = task_manager.get_task(task_id, user_id)
+    if_none_match: Optional[str] = Header(default=None),
+    task_manager: AsyncTaskManager = Depends(Provide[Container.async_task_manager]),
+) -> Response:
+    # The version is read before the task. If a write lands in between, the ETag
+    # is older than the body and the client's next request gets the body again,
+    # rather than a 304 for a body it never got.
+    version = await task_manager.get_task_version(task_id, user_id)
+    if version is None:
+        raise HTTPException(
+            status_code=status.HTTP_404_NOT_FOUND,
+            detail={"key": "task_not_found", "message": "task not found"},
+        )
+
+    etag = task_etag(version)
+    if etag_matches(if_none_match, etag):
+        return Response(status_code=304, headers={"ETag": etag})
+
+    task = await task_manager.get_task(task_id, user_id)
     if task is None:
         raise HTTPException(
             status_code=status.HTTP_404_NOT_FOUND,
             detail={"key": "task_not_found", "message": "task not found"},
         )
-    return StandardResponse[TaskResource](data=TaskResource(**task.model_dump()))
+    return task_response(task, etag=etag)
 
 
 @router.put(
@@ -79,12 +400,13 @@ def get_task(
     status_code=status.HTTP_200_OK,
 )
 @inject
-def update_task(
+async def update_task(
     task_id: UUID,
     user_id: UUID,
     update_task_request_body: UpdateTaskRequestBody,
-    task_manager: TaskManager = Depends(Provide[Container.task_manager]),
-) -> StandardResponse[TaskResource]:
+    if_match: Optional[str] = Header(default=None),
+    task_manager: AsyncTaskManager = Depends(Provide[Container.async_task_manager]),
+) -> Response:
 
     if (
         task_id != update_task_request_body.id
@@ -98,17 +420,20 @@ def update_task(
             },
         )
 
-    task = task_manager.update_task(
+    versioned_task = await task_manager.update_task(
         UpdateTask(**{**update_task_request_body.model_dump(), "id": task_id}),
         user_id,
+        if_match_version(if_match),
     )
 
-    if task is None:
+    if versioned_task is None:
         raise HTTPException(
             status_code=status.HTTP_404_NOT_FOUND,
             detail={"key": "task_not_found", "message": "task not found"},
         )
-    return StandardResponse[TaskResource](data=TaskResource(**task.model_dump()))
+
+    # The version this write stored, so the client can send it as its next If-Match
+    return task_response(versioned_task.task, etag=task_etag(versioned_task.version))
 
 
 @router.delete(
@@ -116,13 +441,14 @@ def update_task(
     status_code=status.HTTP_204_NO_CONTENT,
 )
 @inject
-def delete_task(
+async def delete_task(
     task_id: UUID,
     user_id: UUID,
-    task_manager: TaskManager = Depends(Provide[Container.task_manager]),
+    if_match: Optional[str] = Header(default=None),
+    task_manager: AsyncTaskManager = Depends(Provide[Container.async_task_manager]),
 ) -> None:
 
-    task = task_manager.delete_task(task_id, user_id)
+    task = await task_manager.delete_task(task_id, user_id, if_match_version(if_match))
 
     if task is None:
         raise HTTPException(
@@ -137,13 +463,13 @@ def delete_task(
     status_code=status.HTTP_200_OK,
 )
 @inject
-def restore_task(
+async def restore_task(
     task_id: UUID,
     user_id: UUID,
-    task_manager: TaskManager = Depends(Provide[Container.task_manager]),
-) -> StandardResponse[TaskResource]:
+    task_manager: AsyncTaskManager = Depends(Provide[Container.async_task_manager]),
+) -> Response:
 
-    task = task_manager.restore_task(task_id, user_id)
+    task = await task_manager.restore_task(task_id, user_id)
 
     if task is None:
         raise HTTPException(
@@ -151,4 +477,4 @@ def restore_task(
             detail={"key": "task_not_found", "message": "task not found"},
         )
 
-    return StandardResponse[TaskResource](data=TaskResource(**task.model_dump()))
+    return task_response(task)
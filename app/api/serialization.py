@@ -0,0 +1,85 @@
+from typing import List, Optional
+
+from fastapi import Response, status
+from pydantic import TypeAdapter
+
+from app.api.resources import (
+    BatchError,
+    BatchItemResult,
+    BatchResponse,
+    PaginatedResponse,
+    StandardResponse,
+)
+from app.domain.models import Task
+
+# The task fields a TaskResource doesn't have. The fields left are in the same
+# order as TaskResource's, so a task dumped without them is the TaskResource JSON.
+TASK_RESOURCE_EXCLUDE = {"user_id"}
+
+TASK_ADAPTER = TypeAdapter(Task)
+TASK_RESPONSE_ADAPTER = TypeAdapter(StandardResponse[Task])
+TASK_PAGE_RESPONSE_ADAPTER = TypeAdapter(PaginatedResponse[Task])
+TASK_BATCH_RESPONSE_ADAPTER = TypeAdapter(BatchResponse[Task])
+
+TASK_NOT_FOUND_RESULT = BatchItemResult[Task](
+    status=status.HTTP_404_NOT_FOUND,
+    error=BatchError(key="task_not_found", message="task not found"),
+)
+TASK_ALREADY_EXISTS_ERROR = BatchError(
+    key="task_already_exists", message="task already exists"
+)
+
+
+class JSONBytesResponse(Response):
+    """A response for content that is already serialized JSON."""
+
+    media_type = "application/json"
+
+
+def task_json(task: Task) -> bytes:
+    return TASK_ADAPTER.dump_json(task, exclude=TASK_RESOURCE_EXCLUDE)
+
+
+def task_response(
+    task: Task, status_code: int = status.HTTP_200_OK, etag: Optional[str] = None
+) -> JSONBytesResponse:
+    """The StandardResponse[TaskResource] JSON for a task.
+
+    Returning a Response skips FastAPI validating the body against the route's
+    response_model and serializing it again, and the task is dumped straight to
+    JSON rather than converted to a TaskResource first. The bytes are the same as
+    FastAPI's, the response_model is still what the OpenAPI schema shows.
+    """
+    return JSONBytesResponse(
+        TASK_RESPONSE_ADAPTER.dump_json(
+            StandardResponse[Task].model_construct(data=task),
+            exclude={"data": TASK_RESOURCE_EXCLUDE},
+        ),
+        status_code=status_code,
+        headers=None if etag is None else {"ETag": etag},
+    )
+
+
+def task_page_response(
+    tasks: List[Task], next_cursor: Optional[str], etag: str
+) -> JSONBytesResponse:
+    """The PaginatedResponse[TaskResource] JSON for a page of tasks."""
+    return JSONBytesResponse(
+        TASK_PAGE_RESPONSE_ADAPTER.dump_json(
+            PaginatedResponse[Task].model_construct(
+                data=tasks, next_cursor=next_cursor
+            ),
+            exclude={"data": {"__all__": TASK_RESOURCE_EXCLUDE}},
+        ),
+        headers={"ETag": etag},
+    )
+
+
+def task_batch_response(results: List[BatchItemResult[Task]]) -> JSONBytesResponse:
+    """The BatchResponse[TaskResource] JSON for the results of a batch."""
+    return JSONBytesResponse(
+        TASK_BATCH_RESPONSE_ADAPTER.dump_json(
+            BatchResponse[Task].model_construct(data=results),
+            exclude={"data": {"__all__": {"data": TASK_RESOURCE_EXCLUDE}}},
+        )
+    )
@@ -1,23 +1,200 @@
+from typing import List
+
 from dependency_injector import containers, providers
 
+from app.domain.async_task_managers import (
+    AsyncInMemoryTaskManager,
+    AsyncSqliteTaskManager,
+)
+from app.domain.caching_task_managers import (
+    AsyncCachingTaskManager,
+    CachingTaskManager,
+    TaskCache,
+)
+from app.domain.durable_task_managers import (
+    AsyncDurableInMemoryTaskManager,
+    DurableInMemoryTaskManager,
+)
+from app.domain.history_archive import HistoryCompactor, HistoryRetention
+from app.domain.instrumented_task_managers import instrument_task_manager
+from app.domain.sharded_task_managers import (
+    AsyncShardedTaskManager,
+    ShardedTaskManager,
+)
 from app.domain.task_managers import InMemoryTaskManager, SqliteTaskManager
-from app.database import Database
+from app.database import (
+    AsyncDatabase,
+    create_archive_database,
+    create_async_archive_database,
+    create_async_shard_databases,
+    create_shard_databases,
+    Database,
+)
+from app.metrics import Metrics
+
+
+def sqlite_shards(databases: List[Database]) -> List[SqliteTaskManager]:
+    return [
+        SqliteTaskManager(session_factory=database.session) for database in databases
+    ]
+
+
+def async_sqlite_shards(
+    databases: List[AsyncDatabase],
+) -> List[AsyncSqliteTaskManager]:
+    return [
+        AsyncSqliteTaskManager(session_factory=database.session)
+        for database in databases
+    ]
 
 
 class Container(containers.DeclarativeContainer):
-    wiring_config = containers.WiringConfiguration(modules=["app.api.routes.tasks"])
+    wiring_config = containers.WiringConfiguration(
+        modules=["app.api.routes.metrics", "app.api.routes.tasks"]
+    )
 
     config = providers.Configuration(yaml_files=["config.yaml"])
 
-    db = providers.Singleton(Database, db_url=config.db.url)
+    db = providers.Singleton(
+        Database,
+        db_url=config.db.url,
+        echo=config.db.echo,
+        pragmas=config.db.pragmas,
+        pool_size=config.db.pool_size,
+        max_overflow=config.db.max_overflow,
+        slow_query_seconds=config.db.slow_query_seconds,
+    )
+    async_db = providers.Singleton(
+        AsyncDatabase,
+        db_url=config.db.url,
+        echo=config.db.echo,
+        pragmas=config.db.pragmas,
+        pool_size=config.db.pool_size,
+        max_overflow=config.db.max_overflow,
+        slow_query_seconds=config.db.slow_query_seconds,
+    )
+    archive_db = providers.Singleton(
+        create_archive_database,
+        db_url=config.history.archive.url,
+        echo=config.db.echo,
+        pragmas=config.db.pragmas,
+        slow_query_seconds=config.db.slow_query_seconds,
+    )
+
+    async_archive_db = providers.Singleton(
+        create_async_archive_database,
+        db_url=config.history.archive.url,
+        echo=config.db.echo,
+        pragmas=config.db.pragmas,
+        slow_query_seconds=config.db.slow_query_seconds,
+    )
+
+    # Each shard has its own engine and pool, and so its own write lock
+    shard_dbs = providers.Singleton(
+        create_shard_databases,
+        db_urls=config.shards.urls,
+        echo=config.db.echo,
+        pragmas=config.db.pragmas,
+        pool_size=config.db.pool_size,
+        max_overflow=config.db.max_overflow,
+        slow_query_seconds=config.db.slow_query_seconds,
+    )
+    async_shard_dbs = providers.Singleton(
+        create_async_shard_databases,
+        db_urls=config.shards.urls,
+        echo=config.db.echo,
+        pragmas=config.db.pragmas,
+        pool_size=config.db.pool_size,
+        max_overflow=config.db.max_overflow,
+        slow_query_seconds=config.db.slow_query_seconds,
+    )
 
     in_memory_task_manager = providers.Singleton(InMemoryTaskManager)
+    durable_in_memory_task_manager = providers.Singleton(
+        DurableInMemoryTaskManager,
+        directory=config.durable.directory,
+        snapshot_every=config.durable.snapshot_every,
+    )
     sqlite_task_manager = providers.Singleton(
-        SqliteTaskManager, session_factory=db.provided.session
+        SqliteTaskManager,
+        session_factory=db.provided.session,
+        archive_session_factory=archive_db.provided.session,
+    )
+
+    sharded_sqlite_task_manager = providers.Singleton(
+        ShardedTaskManager, shards=providers.Singleton(sqlite_shards, shard_dbs)
+    )
+
+    history_retention = providers.Singleton(
+        HistoryRetention,
+        max_age=config.history.retention.max_age,
+        max_entries_per_entity=config.history.retention.max_entries_per_entity,
+    )
+    history_compactor = providers.Singleton(
+        HistoryCompactor,
+        session_factory=db.provided.session,
+        archive_session_factory=archive_db.provided.session,
+        retention=history_retention,
+        batch_size=config.history.compaction.batch_size,
+    )
+
+    # The cache is shared by the sync and async caching task managers, so a write
+    # through either invalidates the reads of both
+    task_cache = providers.Singleton(
+        TaskCache, max_size=config.cache.max_size, ttl=config.cache.ttl
+    )
+    cached_sqlite_task_manager = providers.Singleton(
+        CachingTaskManager, task_manager=sqlite_task_manager, cache=task_cache
     )
 
     task_manager = providers.Selector(
         config.task_manager.type,
         in_memory=in_memory_task_manager,
+        durable_in_memory=durable_in_memory_task_manager,
         sqlite=sqlite_task_manager,
+        cached_sqlite=cached_sqlite_task_manager,
+        sharded_sqlite=sharded_sqlite_task_manager,
+    )
+
+    # The api routes use the async task managers. They share their storage with
+    # the sync task managers above, so both see the same tasks.
+    async_in_memory_task_manager = providers.Singleton(
+        AsyncInMemoryTaskManager, task_manager=in_memory_task_manager
+    )
+    async_durable_in_memory_task_manager = providers.Singleton(
+        AsyncDurableInMemoryTaskManager, task_manager=durable_in_memory_task_manager
+    )
+    async_sqlite_task_manager = providers.Singleton(
+        AsyncSqliteTaskManager,
+        session_factory=async_db.provided.session,
+        archive_session_factory=async_archive_db.provided.sync_session,
+    )
+
+    async_sharded_sqlite_task_manager = providers.Singleton(
+        AsyncShardedTaskManager,
+        shards=providers.Singleton(async_sqlite_shards, async_shard_dbs),
+    )
+
+    async_cached_sqlite_task_manager = providers.Singleton(
+        AsyncCachingTaskManager,
+        task_manager=async_sqlite_task_manager,
+        cache=task_cache,
+    )
+
+    selected_async_task_manager = providers.Selector(
+        config.task_manager.type,
+        in_memory=async_in_memory_task_manager,
+        durable_in_memory=async_durable_in_memory_task_manager,
+        sqlite=async_sqlite_task_manager,
+        cached_sqlite=async_cached_sqlite_task_manager,
+        sharded_sqlite=async_sharded_sqlite_task_manager,
+    )
+
+    metrics = providers.Singleton(Metrics)
+    async_task_manager = providers.Singleton(
+        instrument_task_manager,
+        task_manager=selected_async_task_manager,
+        metrics=metrics,
+        enabled=config.metrics.enabled,
+        name=config.task_manager.type,
     )
@@ -1,22 +1,213 @@
-from contextlib import contextmanager, AbstractContextManager
-from typing import Callable
+import logging
+import os
+import time
+from contextlib import (
+    asynccontextmanager,
+    contextmanager,
+    AbstractAsyncContextManager,
+    AbstractContextManager,
+)
+from contextvars import ContextVar
+from typing import Any, Callable, Dict, Iterator, List, Optional
 
-from sqlalchemy import create_engine, orm
+from alembic import command
+from alembic.config import Config as AlembicConfig
+from sqlalchemy import (
+    AsyncAdaptedQueuePool,
+    Engine,
+    create_engine,
+    event,
+    make_url,
+    orm,
+    Table,
+)
+from sqlalchemy.ext.asyncio import (
+    AsyncEngine,
+    AsyncSession,
+    async_sessionmaker,
+    create_async_engine,
+)
 from sqlalchemy.orm import Session
 
+from app.entities import Base, HistoryEntity
+
+logger = logging.getLogger(__name__)
+
+ALEMBIC_DIR = os.path.join(
+    os.path.dirname(os.path.dirname(os.path.abspath(__file__))), "alembic"
+)
+
+# Applied to every new sqlite connection, in this order. journal_mode has to come
+# first since it can't be changed while a transaction is open.
+DEFAULT_PRAGMAS: Dict[str, Any] = {
+    # Readers don't block writers, and writers don't block readers
+    "journal_mode": "WAL",
+    # In WAL mode NORMAL is still durable against application crashes, it only
+    # skips the fsync on every commit
+    "synchronous": "NORMAL",
+    # Wait for the write lock instead of failing straight away with "database is locked"
+    "busy_timeout": 5000,
+    # Negative values are in KiB, so this is a 64MiB page cache per connection
+    "cache_size": -64000,
+    "mmap_size": 256 * 1024 * 1024,
+    "temp_store": "MEMORY",
+    "foreign_keys": "ON",
+}
+
+
+def is_file_database(db_url: str) -> bool:
+    return make_url(db_url).database not in (None, "", ":memory:")
+
+
+def pool_options(
+    db_url: str, pool_size: Optional[int], max_overflow: Optional[int]
+) -> Dict[str, Any]:
+    options: Dict[str, Any] = {}
+    # In memory databases use a single connection per thread, so there is no
+    # pool to size
+    if is_file_database(db_url):
+        if pool_size is not None:
+            options["pool_size"] = pool_size
+        if max_overflow is not None:
+            options["max_overflow"] = max_overflow
+    return options
+
+
+def set_pragmas(engine: Engine, pragmas: Dict[str, Any]) -> None:
+    @event.listens_for(engine, "connect")
+    def connect(dbapi_connection, connection_record) -> None:
+        cursor = dbapi_connection.cursor()
+        for name, value in pragmas.items():
+            cursor.execute(f"PRAGMA {name} = {value}")
+        cursor.close()
+
+
+class QueryStats:
+    """The statements run while recording queries, see record_queries."""
+
+    def __init__(self, statements: Optional[List[str]] = None) -> None:
+        self.count = 0
+        self.seconds = 0.0
+        self.slowest_seconds = 0.0
+        self.slowest_statement: Optional[str] = None
+        # Only kept when a list is passed, for tests to show what ran
+        self.statements = statements
+
+    def add(self, statement: str, seconds: float) -> None:
+        self.count += 1
+        self.seconds += seconds
+        if seconds > self.slowest_seconds:
+            self.slowest_seconds = seconds
+            self.slowest_statement = statement
+        if self.statements is not None:
+            self.statements.append(statement)
+
+
+# Set per request by QueryTimingMiddleware. Async sessions run their statements in
+# a greenlet that shares the request's context, and asyncio.to_thread copies it, so
+# every database's statements are counted against the request that ran them.
+query_stats: ContextVar[Optional[QueryStats]] = ContextVar("query_stats", default=None)
+
+
+@contextmanager
+def record_queries(stats: Optional[QueryStats] = None) -> Iterator[QueryStats]:
+    """Counts and times the statements run by any Database within the block."""
+    if stats is None:
+        stats = QueryStats()
+    token = query_stats.set(stats)
+    try:
+        yield stats
+    finally:
+        query_stats.reset(token)
+
+
+def explain_query_plan(
+    cursor: Any, statement: str, parameters: Any, executemany: bool
+) -> List[str]:
+    if executemany:
+        parameters = parameters[0] if parameters else ()
+    cursor.execute(f"EXPLAIN QUERY PLAN {statement}", parameters)
+    return [row[3] for row in cursor.fetchall()]
+
+
+def time_queries(engine: Engine, slow_query_seconds: Optional[float] = None) -> None:
+    """Adds each statement to the QueryStats being recorded, and logs the ones
+    taking slow_query_seconds or longer with their query plan."""
+
+    @event.listens_for(engine, "before_cursor_execute")
+    def before_cursor_execute(
+        conn, cursor, statement, parameters, context, executemany
+    ) -> None:
+        conn.info.setdefault("query_start", []).append(time.perf_counter())
+
+    @event.listens_for(engine, "after_cursor_execute")
+    def after_cursor_execute(
+        conn, cursor, statement, parameters, context, executemany
+    ) -> None:
+        seconds = time.perf_counter() - conn.info["query_start"].pop()
+        stats = query_stats.get()
+        if stats is not None:
+            stats.add(statement, seconds)
+        if slow_query_seconds is None or seconds < slow_query_seconds:
+            return
+        plan: List[str] = []
+        if statement.lstrip()[:6].upper() in ("SELECT", "INSERT", "UPDATE", "DELETE"):
+            # A cursor of its own, the statement's rows haven't been fetched yet
+            plan_cursor = conn.connection.cursor()
+            try:
+                plan = explain_query_plan(
+                    plan_cursor, statement, parameters, executemany
+                )
+            except Exception:
+                logger.exception("Couldn't explain slow query")
+            finally:
+                plan_cursor.close()
+        logger.warning(
+            "Slow query took %.1fms: %s\nQuery plan:\n%s",
+            seconds * 1000,
+            statement,
+            "\n".join(plan),
+        )
+
 
 class Database:
 
-    def __init__(self, db_url: str) -> None:
-        self._engine = create_engine(db_url, echo=True)
+    def __init__(
+        self,
+        db_url: str,
+        echo: bool = False,
+        pragmas: Optional[Dict[str, Any]] = None,
+        pool_size: Optional[int] = None,
+        max_overflow: Optional[int] = None,
+        slow_query_seconds: Optional[float] = None,
+    ) -> None:
+        if pragmas is None:
+            pragmas = DEFAULT_PRAGMAS
+
+        self._engine = create_engine(
+            db_url, echo=bool(echo), **pool_options(db_url, pool_size, max_overflow)
+        )
+        set_pragmas(self._engine, pragmas)
+        time_queries(self._engine, slow_query_seconds)
+        # A class of its own, so session events can be listened to for this
+        # database only, see app.metrics
+        self.session_class = type("DatabaseSession", (Session,), {})
         self._session_factory = orm.scoped_session(
             orm.sessionmaker(
+                class_=self.session_class,
                 autocommit=False,
                 autoflush=False,
                 bind=self._engine,
             ),
         )
 
+    @property
+    def engine(self) -> Engine:
+        return self._engine
+
+    def create_database(self, tables: Optional[List[Table]] = None) -> None:
+        Base.metadata.create_all(self._engine, tables=tables)
+
     @contextmanager
     def session(self) -> Callable[..., AbstractContextManager[Session]]:
         session: Session = self._session_factory()
@@ -27,3 +218,153 @@ class Database:
             raise
         finally:
             session.close()
+
+
+def create_archive_database(
+    db_url: str,
+    echo: bool = False,
+    pragmas: Optional[Dict[str, Any]] = None,
+    slow_query_seconds: Optional[float] = None,
+) -> Database:
+    """The database history entries are archived to, see HistoryCompactor.
+
+    It only has the history table, which is created here rather than by a
+    migration.
+    """
+    database = Database(
+        db_url=db_url,
+        echo=echo,
+        pragmas=pragmas,
+        slow_query_seconds=slow_query_seconds,
+    )
+    database.create_database(tables=[HistoryEntity.__table__])
+    return database
+
+
+def create_shard_databases(
+    db_urls: List[str],
+    echo: bool = False,
+    pragmas: Optional[Dict[str, Any]] = None,
+    pool_size: Optional[int] = None,
+    max_overflow: Optional[int] = None,
+    slow_query_seconds: Optional[float] = None,
+) -> List[Database]:
+    """A database for each of ShardedTaskManager's shards, in shard order."""
+    return [
+        Database(db_url, echo, pragmas, pool_size, max_overflow, slow_query_seconds)
+        for db_url in db_urls
+    ]
+
+
+def upgrade_database(db_url: str) -> None:
+    """Runs the migrations on the database, the same as alembic upgrade head.
+
+    The alembic.ini logging config isn't loaded, so this doesn't reconfigure the
+    logging of the process calling it.
+    """
+    config = AlembicConfig()
+    config.set_main_option("script_location", ALEMBIC_DIR)
+    config.set_main_option("sqlalchemy.url", db_url)
+    command.upgrade(config, "head")
+
+
+class AsyncDatabase:
+    """The asyncio counterpart of Database, connecting to the same sqlite file
+    through aiosqlite."""
+
+    def __init__(
+        self,
+        db_url: str,
+        echo: bool = False,
+        pragmas: Optional[Dict[str, Any]] = None,
+        pool_size: Optional[int] = None,
+        max_overflow: Optional[int] = None,
+        slow_query_seconds: Optional[float] = None,
+    ) -> None:
+        if pragmas is None:
+            pragmas = DEFAULT_PRAGMAS
+
+        db_url = (
+            make_url(db_url)
+            .set(drivername="sqlite+aiosqlite")
+            .render_as_string(hide_password=False)
+        )
+        engine_options = pool_options(db_url, pool_size, max_overflow)
+        if engine_options:
+            # aiosqlite defaults to opening a new connection for every session
+            engine_options["poolclass"] = AsyncAdaptedQueuePool
+
+        self._engine = create_async_engine(db_url, echo=bool(echo), **engine_options)
+        set_pragmas(self._engine.sync_engine, pragmas)
+        time_queries(self._engine.sync_engine, slow_query_seconds)
+        # The sync sessions the async ones run on, see Database
+        self.session_class = type("DatabaseSession", (Session,), {})
+        self._session_factory = async_sessionmaker(
+            sync_session_class=self.session_class,
+            autoflush=False,
+            bind=self._engine,
+        )
+
+    @property
+    def engine(self) -> AsyncEngine:
+        return self._engine
+
+    @asynccontextmanager
+    async def session(self) -> Callable[..., AbstractAsyncContextManager[AsyncSession]]:
+        session: AsyncSession = self._session_factory()
+        try:
+            yield session
+        except Exception:
+            await session.rollback()
+            raise
+        finally:
+            await session.close()
+
+    @contextmanager
+    def sync_session(self) -> Callable[..., AbstractContextManager[Session]]:
+        """A sync session on the aiosqlite engine, only usable inside
+        AsyncSession.run_sync. Its IO is awaited on the event loop like the async
+        session's, so it can be used by the SqliteTaskManager code run_sync runs."""
+        session: Session = self.session_class(
+            bind=self._engine.sync_engine, autoflush=False
+        )
+        try:
+            yield session
+        except Exception:
+            session.rollback()
+            raise
+        finally:
+            session.close()
+
+
+def create_async_archive_database(
+    db_url: str,
+    echo: bool = False,
+    pragmas: Optional[Dict[str, Any]] = None,
+    slow_query_seconds: Optional[float] = None,
+) -> AsyncDatabase:
+    """The asyncio counterpart of create_archive_database."""
+    # The history table is created through a sync engine, which isn't kept
+    create_archive_database(db_url, echo, pragmas).engine.dispose()
+    return AsyncDatabase(
+        db_url=db_url,
+        echo=echo,
+        pragmas=pragmas,
+        slow_query_seconds=slow_query_seconds,
+    )
+
+
+def create_async_shard_databases(
+    db_urls: List[str],
+    echo: bool = False,
+    pragmas: Optional[Dict[str, Any]] = None,
+    pool_size: Optional[int] = None,
+    max_overflow: Optional[int] = None,
+    slow_query_seconds: Optional[float] = None,
+) -> List[AsyncDatabase]:
+    return [
+        AsyncDatabase(
+            db_url, echo, pragmas, pool_size, max_overflow, slow_query_seconds
+        )
+        for db_url in db_urls
+    ]
@@ -0,0 +1,319 @@
+import abc
+import datetime
+from contextlib import AbstractAsyncContextManager, AbstractContextManager, nullcontext
+from typing import Any, AsyncIterator, Callable, List, Optional, TypeVar
+from uuid import UUID
+
+from sqlalchemy.ext.asyncio import AsyncSession
+from sqlalchemy.orm import Session
+
+from app.domain.models import (
+    CreateTask,
+    HistoryEntry,
+    RestoredTasks,
+    Task,
+    TaskPage,
+    TaskQuery,
+    UpdateTask,
+    VersionedTask,
+)
+from app.domain.task_managers import (
+    InMemoryTaskManager,
+    iter_tasks_statement,
+    SqliteTaskManager,
+    task_from_row,
+)
+
+T = TypeVar("T")
+
+
+class AsyncTaskManager(metaclass=abc.ABCMeta):
+    """The asyncio counterpart of TaskManager, used by the api routes so requests
+    don't each hold a threadpool thread while waiting on the database."""
+
+    @abc.abstractmethod
+    async def create_task(self, create_task: CreateTask) -> Optional[Task]:
+        pass
+
+    @abc.abstractmethod
+    async def get_task(self, task_id: UUID, user_id: UUID) -> Optional[Task]:
+        pass
+
+    @abc.abstractmethod
+    async def get_tasks(
+        self, user_id: UUID, query: Optional[TaskQuery] = None
+    ) -> List[Task]:
+        pass
+
+    @abc.abstractmethod
+    def iter_tasks(self, user_id: UUID) -> AsyncIterator[Task]:
+        pass
+
+    @abc.abstractmethod
+    async def get_tasks_page(
+        self,
+        user_id: UUID,
+        limit: int,
+        cursor: Optional[str] = None,
+        query: Optional[TaskQuery] = None,
+    ) -> TaskPage:
+        pass
+
+    @abc.abstractmethod
+    async def get_task_version(self, task_id: UUID, user_id: UUID) -> Optional[int]:
+        pass
+
+    @abc.abstractmethod
+    async def get_tasks_version(self, user_id: UUID) -> int:
+        pass
+
+    @abc.abstractmethod
+    async def update_task(
+        self,
+        update_task: UpdateTask,
+        user_id: UUID,
+        expected_version: Optional[int] = None,
+    ) -> Optional[VersionedTask]:
+        pass
+
+    @abc.abstractmethod
+    async def delete_task(
+        self, task_id: UUID, user_id: UUID, expected_version: Optional[int] = None
+    ) -> Optional[Task]:
+        pass
+
+    @abc.abstractmethod
+    async def create_tasks(self, create_tasks: List[CreateTask]) -> List[Task]:
+        pass
+
+    @abc.abstractmethod
+    async def update_tasks(
+        self, update_tasks: List[UpdateTask], user_id: UUID
+    ) -> List[Optional[Task]]:
+        pass
+
+    @abc.abstractmethod
+    async def delete_tasks(
+        self, task_ids: List[UUID], user_id: UUID
+    ) -> List[Optional[Task]]:
+        pass
+
+    @abc.abstractmethod
+    async def get_last_history_entry(
+        self, task_id: UUID, user_id: UUID
+    ) -> Optional[HistoryEntry]:
+        pass
+
+    @abc.abstractmethod
+    async def restore_task(self, task_id: UUID, user_id: UUID) -> Optional[Task]:
+        pass
+
+    @abc.abstractmethod
+    async def restore_tasks(
+        self,
+        user_id: UUID,
+        task_ids: Optional[List[UUID]] = None,
+        deleted_since: Optional[datetime.datetime] = None,
+    ) -> RestoredTasks:
+        pass
+
+
+class AsyncInMemoryTaskManager(AsyncTaskManager):
+    """Wraps an InMemoryTaskManager, which never blocks, so its methods are called
+    directly on the event loop. Sharing the InMemoryTaskManager means both
+    interfaces see the same tasks."""
+
+    def __init__(self, task_manager: InMemoryTaskManager) -> None:
+        self.task_manager = task_manager
+
+    async def create_task(self, create_task: CreateTask) -> Optional[Task]:
+        return self.task_manager.create_task(create_task)
+
+    async def get_task(self, task_id: UUID, user_id: UUID) -> Optional[Task]:
+        return self.task_manager.get_task(task_id, user_id)
+
+    async def get_tasks(
+        self, user_id: UUID, query: Optional[TaskQuery] = None
+    ) -> List[Task]:
+        return self.task_manager.get_tasks(user_id, query)
+
+    async def iter_tasks(self, user_id: UUID) -> AsyncIterator[Task]:
+        for task in self.task_manager.iter_tasks(user_id):
+            yield task
+
+    async def get_tasks_page(
+        self,
+        user_id: UUID,
+        limit: int,
+        cursor: Optional[str] = None,
+        query: Optional[TaskQuery] = None,
+    ) -> TaskPage:
+        return self.task_manager.get_tasks_page(user_id, limit, cursor, query)
+
+    async def get_task_version(self, task_id: UUID, user_id: UUID) -> Optional[int]:
+        return self.task_manager.get_task_version(task_id, user_id)
+
+    async def get_tasks_version(self, user_id: UUID) -> int:
+        return self.task_manager.get_tasks_version(user_id)
+
+    async def update_task(
+        self,
+        update_task: UpdateTask,
+        user_id: UUID,
+        expected_version: Optional[int] = None,
+    ) -> Optional[VersionedTask]:
+        return self.task_manager.update_task(update_task, user_id, expected_version)
+
+    async def delete_task(
+        self, task_id: UUID, user_id: UUID, expected_version: Optional[int] = None
+    ) -> Optional[Task]:
+        return self.task_manager.delete_task(task_id, user_id, expected_version)
+
+    async def create_tasks(self, create_tasks: List[CreateTask]) -> List[Task]:
+        return self.task_manager.create_tasks(create_tasks)
+
+    async def update_tasks(
+        self, update_tasks: List[UpdateTask], user_id: UUID
+    ) -> List[Optional[Task]]:
+        return self.task_manager.update_tasks(update_tasks, user_id)
+
+    async def delete_tasks(
+        self, task_ids: List[UUID], user_id: UUID
+    ) -> List[Optional[Task]]:
+        return self.task_manager.delete_tasks(task_ids, user_id)
+
+    async def get_last_history_entry(
+        self, task_id: UUID, user_id: UUID
+    ) -> Optional[HistoryEntry]:
+        return self.task_manager.get_last_history_entry(task_id, user_id)
+
+    async def restore_task(self, task_id: UUID, user_id: UUID) -> Optional[Task]:
+        return self.task_manager.restore_task(task_id, user_id)
+
+    async def restore_tasks(
+        self,
+        user_id: UUID,
+        task_ids: Optional[List[UUID]] = None,
+        deleted_since: Optional[datetime.datetime] = None,
+    ) -> RestoredTasks:
+        return self.task_manager.restore_tasks(user_id, task_ids, deleted_since)
+
+
+class AsyncSqliteTaskManager(AsyncTaskManager):
+
+    def __init__(
+        self,
+        session_factory: Callable[..., AbstractAsyncContextManager[AsyncSession]],
+        archive_session_factory: Optional[
+            Callable[..., AbstractContextManager[Session]]
+        ] = None,
+    ) -> None:
+        self.session_factory = session_factory
+        # Used inside run_sync, so it has to be AsyncDatabase.sync_session, whose
+        # IO is awaited rather than blocking the event loop
+        self.archive_session_factory = archive_session_factory
+
+    async def run_sync(self, method: Callable[..., T], *args: Any) -> T:
+        """Run a SqliteTaskManager method against an aiosqlite session.
+
+        The method runs on the sync view of the async session, so the queries and
+        unit of work are shared with SqliteTaskManager and only the IO goes through
+        the asyncio driver.
+        """
+
+        def run(session: Session) -> T:
+            task_manager = SqliteTaskManager(
+                session_factory=lambda: nullcontext(session),
+                archive_session_factory=self.archive_session_factory,
+            )
+            return method(task_manager, *args)
+
+        async with self.session_factory() as session:
+            return await session.run_sync(run)
+
+    async def create_task(self, create_task: CreateTask) -> Optional[Task]:
+        return await self.run_sync(SqliteTaskManager.create_task, create_task)
+
+    async def get_task(self, task_id: UUID, user_id: UUID) -> Optional[Task]:
+        return await self.run_sync(SqliteTaskManager.get_task, task_id, user_id)
+
+    async def get_tasks(
+        self, user_id: UUID, query: Optional[TaskQuery] = None
+    ) -> List[Task]:
+        return await self.run_sync(SqliteTaskManager.get_tasks, user_id, query)
+
+    async def iter_tasks(self, user_id: UUID) -> AsyncIterator[Task]:
+        # Streamed from the session directly, run_sync can't yield rows as it goes
+        async with self.session_factory() as session:
+            result = await session.stream(iter_tasks_statement(user_id))
+            async for row in result:
+                yield task_from_row(row)
+
+    async def get_tasks_page(
+        self,
+        user_id: UUID,
+        limit: int,
+        cursor: Optional[str] = None,
+        query: Optional[TaskQuery] = None,
+    ) -> TaskPage:
+        return await self.run_sync(
+            SqliteTaskManager.get_tasks_page, user_id, limit, cursor, query
+        )
+
+    async def get_task_version(self, task_id: UUID, user_id: UUID) -> Optional[int]:
+        return await self.run_sync(SqliteTaskManager.get_task_version, task_id, user_id)
+
+    async def get_tasks_version(self, user_id: UUID) -> int:
+        return await self.run_sync(SqliteTaskManager.get_tasks_version, user_id)
+
+    async def update_task(
+        self,
+        update_task: UpdateTask,
+        user_id: UUID,
+        expected_version: Optional[int] = None,
+    ) -> Optional[VersionedTask]:
+        return await self.run_sync(
+            SqliteTaskManager.update_task, update_task, user_id, expected_version
+        )
+
+    async def delete_task(
+        self, task_id: UUID, user_id: UUID, expected_version: Optional[int] = None
+    ) -> Optional[Task]:
+        return await self.run_sync(
+            SqliteTaskManager.delete_task, task_id, user_id, expected_version
+        )
+
+    async def create_tasks(self, create_tasks: List[CreateTask]) -> List[Task]:
+        return await self.run_sync(SqliteTaskManager.create_tasks, create_tasks)
+
+    async def update_tasks(
+        self, update_tasks: List[UpdateTask], user_id: UUID
+    ) -> List[Optional[Task]]:
+        return await self.run_sync(
+            SqliteTaskManager.update_tasks, update_tasks, user_id
+        )
+
+    async def delete_tasks(
+        self, task_ids: List[UUID], user_id: UUID
+    ) -> List[Optional[Task]]:
+        return await self.run_sync(SqliteTaskManager.delete_tasks, task_ids, user_id)
+
+    async def get_last_history_entry(
+        self, task_id: UUID, user_id: UUID
+    ) -> Optional[HistoryEntry]:
+        return await self.run_sync(
+            SqliteTaskManager.get_last_history_entry, task_id, user_id
+        )
+
+    async def restore_task(self, task_id: UUID, user_id: UUID) -> Optional[Task]:
+        return await self.run_sync(SqliteTaskManager.restore_task, task_id, user_id)
+
+    async def restore_tasks(
+        self,
+        user_id: UUID,
+        task_ids: Optional[List[UUID]] = None,
+        deleted_since: Optional[datetime.datetime] = None,
+    ) -> RestoredTasks:
+        return await self.run_sync(
+            SqliteTaskManager.restore_tasks, user_id, task_ids, deleted_since
+        )
@@ -0,0 +1,416 @@
+import threading
+import time
+from collections import OrderedDict
+from datetime import date, datetime
+from typing import (
+    Any,
+    AsyncIterator,
+    Callable,
+    Dict,
+    Hashable,
+    Iterable,
+    Iterator,
+    List,
+    Optional,
+    Set,
+    Tuple,
+)
+from uuid import UUID
+
+from app.domain.async_task_managers import AsyncTaskManager
+from app.domain.models import (
+    CreateTask,
+    HistoryEntry,
+    RestoredTasks,
+    Task,
+    TaskPage,
+    TaskQuery,
+    UpdateTask,
+    VersionedTask,
+)
+from app.domain.task_managers import TaskManager
+
+MISSING = object()
+
+# The kinds of entry cached for each user
+TASK = "task"
+TASK_VERSION = "task_version"
+TASKS = "tasks"
+TASKS_PAGE = "tasks_page"
+TASKS_VERSION = "tasks_version"
+# Only invalidated by writes to the task they are for
+TASK_KINDS = {TASK, TASK_VERSION}
+
+
+def query_key(query: Optional[TaskQuery]) -> Hashable:
+    if query is None:
+        query = TaskQuery()
+    return (
+        frozenset(query.statuses),
+        frozenset(query.labels_any),
+        frozenset(query.labels_all),
+        query.due_after,
+        query.due_before,
+        # Which tasks are overdue changes with the date
+        date.today() if query.overdue else None,
+        query.sort,
+    )
+
+
+class TaskCache:
+    """A bounded LRU cache of tasks, task lists and task pages. Entries expire ttl
+    seconds after they are cached.
+
+    Keys start with the user id, so a write only invalidates the entries of the
+    user it changed: their task lists, pages and tasks version, and the tasks it
+    wrote.
+    """
+
+    def __init__(
+        self,
+        max_size: int = 10000,
+        ttl: float = 60.0,
+        clock: Optional[Callable[[], float]] = None,
+    ) -> None:
+        if clock is None:
+            clock = time.monotonic
+
+        self.max_size = max_size
+        self.ttl = ttl
+        self.clock = clock
+        self.entries: OrderedDict[Tuple, Tuple[float, Any]] = OrderedDict()
+        self.user_keys: Dict[UUID, Set[Tuple]] = {}
+        # Bumped on every invalidation, so a read that raced a write doesn't
+        # cache what it read
+        self.generations: Dict[UUID, int] = {}
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+        self.expirations = 0
+        self.lock = threading.Lock()
+
+    def get(self, key: Tuple) -> Any:
+        """Returns the cached value, or MISSING."""
+        with self.lock:
+            entry = self.entries.get(key)
+            if entry is None:
+                self.misses += 1
+                return MISSING
+
+            expires_at, value = entry
+            if expires_at <= self.clock():
+                self.remove(key)
+                self.expirations += 1
+                self.misses += 1
+                return MISSING
+
+            self.entries.move_to_end(key)
+            self.hits += 1
+            return value
+
+    def generation(self, user_id: UUID) -> int:
+        return self.generations.get(user_id, 0)
+
+    def put(self, key: Tuple, value: Any, generation: int) -> None:
+        """Caches the value, unless the user's entries were invalidated since
+        generation was read."""
+        user_id = key[0]
+        with self.lock:
+            if self.generations.get(user_id, 0) != generation:
+                return
+
+            self.entries[key] = (self.clock() + self.ttl, value)
+            self.entries.move_to_end(key)
+            self.user_keys.setdefault(user_id, set()).add(key)
+            while len(self.entries) > self.max_size:
+                oldest_key = next(iter(self.entries))
+                self.remove(oldest_key)
+                self.evictions += 1
+
+    def invalidate(self, user_id: UUID, task_ids: Iterable[UUID] = ()) -> None:
+        task_ids = set(task_ids)
+        with self.lock:
+            self.generations[user_id] = self.generations.get(user_id, 0) + 1
+            for key in list(self.user_keys.get(user_id, ())):
+                if key[1] not in TASK_KINDS or key[2] in task_ids:
+                    self.remove(key)
+
+    def remove(self, key: Tuple) -> None:
+        del self.entries[key]
+        user_keys = self.user_keys[key[0]]
+        user_keys.discard(key)
+        if not user_keys:
+            del self.user_keys[key[0]]
+
+    def stats(self) -> Dict[str, int]:
+        return {
+            "hits": self.hits,
+            "misses": self.misses,
+            "evictions": self.evictions,
+            "expirations": self.expirations,
+            "size": len(self.entries),
+        }
+
+
+def written_task_ids(tasks: Iterable[Optional[Task]]) -> List[UUID]:
+    return [task.id for task in tasks if task is not None]
+
+
+class CachingTaskManager(TaskManager):
+    """Wraps a TaskManager, caching its reads in a TaskCache. Writes go straight
+    through and then invalidate what they changed.
+
+    The cached tasks are shared between callers, so they must not be mutated.
+    """
+
+    def __init__(self, task_manager: TaskManager, cache: TaskCache) -> None:
+        self.task_manager = task_manager
+        self.cache = cache
+
+    def read_through(self, key: Tuple, load: Callable[[], Any]) -> Any:
+        value = self.cache.get(key)
+        if value is MISSING:
+            generation = self.cache.generation(key[0])
+            value = load()
+            # Tasks that don't exist aren't cached, so creating them doesn't need
+            # to invalidate anything
+            if value is not None:
+                self.cache.put(key, value, generation)
+        return value
+
+    def create_task(self, create_task: CreateTask) -> Optional[Task]:
+        task = self.task_manager.create_task(create_task)
+        self.cache.invalidate(create_task.user_id)
+        return task
+
+    def get_task(self, task_id: UUID, user_id: UUID) -> Optional[Task]:
+        return self.read_through(
+            (user_id, TASK, task_id),
+            lambda: self.task_manager.get_task(task_id, user_id),
+        )
+
+    def get_task_version(self, task_id: UUID, user_id: UUID) -> Optional[int]:
+        return self.read_through(
+            (user_id, TASK_VERSION, task_id),
+            lambda: self.task_manager.get_task_version(task_id, user_id),
+        )
+
+    def get_tasks_version(self, user_id: UUID) -> int:
+        return self.read_through(
+            (user_id, TASKS_VERSION),
+            lambda: self.task_manager.get_tasks_version(user_id),
+        )
+
+    def get_tasks(self, user_id: UUID, query: Optional[TaskQuery] = None) -> List[Task]:
+        tasks = self.read_through(
+            (user_id, TASKS, query_key(query)),
+            lambda: self.task_manager.get_tasks(user_id, query),
+        )
+        return list(tasks)
+
+    def iter_tasks(self, user_id: UUID) -> Iterator[Task]:
+        # Exports read every task once, caching them would only evict hot entries
+        return self.task_manager.iter_tasks(user_id)
+
+    def get_tasks_page(
+        self,
+        user_id: UUID,
+        limit: int,
+        cursor: Optional[str] = None,
+        query: Optional[TaskQuery] = None,
+    ) -> TaskPage:
+        return self.read_through(
+            (user_id, TASKS_PAGE, limit, cursor, query_key(query)),
+            lambda: self.task_manager.get_tasks_page(user_id, limit, cursor, query),
+        )
+
+    def update_task(
+        self,
+        update_task: UpdateTask,
+        user_id: UUID,
+        expected_version: Optional[int] = None,
+    ) -> Optional[VersionedTask]:
+        versioned_task = self.task_manager.update_task(
+            update_task, user_id, expected_version
+        )
+        if versioned_task is not None:
+            self.cache.invalidate(user_id, [versioned_task.task.id])
+        return versioned_task
+
+    def delete_task(
+        self, task_id: UUID, user_id: UUID, expected_version: Optional[int] = None
+    ) -> Optional[Task]:
+        task = self.task_manager.delete_task(task_id, user_id, expected_version)
+        if task is not None:
+            self.cache.invalidate(user_id, [task_id])
+        return task
+
+    def create_tasks(self, create_tasks: List[CreateTask]) -> List[Task]:
+        tasks = self.task_manager.create_tasks(create_tasks)
+        for user_id in {create_task.user_id for create_task in create_tasks}:
+            self.cache.invalidate(user_id)
+        return tasks
+
+    def update_tasks(
+        self, update_tasks: List[UpdateTask], user_id: UUID
+    ) -> List[Optional[Task]]:
+        tasks = self.task_manager.update_tasks(update_tasks, user_id)
+        self.cache.invalidate(user_id, written_task_ids(tasks))
+        return tasks
+
+    def delete_tasks(self, task_ids: List[UUID], user_id: UUID) -> List[Optional[Task]]:
+        tasks = self.task_manager.delete_tasks(task_ids, user_id)
+        self.cache.invalidate(user_id, written_task_ids(tasks))
+        return tasks
+
+    def get_last_history_entry(
+        self, task_id: UUID, user_id: UUID
+    ) -> Optional[HistoryEntry]:
+        return self.task_manager.get_last_history_entry(task_id, user_id)
+
+    def restore_task(self, task_id: UUID, user_id: UUID) -> Optional[Task]:
+        task = self.task_manager.restore_task(task_id, user_id)
+        if task is not None:
+            self.cache.invalidate(user_id, [task_id])
+        return task
+
+    def restore_tasks(
+        self,
+        user_id: UUID,
+        task_ids: Optional[List[UUID]] = None,
+        deleted_since: Optional[datetime] = None,
+    ) -> RestoredTasks:
+        restored_tasks = self.task_manager.restore_tasks(
+            user_id, task_ids, deleted_since
+        )
+        self.cache.invalidate(user_id, written_task_ids(restored_tasks.restored))
+        return restored_tasks
+
+
+class AsyncCachingTaskManager(AsyncTaskManager):
+    """The asyncio counterpart of CachingTaskManager. Sharing the TaskCache with a
+    CachingTaskManager over the same storage keeps both consistent."""
+
+    def __init__(self, task_manager: AsyncTaskManager, cache: TaskCache) -> None:
+        self.task_manager = task_manager
+        self.cache = cache
+
+    async def read_through(self, key: Tuple, load: Callable[[], Any]) -> Any:
+        value = self.cache.get(key)
+        if value is MISSING:
+            generation = self.cache.generation(key[0])
+            value = await load()
+            if value is not None:
+                self.cache.put(key, value, generation)
+        return value
+
+    async def create_task(self, create_task: CreateTask) -> Optional[Task]:
+        task = await self.task_manager.create_task(create_task)
+        self.cache.invalidate(create_task.user_id)
+        return task
+
+    async def get_task(self, task_id: UUID, user_id: UUID) -> Optional[Task]:
+        return await self.read_through(
+            (user_id, TASK, task_id),
+            lambda: self.task_manager.get_task(task_id, user_id),
+        )
+
+    async def get_task_version(self, task_id: UUID, user_id: UUID) -> Optional[int]:
+        return await self.read_through(
+            (user_id, TASK_VERSION, task_id),
+            lambda: self.task_manager.get_task_version(task_id, user_id),
+        )
+
+    async def get_tasks_version(self, user_id: UUID) -> int:
+        return await self.read_through(
+            (user_id, TASKS_VERSION),
+            lambda: self.task_manager.get_tasks_version(user_id),
+        )
+
+    async def get_tasks(
+        self, user_id: UUID, query: Optional[TaskQuery] = None
+    ) -> List[Task]:
+        tasks = await self.read_through(
+            (user_id, TASKS, query_key(query)),
+            lambda: self.task_manager.get_tasks(user_id, query),
+        )
+        return list(tasks)
+
+    def iter_tasks(self, user_id: UUID) -> AsyncIterator[Task]:
+        return self.task_manager.iter_tasks(user_id)
+
+    async def get_tasks_page(
+        self,
+        user_id: UUID,
+        limit: int,
+        cursor: Optional[str] = None,
+        query: Optional[TaskQuery] = None,
+    ) -> TaskPage:
+        return await self.read_through(
+            (user_id, TASKS_PAGE, limit, cursor, query_key(query)),
+            lambda: self.task_manager.get_tasks_page(user_id, limit, cursor, query),
+        )
+
+    async def update_task(
+        self,
+        update_task: UpdateTask,
+        user_id: UUID,
+        expected_version: Optional[int] = None,
+    ) -> Optional[VersionedTask]:
+        versioned_task = await self.task_manager.update_task(
+            update_task, user_id, expected_version
+        )
+        if versioned_task is not None:
+            self.cache.invalidate(user_id, [versioned_task.task.id])
+        return versioned_task
+
+    async def delete_task(
+        self, task_id: UUID, user_id: UUID, expected_version: Optional[int] = None
+    ) -> Optional[Task]:
+        task = await self.task_manager.delete_task(task_id, user_id, expected_version)
+        if task is not None:
+            self.cache.invalidate(user_id, [task_id])
+        return task
+
+    async def create_tasks(self, create_tasks: List[CreateTask]) -> List[Task]:
+        tasks = await self.task_manager.create_tasks(create_tasks)
+        for user_id in {create_task.user_id for create_task in create_tasks}:
+            self.cache.invalidate(user_id)
+        return tasks
+
+    async def update_tasks(
+        self, update_tasks: List[UpdateTask], user_id: UUID
+    ) -> List[Optional[Task]]:
+        tasks = await self.task_manager.update_tasks(update_tasks, user_id)
+        self.cache.invalidate(user_id, written_task_ids(tasks))
+        return tasks
+
+    async def delete_tasks(
+        self, task_ids: List[UUID], user_id: UUID
+    ) -> List[Optional[Task]]:
+        tasks = await self.task_manager.delete_tasks(task_ids, user_id)
+        self.cache.invalidate(user_id, written_task_ids(tasks))
+        return tasks
+
+    async def get_last_history_entry(
+        self, task_id: UUID, user_id: UUID
+    ) -> Optional[HistoryEntry]:
+        return await self.task_manager.get_last_history_entry(task_id, user_id)
+
+    async def restore_task(self, task_id: UUID, user_id: UUID) -> Optional[Task]:
+        task = await self.task_manager.restore_task(task_id, user_id)
+        if task is not None:
+            self.cache.invalidate(user_id, [task_id])
+        return task
+
+    async def restore_tasks(
+        self,
+        user_id: UUID,
+        task_ids: Optional[List[UUID]] = None,
+        deleted_since: Optional[datetime] = None,
+    ) -> RestoredTasks:
+        restored_tasks = await self.task_manager.restore_tasks(
+            user_id, task_ids, deleted_since
+        )
+        self.cache.invalidate(user_id, written_task_ids(restored_tasks.restored))
+        return restored_tasks
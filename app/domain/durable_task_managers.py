@@ -0,0 +1,563 @@
+import asyncio
+import datetime
+import json
+import os
+import re
+import threading
+from typing import Any, Callable, Dict, FrozenSet, List, Optional, Tuple, TypeVar
+from uuid import UUID
+
+from app.domain.async_task_managers import AsyncInMemoryTaskManager
+from app.domain.models import (
+    CreateTask,
+    HistoryEntry,
+    HistoryEntryType,
+    HistoryEntryVersion,
+    RestoredTasks,
+    Task,
+    TaskStatus,
+    UpdateTask,
+    VersionedTask,
+)
+from app.domain.task_managers import (
+    InMemoryTaskManager,
+    TaskIndexes,
+    TaskOrder,
+    TaskRecord,
+)
+
+T = TypeVar("T")
+
+# A change to the tasks as it is written to the log, a JSON array starting with
+# what kind of change it is
+Change = List[Any]
+# A task was stored or replaced:
+# [PUT, user_id, task_id, name, status, labels, due_date, sub_tasks]
+PUT = "p"
+# A task was removed: [REMOVE, user_id, task_id, history_entry_id, deleted_at]
+REMOVE = "r"
+
+SNAPSHOT = "snapshot.json"
+LOG_SEGMENT = "log.{:08d}"
+LOG_SEGMENT_PATTERN = re.compile(r"^log\.(\d{8})$")
+# How many changes are logged before a new snapshot is written
+SNAPSHOT_EVERY = 100000
+
+
+def fsync_directory(directory: str) -> None:
+    """Makes files created or renamed in the directory survive a crash."""
+    fd = os.open(directory, os.O_RDONLY)
+    try:
+        os.fsync(fd)
+    finally:
+        os.close(fd)
+
+
+def put_change(user_id: UUID, record: TaskRecord) -> Change:
+    return [
+        PUT,
+        user_id.hex,
+        record.id.hex,
+        record.name,
+        record.status.value,
+        list(record.labels),
+        None if record.due_date is None else record.due_date.isoformat(),
+        list(record.sub_tasks),
+    ]
+
+
+def task_from_change(change: Change) -> Task:
+    _, user_id, task_id, name, status, labels, due_date, sub_tasks = change
+    return Task.model_construct(
+        id=UUID(task_id),
+        name=name,
+        status=TaskStatus(status),
+        labels=set(labels),
+        due_date=None if due_date is None else datetime.date.fromisoformat(due_date),
+        sub_tasks=sub_tasks,
+        user_id=UUID(user_id),
+    )
+
+
+class TaskLog:
+    """An append-only file of changes to the tasks, one JSON array per line.
+
+    Appended changes are buffered until sync writes and fsyncs everything appended
+    so far. Writers that call sync while an fsync is running wait for it, then the
+    first of them syncs for all of them, so concurrent writers share one fsync
+    rather than queueing for one each.
+    """
+
+    def __init__(self, path: str) -> None:
+        self.path = path
+        self.file = open(path, "ab")
+        self.condition = threading.Condition()
+        self.pending: List[bytes] = []
+        # Changes are numbered from 1 in the order they were appended
+        self.appended = 0
+        self.synced = 0
+        self.syncing = False
+
+    def append(self, changes: List[Change]) -> int:
+        """Buffers the changes, returning the number to sync to for them."""
+        with self.condition:
+            for change in changes:
+                self.pending.append(
+                    json.dumps(change, separators=(",", ":")).encode() + b"\n"
+                )
+            self.appended += len(changes)
+            return self.appended
+
+    def sync(self, sequence: int) -> None:
+        """Returns once the changes up to sequence are on disk."""
+        with self.condition:
+            while self.synced < sequence:
+                if self.syncing:
+                    self.condition.wait()
+                    continue
+
+                self.syncing = True
+                pending, self.pending = self.pending, []
+                appended = self.appended
+                # New changes can be appended while this fsync runs, they are
+                # synced by the next one
+                self.condition.release()
+                try:
+                    self.file.write(b"".join(pending))
+                    self.file.flush()
+                    os.fsync(self.file.fileno())
+                finally:
+                    self.condition.acquire()
+                    self.syncing = False
+                    self.condition.notify_all()
+                self.synced = appended
+
+    def close(self) -> None:
+        self.sync(self.appended)
+        self.file.close()
+
+
+def read_log(path: str) -> List[Change]:
+    with open(path, "rb") as file:
+        lines = file.read().split(b"\n")
+    # The last line is empty, unless the process stopped part way through writing
+    # it. A change is only synced once its whole line is written, so a partial
+    # line is one that was never acknowledged.
+    return [json.loads(line) for line in lines[:-1]]
+
+
+class DurableInMemoryTaskManager(InMemoryTaskManager):
+    """An InMemoryTaskManager that keeps its tasks across restarts.
+
+    Reads are served from memory as they are by InMemoryTaskManager. Every write
+    appends the changes it made to a log segment in the directory, and returns
+    once they are fsynced. Every snapshot_every changes, the tasks are written to a
+    snapshot in a background thread and the log starts a new segment, so startup
+    only loads the snapshot and replays the segments written after it.
+
+    A write is visible to reads before it is durable, it just isn't acknowledged.
+    Only one process can use the directory at a time.
+    """
+
+    def __init__(self, directory: str, snapshot_every: int = SNAPSHOT_EVERY) -> None:
+        super().__init__()
+        self.directory = directory
+        self.snapshot_every = snapshot_every
+        # Writes are applied and logged in the same order
+        self.lock = threading.RLock()
+        # The changes made by the write being applied, None between writes
+        self.changes: Optional[List[Change]] = None
+        self.changes_since_snapshot = 0
+        self.snapshotting: Optional[threading.Thread] = None
+
+        os.makedirs(directory, exist_ok=True)
+        self.segment = self.load()
+        # A restart that wrote nothing leaves an empty segment, which is appended
+        # to rather than followed by another
+        path = self.segment_path(self.segment)
+        if not os.path.exists(path) or os.path.getsize(path) > 0:
+            self.segment += 1
+        self.log = TaskLog(self.segment_path(self.segment))
+        fsync_directory(directory)
+
+    def segment_path(self, segment: int) -> str:
+        return os.path.join(self.directory, LOG_SEGMENT.format(segment))
+
+    def segments(self) -> List[int]:
+        return sorted(
+            int(match.group(1))
+            for match in map(LOG_SEGMENT_PATTERN.match, os.listdir(self.directory))
+            if match is not None
+        )
+
+    def load(self) -> int:
+        """Loads the snapshot and replays the log segments written after it,
+        returning the last segment."""
+        snapshot_segment = 0
+        snapshot_path = os.path.join(self.directory, SNAPSHOT)
+        if os.path.exists(snapshot_path):
+            snapshot_segment = self.load_snapshot(snapshot_path)
+
+        last_segment = snapshot_segment
+        for segment in self.segments():
+            if segment <= snapshot_segment:
+                # Left behind by a snapshot that stopped before deleting them
+                os.remove(self.segment_path(segment))
+                continue
+            for change in read_log(self.segment_path(segment)):
+                self.apply_change(change)
+            last_segment = segment
+        return last_segment
+
+    def load_snapshot(self, path: str) -> int:
+        # Most tasks share their labels and due date with others, so each distinct
+        # value is only parsed once
+        labels: Dict[Tuple[str, ...], FrozenSet[str]] = {}
+        due_dates: Dict[Optional[str], Optional[datetime.date]] = {None: None}
+        with open(path, "rb") as file:
+            header = json.loads(file.readline())
+            self.next_position = header["next_position"]
+            for line in file:
+                user_hex, tasks_version, tasks, history = json.loads(line)
+                user_id = UUID(user_hex)
+                self.tasks_versions[user_id] = tasks_version
+                self.load_tasks(user_id, tasks, labels, due_dates)
+                self.load_history(user_id, history)
+        return header["segment"]
+
+    def load_tasks(
+        self,
+        user_id: UUID,
+        tasks: List[List[Any]],
+        labels: Dict[Tuple[str, ...], FrozenSet[str]],
+        due_dates: Dict[Optional[str], Optional[datetime.date]],
+    ) -> None:
+        """Stores a user's snapshotted tasks, which are in position order."""
+        if not tasks:
+            return
+        user_tasks = self.tasks.setdefault(user_id, {})
+        task_order = self.task_order.setdefault(user_id, TaskOrder())
+        indexes = self.indexes.setdefault(user_id, TaskIndexes())
+        statuses = {status.value: status for status in TaskStatus}
+        for task in tasks:
+            task_id, name, status, task_labels, due_date, sub_tasks, position = task[:7]
+            label_key = tuple(task_labels)
+            if label_key not in labels:
+                labels[label_key] = self.intern(
+                    frozenset(self.intern(label) for label in task_labels)
+                )
+            if due_date not in due_dates:
+                due_dates[due_date] = self.intern(datetime.date.fromisoformat(due_date))
+            record = TaskRecord(
+                id=UUID(task_id),
+                name=name,
+                status=statuses[status],
+                labels=labels[label_key],
+                due_date=due_dates[due_date],
+                sub_tasks=tuple(sub_tasks),
+                position=position,
+                version=task[7],
+            )
+            user_tasks[record.id] = record
+            task_order.append(position, record.id)
+            indexes.add(record)
+        self.task_count += len(tasks)
+
+    def load_history(self, user_id: UUID, history: List[List[Any]]) -> None:
+        """Stores a user's snapshotted history entries, which are in created
+        order."""
+        if not history:
+            return
+        user_history = self.history.setdefault(user_id, {})
+        for entry_id, entity_id, type, version, event, created_at in history:
+            history_entry = HistoryEntry.model_construct(
+                id=UUID(entry_id),
+                entity_id=UUID(entity_id),
+                user_id=user_id,
+                type=HistoryEntryType(type),
+                version=HistoryEntryVersion(version),
+                event=event,
+                created_at=datetime.datetime.fromisoformat(created_at),
+            )
+            user_history.setdefault(history_entry.entity_id, []).append(history_entry)
+        self.history_entry_count += len(history)
+
+    def apply_change(self, change: Change) -> None:
+        if change[0] == PUT:
+            task = task_from_change(change)
+            record = self.tasks.get(task.user_id, {}).get(task.id)
+            if record is None:
+                self.store(task.id, task, task.user_id)
+            else:
+                self.replace(task.user_id, record, task)
+        elif change[0] == REMOVE:
+            _, user_id, task_id, history_entry_id, deleted_at = change
+            user_id = UUID(user_id)
+            self.remove(
+                user_id,
+                self.tasks[user_id][UUID(task_id)],
+                UUID(history_entry_id),
+                datetime.datetime.fromisoformat(deleted_at),
+            )
+
+    def store_record(self, user_id: UUID, record: TaskRecord) -> None:
+        super().store_record(user_id, record)
+        if self.changes is not None:
+            self.changes.append(put_change(user_id, record))
+
+    def replace(self, user_id: UUID, record: TaskRecord, task: Any) -> TaskRecord:
+        updated_record = super().replace(user_id, record, task)
+        if self.changes is not None:
+            self.changes.append(put_change(user_id, updated_record))
+        return updated_record
+
+    def remove(
+        self,
+        user_id: UUID,
+        record: TaskRecord,
+        history_entry_id: UUID,
+        deleted_at: datetime.datetime,
+    ) -> Task:
+        deleted_task = super().remove(user_id, record, history_entry_id, deleted_at)
+        if self.changes is not None:
+            self.changes.append(
+                [
+                    REMOVE,
+                    user_id.hex,
+                    record.id.hex,
+                    history_entry_id.hex,
+                    deleted_at.isoformat(),
+                ]
+            )
+        return deleted_task
+
+    def apply(self, method: Callable[..., T], *args: Any) -> Tuple[T, TaskLog, int]:
+        """Runs an InMemoryTaskManager write method and appends the changes it made
+        to the log. Returns its result, and the log and sequence to sync to before
+        the write is acknowledged."""
+        with self.lock:
+            if self.changes is not None:
+                # A batch write calling a single write, the batch logs the changes
+                return method(self, *args), self.log, 0
+
+            self.changes = []
+            try:
+                result = method(self, *args)
+            finally:
+                # Changes made before an error are logged too, as they are in memory
+                changes, self.changes = self.changes, None
+                log = self.log
+                sequence = log.append(changes)
+                self.changes_since_snapshot += len(changes)
+                if self.changes_since_snapshot >= self.snapshot_every:
+                    self.start_snapshot()
+        return result, log, sequence
+
+    def synced(self, method: Callable[..., T], *args: Any) -> T:
+        result, log, sequence = self.apply(method, *args)
+        log.sync(sequence)
+        return result
+
+    def create_task(self, create_task: CreateTask) -> Optional[Task]:
+        return self.synced(InMemoryTaskManager.create_task, create_task)
+
+    def update_task(
+        self,
+        update_task: UpdateTask,
+        user_id: UUID,
+        expected_version: Optional[int] = None,
+    ) -> Optional[VersionedTask]:
+        return self.synced(
+            InMemoryTaskManager.update_task, update_task, user_id, expected_version
+        )
+
+    def delete_task(
+        self, task_id: UUID, user_id: UUID, expected_version: Optional[int] = None
+    ) -> Optional[Task]:
+        return self.synced(
+            InMemoryTaskManager.delete_task, task_id, user_id, expected_version
+        )
+
+    def create_tasks(self, create_tasks: List[CreateTask]) -> List[Task]:
+        return self.synced(InMemoryTaskManager.create_tasks, create_tasks)
+
+    def update_tasks(
+        self, update_tasks: List[UpdateTask], user_id: UUID
+    ) -> List[Optional[Task]]:
+        return self.synced(InMemoryTaskManager.update_tasks, update_tasks, user_id)
+
+    def delete_tasks(self, task_ids: List[UUID], user_id: UUID) -> List[Optional[Task]]:
+        return self.synced(InMemoryTaskManager.delete_tasks, task_ids, user_id)
+
+    def restore_task(self, task_id: UUID, user_id: UUID) -> Optional[Task]:
+        return self.synced(InMemoryTaskManager.restore_task, task_id, user_id)
+
+    def restore_tasks(
+        self,
+        user_id: UUID,
+        task_ids: Optional[List[UUID]] = None,
+        deleted_since: Optional[datetime.datetime] = None,
+    ) -> RestoredTasks:
+        return self.synced(
+            InMemoryTaskManager.restore_tasks, user_id, task_ids, deleted_since
+        )
+
+    def start_snapshot(self) -> None:
+        if self.snapshotting is not None and self.snapshotting.is_alive():
+            return
+        self.changes_since_snapshot = 0
+        self.snapshotting = threading.Thread(target=self.snapshot, daemon=True)
+        self.snapshotting.start()
+
+    def snapshot(self) -> None:
+        """Writes every task to a new snapshot, then deletes the log segments it
+        replaces.
+
+        Writes are only blocked while the tasks are copied. Records and history
+        entries are never changed once stored, so copying the lists they are in is
+        enough, and the snapshot is written from the copies.
+        """
+        with self.lock:
+            users = [
+                (
+                    user_id,
+                    tasks_version,
+                    (
+                        [
+                            self.tasks[user_id][task_id]
+                            for task_id in self.task_order[user_id].task_ids
+                        ]
+                        if user_id in self.tasks
+                        else []
+                    ),
+                    [
+                        history_entry
+                        for task_history in self.history.get(user_id, {}).values()
+                        for history_entry in task_history
+                    ],
+                )
+                for user_id, tasks_version in self.tasks_versions.items()
+            ]
+            next_position = self.next_position
+            # Everything up to here is in the snapshot, later changes go in a new
+            # segment
+            snapshot_segment = self.segment
+            self.log.close()
+            self.segment += 1
+            self.log = TaskLog(self.segment_path(self.segment))
+            fsync_directory(self.directory)
+
+        path = os.path.join(self.directory, SNAPSHOT)
+        with open(f"{path}.tmp", "w") as file:
+            file.write(
+                json.dumps(
+                    {"segment": snapshot_segment, "next_position": next_position}
+                )
+            )
+            file.write("\n")
+            for user_id, tasks_version, records, history in users:
+                tasks = [
+                    [
+                        record.id.hex,
+                        record.name,
+                        record.status.value,
+                        list(record.labels),
+                        (
+                            None
+                            if record.due_date is None
+                            else record.due_date.isoformat()
+                        ),
+                        list(record.sub_tasks),
+                        record.position,
+                        record.version,
+                    ]
+                    for record in records
+                ]
+                entries = [
+                    [
+                        history_entry.id.hex,
+                        history_entry.entity_id.hex,
+                        history_entry.type.value,
+                        history_entry.version.value,
+                        history_entry.event,
+                        history_entry.created_at.isoformat(),
+                    ]
+                    for history_entry in history
+                ]
+                file.write(json.dumps([user_id.hex, tasks_version, tasks, entries]))
+                file.write("\n")
+            file.flush()
+            os.fsync(file.fileno())
+        os.replace(f"{path}.tmp", path)
+        fsync_directory(self.directory)
+
+        for segment in self.segments():
+            if segment <= snapshot_segment:
+                os.remove(self.segment_path(segment))
+
+    def close(self) -> None:
+        if self.snapshotting is not None:
+            self.snapshotting.join()
+        with self.lock:
+            self.log.close()
+
+
+class AsyncDurableInMemoryTaskManager(AsyncInMemoryTaskManager):
+    """Wraps a DurableInMemoryTaskManager. Writes wait for their fsync in a worker
+    thread, so the event loop keeps serving requests, and the writes made while
+    one fsync runs are synced together by the next."""
+
+    task_manager: DurableInMemoryTaskManager
+
+    async def synced(self, method: Callable[..., T], *args: Any) -> T:
+        result, log, sequence = self.task_manager.apply(method, *args)
+        await asyncio.to_thread(log.sync, sequence)
+        return result
+
+    async def create_task(self, create_task: CreateTask) -> Optional[Task]:
+        return await self.synced(InMemoryTaskManager.create_task, create_task)
+
+    async def update_task(
+        self,
+        update_task: UpdateTask,
+        user_id: UUID,
+        expected_version: Optional[int] = None,
+    ) -> Optional[VersionedTask]:
+        return await self.synced(
+            InMemoryTaskManager.update_task, update_task, user_id, expected_version
+        )
+
+    async def delete_task(
+        self, task_id: UUID, user_id: UUID, expected_version: Optional[int] = None
+    ) -> Optional[Task]:
+        return await self.synced(
+            InMemoryTaskManager.delete_task, task_id, user_id, expected_version
+        )
+
+    async def create_tasks(self, create_tasks: List[CreateTask]) -> List[Task]:
+        return await self.synced(InMemoryTaskManager.create_tasks, create_tasks)
+
+    async def update_tasks(
+        self, update_tasks: List[UpdateTask], user_id: UUID
+    ) -> List[Optional[Task]]:
+        return await self.synced(
+            InMemoryTaskManager.update_tasks, update_tasks, user_id
+        )
+
+    async def delete_tasks(
+        self, task_ids: List[UUID], user_id: UUID
+    ) -> List[Optional[Task]]:
+        return await self.synced(InMemoryTaskManager.delete_tasks, task_ids, user_id)
+
+    async def restore_task(self, task_id: UUID, user_id: UUID) -> Optional[Task]:
+        return await self.synced(InMemoryTaskManager.restore_task, task_id, user_id)
+
+    async def restore_tasks(
+        self,
+        user_id: UUID,
+        task_ids: Optional[List[UUID]] = None,
+        deleted_since: Optional[datetime.datetime] = None,
+    ) -> RestoredTasks:
+        return await self.synced(
+            InMemoryTaskManager.restore_tasks, user_id, task_ids, deleted_since
+        )
@@ -10,3 +10,17 @@ class TaskAlreadyExists(Error):
     def __init__(self, task_id: UUID, *args):
         self.task_id = task_id
         super().__init__(*args)
+
+
+class InvalidCursor(Error):
+
+    def __init__(self, cursor: str, *args):
+        self.cursor = cursor
+        super().__init__(*args)
+
+
+class TaskVersionMismatch(Error):
+
+    def __init__(self, task_id: UUID, *args):
+        self.task_id = task_id
+        super().__init__(*args)
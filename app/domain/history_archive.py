@@ -0,0 +1,179 @@
+import asyncio
+import datetime
+import logging
+from contextlib import AbstractContextManager
+from typing import Callable, cast, List, Optional, Sequence
+from uuid import UUID
+
+from pydantic import BaseModel
+from sqlalchemy import ColumnElement, delete, func, select
+from sqlalchemy.dialects.sqlite import insert as sqlite_insert
+from sqlalchemy.orm import Session
+
+from app.domain.task_managers import chunked, history_rowid
+from app.entities import HistoryEntity
+
+logger = logging.getLogger(__name__)
+
+history_table = HistoryEntity.__table__
+
+
+class HistoryRetention(BaseModel):
+    """Which history entries stay in the main database. Entries past either limit
+    are moved to the archive, a limit that is None never moves anything."""
+
+    max_age: Optional[datetime.timedelta] = None
+    # The newest entries of each type kept for an entity
+    max_entries_per_entity: Optional[int] = None
+
+
+class HistoryCompactor:
+    """Moves the history entries outside the retention policy to the archive
+    database.
+
+    Entries are moved a batch at a time. A batch is copied to the archive, then
+    deleted from the main database in its own transaction, so the main database's
+    write lock is only ever held for one batch's delete. If the process stops
+    between the two, the batch is copied again by the next run, which is harmless.
+    """
+
+    def __init__(
+        self,
+        session_factory: Callable[..., AbstractContextManager[Session]],
+        archive_session_factory: Callable[..., AbstractContextManager[Session]],
+        retention: HistoryRetention,
+        batch_size: int = 1000,
+        clock: Optional[Callable[[], datetime.datetime]] = None,
+    ) -> None:
+        if clock is None:
+            # History entries are created with naive local times
+            clock = datetime.datetime.now
+        self.session_factory = session_factory
+        self.archive_session_factory = archive_session_factory
+        self.retention = retention
+        self.batch_size = batch_size
+        self.clock = clock
+
+    def compact(self) -> int:
+        """Archives every entry outside the retention policy, returning how many."""
+        archived = 0
+        if self.retention.max_age is not None:
+            archived += self.archive_expired(self.clock() - self.retention.max_age)
+        if self.retention.max_entries_per_entity is not None:
+            archived += self.archive_excess(self.retention.max_entries_per_entity)
+        return archived
+
+    def archive_expired(self, cutoff: datetime.datetime) -> int:
+        # There is no index on created_at, it would only slow down deletes. The
+        # oldest entries have the lowest rowids, so each batch is found near the
+        # start of the table.
+        statement = (
+            select(HistoryEntity.id)
+            .where(cast(ColumnElement[bool], HistoryEntity.created_at < cutoff))
+            .limit(self.batch_size)
+        )
+        archived = 0
+        while True:
+            with self.session_factory() as session:
+                history_ids = session.execute(statement).scalars().all()
+            if not history_ids:
+                return archived
+            archived += self.archive(history_ids)
+
+    def archive_excess(self, max_entries: int) -> int:
+        with self.session_factory() as session:
+            # Only reads ix_history_user_id_entity_id_type_created_at
+            entities = session.execute(
+                select(
+                    HistoryEntity.user_id, HistoryEntity.entity_id, HistoryEntity.type
+                )
+                .group_by(
+                    HistoryEntity.user_id, HistoryEntity.entity_id, HistoryEntity.type
+                )
+                .having(func.count() > max_entries)
+            ).all()
+
+        archived = 0
+        history_ids: List[UUID] = []
+        for user_id, entity_id, entry_type in entities:
+            with self.session_factory() as session:
+                history_ids.extend(
+                    session.execute(
+                        select(HistoryEntity.id)
+                        .where(
+                            cast(ColumnElement[bool], HistoryEntity.user_id == user_id),
+                            cast(
+                                ColumnElement[bool],
+                                HistoryEntity.entity_id == entity_id,
+                            ),
+                            cast(ColumnElement[bool], HistoryEntity.type == entry_type),
+                        )
+                        .order_by(HistoryEntity.created_at.desc())
+                        .offset(max_entries)
+                    ).scalars()
+                )
+            while len(history_ids) >= self.batch_size:
+                archived += self.archive(history_ids[: self.batch_size])
+                history_ids = history_ids[self.batch_size :]
+        if history_ids:
+            archived += self.archive(history_ids)
+        return archived
+
+    def archive(self, history_ids: Sequence[UUID]) -> int:
+        # A batch can be bigger than the ids allowed in one IN list
+        history_id_chunks = list(chunked(list(history_ids)))
+        with self.session_factory() as session:
+            rows = [
+                row
+                for history_ids_chunk in history_id_chunks
+                for row in session.execute(
+                    select(history_table, history_rowid.label("rowid")).where(
+                        cast(
+                            ColumnElement[bool],
+                            history_table.c.id.in_(history_ids_chunk),
+                        )
+                    )
+                ).mappings()
+            ]
+        # Copied in the order they were made, so the archive's rowids order entries
+        # created at the same time as the main database's do
+        rows.sort(key=lambda row: row["rowid"])
+        entries = [
+            {column: value for column, value in row.items() if column != "rowid"}
+            for row in rows
+        ]
+
+        if entries:
+            archive_session_factory = self.archive_session_factory
+            with archive_session_factory() as archive_session, archive_session.begin():
+                archive_session.execute(
+                    sqlite_insert(history_table).on_conflict_do_nothing(), entries
+                )
+
+        with self.session_factory() as session, session.begin():
+            for history_ids_chunk in history_id_chunks:
+                session.execute(
+                    delete(history_table).where(
+                        cast(
+                            ColumnElement[bool],
+                            history_table.c.id.in_(history_ids_chunk),
+                        )
+                    )
+                )
+        return len(entries)
+
+
+async def run_history_compaction(compactor: HistoryCompactor, interval: float) -> None:
+    """Compacts the history every interval seconds until cancelled.
+
+    Each compaction runs in a worker thread, so its database IO doesn't block the
+    event loop.
+    """
+    while True:
+        await asyncio.sleep(interval)
+        try:
+            archived = await asyncio.to_thread(compactor.compact)
+        except Exception:
+            logger.exception("History compaction failed")
+        else:
+            logger.info("Archived %d history entries", archived)
@@ -0,0 +1,170 @@
+import datetime
+import time
+from typing import AsyncIterator, Awaitable, List, Optional, TypeVar
+from uuid import UUID
+
+from app.domain.async_task_managers import AsyncTaskManager
+from app.domain.models import (
+    CreateTask,
+    HistoryEntry,
+    RestoredTasks,
+    Task,
+    TaskPage,
+    TaskQuery,
+    UpdateTask,
+    VersionedTask,
+)
+from app.metrics import Metrics
+
+T = TypeVar("T")
+
+
+class InstrumentedAsyncTaskManager(AsyncTaskManager):
+    """Wraps an AsyncTaskManager, recording how long each method takes and the
+    exceptions it raises, labelled by name."""
+
+    def __init__(self, task_manager: AsyncTaskManager, metrics: Metrics, name: str):
+        self.task_manager = task_manager
+        self.metrics = metrics
+        self.name = name
+
+    async def timed(self, method: str, call: Awaitable[T]) -> T:
+        start = time.perf_counter()
+        try:
+            return await call
+        except Exception as error:
+            self.metrics.task_manager_errors.inc(
+                (self.name, method, type(error).__name__)
+            )
+            raise
+        finally:
+            self.metrics.task_manager_seconds.observe(
+                (self.name, method), time.perf_counter() - start
+            )
+
+    async def create_task(self, create_task: CreateTask) -> Optional[Task]:
+        return await self.timed(
+            "create_task", self.task_manager.create_task(create_task)
+        )
+
+    async def get_task(self, task_id: UUID, user_id: UUID) -> Optional[Task]:
+        return await self.timed(
+            "get_task", self.task_manager.get_task(task_id, user_id)
+        )
+
+    async def get_tasks(
+        self, user_id: UUID, query: Optional[TaskQuery] = None
+    ) -> List[Task]:
+        return await self.timed(
+            "get_tasks", self.task_manager.get_tasks(user_id, query)
+        )
+
+    async def iter_tasks(self, user_id: UUID) -> AsyncIterator[Task]:
+        # Timed until every task has been read, which is how long the export
+        # streams for
+        start = time.perf_counter()
+        try:
+            async for task in self.task_manager.iter_tasks(user_id):
+                yield task
+        except Exception as error:
+            self.metrics.task_manager_errors.inc(
+                (self.name, "iter_tasks", type(error).__name__)
+            )
+            raise
+        finally:
+            self.metrics.task_manager_seconds.observe(
+                (self.name, "iter_tasks"), time.perf_counter() - start
+            )
+
+    async def get_tasks_page(
+        self,
+        user_id: UUID,
+        limit: int,
+        cursor: Optional[str] = None,
+        query: Optional[TaskQuery] = None,
+    ) -> TaskPage:
+        return await self.timed(
+            "get_tasks_page",
+            self.task_manager.get_tasks_page(user_id, limit, cursor, query),
+        )
+
+    async def get_task_version(self, task_id: UUID, user_id: UUID) -> Optional[int]:
+        return await self.timed(
+            "get_task_version", self.task_manager.get_task_version(task_id, user_id)
+        )
+
+    async def get_tasks_version(self, user_id: UUID) -> int:
+        return await self.timed(
+            "get_tasks_version", self.task_manager.get_tasks_version(user_id)
+        )
+
+    async def update_task(
+        self,
+        update_task: UpdateTask,
+        user_id: UUID,
+        expected_version: Optional[int] = None,
+    ) -> Optional[VersionedTask]:
+        return await self.timed(
+            "update_task",
+            self.task_manager.update_task(update_task, user_id, expected_version),
+        )
+
+    async def delete_task(
+        self, task_id: UUID, user_id: UUID, expected_version: Optional[int] = None
+    ) -> Optional[Task]:
+        return await self.timed(
+            "delete_task",
+            self.task_manager.delete_task(task_id, user_id, expected_version),
+        )
+
+    async def create_tasks(self, create_tasks: List[CreateTask]) -> List[Task]:
+        return await self.timed(
+            "create_tasks", self.task_manager.create_tasks(create_tasks)
+        )
+
+    async def update_tasks(
+        self, update_tasks: List[UpdateTask], user_id: UUID
+    ) -> List[Optional[Task]]:
+        return await self.timed(
+            "update_tasks", self.task_manager.update_tasks(update_tasks, user_id)
+        )
+
+    async def delete_tasks(
+        self, task_ids: List[UUID], user_id: UUID
+    ) -> List[Optional[Task]]:
+        return await self.timed(
+            "delete_tasks", self.task_manager.delete_tasks(task_ids, user_id)
+        )
+
+    async def get_last_history_entry(
+        self, task_id: UUID, user_id: UUID
+    ) -> Optional[HistoryEntry]:
+        return await self.timed(
+            "get_last_history_entry",
+            self.task_manager.get_last_history_entry(task_id, user_id),
+        )
+
+    async def restore_task(self, task_id: UUID, user_id: UUID) -> Optional[Task]:
+        return await self.timed(
+            "restore_task", self.task_manager.restore_task(task_id, user_id)
+        )
+
+    async def restore_tasks(
+        self,
+        user_id: UUID,
+        task_ids: Optional[List[UUID]] = None,
+        deleted_since: Optional[datetime.datetime] = None,
+    ) -> RestoredTasks:
+        return await self.timed(
+            "restore_tasks",
+            self.task_manager.restore_tasks(user_id, task_ids, deleted_since),
+        )
+
+
+def instrument_task_manager(
+    task_manager: AsyncTaskManager, metrics: Metrics, enabled: bool, name: str
+) -> AsyncTaskManager:
+    """The task manager, wrapped to record metrics when they are enabled."""
+    if not enabled:
+        return task_manager
+    return InstrumentedAsyncTaskManager(task_manager, metrics, name)
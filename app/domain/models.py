@@ -23,6 +23,57 @@ class Task(BaseModel):
     user_id: UUID
 
 
+class TaskSortField(str, Enum):
+    # The order tasks were created in
+    CREATED = "created"
+    # Tasks without a due date come last
+    DUE_DATE = "due_date"
+    NAME = "name"
+    # Alphabetically, Blocked, Doing, Done then Pending
+    STATUS = "status"
+
+
+class TaskQuery(BaseModel):
+    """Which of a user's tasks to return and in what order. Every filter that is
+    set has to match, filters left empty match every task."""
+
+    statuses: Set[TaskStatus] = set()
+    # Tasks with at least one of these labels
+    labels_any: Set[str] = set()
+    # Tasks with every one of these labels
+    labels_all: Set[str] = set()
+    # Inclusive due date window, tasks without a due date never match
+    due_after: Optional[date] = None
+    due_before: Optional[date] = None
+    # Tasks due before today that aren't done
+    overdue: bool = False
+    sort: TaskSortField = TaskSortField.CREATED
+
+
+class TaskPage(BaseModel):
+    tasks: List[Task]
+    # None when this is the last page
+    next_cursor: Optional[str] = None
+
+
+class RestoredTasks(BaseModel):
+    """What TaskManager.restore_tasks did, with the tasks in the order they were
+    deleted."""
+
+    restored: List[Task] = []
+    # Deleted tasks that weren't restored because a task with their id exists,
+    # as they were when they were deleted
+    conflicts: List[Task] = []
+
+
+class VersionedTask(BaseModel):
+    """A written task with the version the write gave it, see
+    TaskManager.get_task_version."""
+
+    task: Task
+    version: int
+
+
 class CreateTask(BaseModel):
     name: str
     status: TaskStatus = TaskStatus.PENDING
@@ -52,6 +103,7 @@ class HistoryEntryVersion(Enum):
 class HistoryEntry(BaseModel):
     id: UUID
     entity_id: UUID
+    user_id: UUID
     type: HistoryEntryType = (HistoryEntryType.TASK_DELETED,)
     version: HistoryEntryVersion
     event: Any
@@ -0,0 +1,53 @@
+import base64
+import binascii
+import json
+from typing import Any, List, Optional, Sequence, Tuple, TypeVar
+
+from app.domain.errors import InvalidCursor
+
+DEFAULT_PAGE_SIZE = 100
+MAX_PAGE_SIZE = 1000
+
+T = TypeVar("T")
+
+
+def encode_cursor(position: List[Any]) -> str:
+    """Encode the position of the last task on a page as an opaque cursor.
+
+    Clients should only ever pass a cursor back, so the format is free to change.
+    """
+    payload = json.dumps(position, separators=(",", ":")).encode()
+    return base64.urlsafe_b64encode(payload).decode()
+
+
+def decode_cursor(cursor: str, *types: type) -> List[Any]:
+    """Decode a cursor made by encode_cursor, checking each value in the position
+    is an instance of the matching type."""
+    try:
+        position = json.loads(base64.urlsafe_b64decode(cursor.encode()))
+    except (binascii.Error, UnicodeDecodeError, ValueError):
+        raise InvalidCursor(cursor)
+
+    if not isinstance(position, list) or len(position) != len(types):
+        raise InvalidCursor(cursor)
+    for value, value_type in zip(position, types):
+        # bool is a subclass of int, but never a valid position
+        if not isinstance(value, value_type) or isinstance(value, bool):
+            raise InvalidCursor(cursor)
+
+    return position
+
+
+def paginate(
+    rows: Sequence[Tuple[T, List[Any]]], limit: int
+) -> Tuple[List[T], Optional[str]]:
+    """Split limit + 1 rows of (item, position) into a page and the next cursor.
+
+    Fetching one row more than the limit tells whether there is a next page
+    without a separate count.
+    """
+    items = [item for item, _ in rows[:limit]]
+    if len(rows) <= limit:
+        return items, None
+    _, position = rows[limit - 1]
+    return items, encode_cursor(position)
@@ -0,0 +1,228 @@
+import asyncio
+import datetime
+import hashlib
+from typing import AsyncIterator, cast, Dict, Iterator, List, Optional, Sequence
+from uuid import UUID
+
+from app.domain.async_task_managers import AsyncTaskManager
+from app.domain.models import (
+    CreateTask,
+    HistoryEntry,
+    RestoredTasks,
+    Task,
+    TaskPage,
+    TaskQuery,
+    UpdateTask,
+    VersionedTask,
+)
+from app.domain.task_managers import TaskManager
+
+
+def shard_index(user_id: UUID, shard_count: int) -> int:
+    """The shard a user's tasks are stored on. The id is hashed rather than used
+    as it is, so users are spread evenly whatever version of uuid they have."""
+    digest = hashlib.blake2b(user_id.bytes, digest_size=8).digest()
+    return int.from_bytes(digest, "big") % shard_count
+
+
+def group_by_shard(
+    create_tasks: List[CreateTask], shard_count: int
+) -> Dict[int, List[int]]:
+    """The positions of the create tasks that go to each shard."""
+    positions: Dict[int, List[int]] = {}
+    for position, create_task in enumerate(create_tasks):
+        positions.setdefault(shard_index(create_task.user_id, shard_count), []).append(
+            position
+        )
+    return positions
+
+
+class ShardedTaskManager(TaskManager):
+    """Stores each user's tasks in one of several task managers, picked by
+    shard_index.
+
+    With a SqliteTaskManager per database file, writes for users on different
+    shards don't wait on each other's write lock. Everything a user does stays
+    on one shard, so only create_tasks with tasks for several users writes to
+    more than one, and it is only atomic per shard.
+
+    Changing the shards moves most users to a different shard, so the data has
+    to be moved first with python -m app.reshard.
+    """
+
+    def __init__(self, shards: Sequence[TaskManager]) -> None:
+        self.shards = shards
+
+    def shard(self, user_id: UUID) -> TaskManager:
+        return self.shards[shard_index(user_id, len(self.shards))]
+
+    def create_task(self, create_task: CreateTask) -> Optional[Task]:
+        return self.shard(create_task.user_id).create_task(create_task)
+
+    def get_task(self, task_id: UUID, user_id: UUID) -> Optional[Task]:
+        return self.shard(user_id).get_task(task_id, user_id)
+
+    def get_tasks(self, user_id: UUID, query: Optional[TaskQuery] = None) -> List[Task]:
+        return self.shard(user_id).get_tasks(user_id, query)
+
+    def iter_tasks(self, user_id: UUID) -> Iterator[Task]:
+        return self.shard(user_id).iter_tasks(user_id)
+
+    def get_tasks_page(
+        self,
+        user_id: UUID,
+        limit: int,
+        cursor: Optional[str] = None,
+        query: Optional[TaskQuery] = None,
+    ) -> TaskPage:
+        return self.shard(user_id).get_tasks_page(user_id, limit, cursor, query)
+
+    def get_task_version(self, task_id: UUID, user_id: UUID) -> Optional[int]:
+        return self.shard(user_id).get_task_version(task_id, user_id)
+
+    def get_tasks_version(self, user_id: UUID) -> int:
+        return self.shard(user_id).get_tasks_version(user_id)
+
+    def update_task(
+        self,
+        update_task: UpdateTask,
+        user_id: UUID,
+        expected_version: Optional[int] = None,
+    ) -> Optional[VersionedTask]:
+        return self.shard(user_id).update_task(update_task, user_id, expected_version)
+
+    def delete_task(
+        self, task_id: UUID, user_id: UUID, expected_version: Optional[int] = None
+    ) -> Optional[Task]:
+        return self.shard(user_id).delete_task(task_id, user_id, expected_version)
+
+    def create_tasks(self, create_tasks: List[CreateTask]) -> List[Task]:
+        tasks: List[Optional[Task]] = [None] * len(create_tasks)
+        for index, positions in group_by_shard(create_tasks, len(self.shards)).items():
+            created_tasks = self.shards[index].create_tasks(
+                [create_tasks[position] for position in positions]
+            )
+            for position, task in zip(positions, created_tasks):
+                tasks[position] = task
+        return cast(List[Task], tasks)
+
+    def update_tasks(
+        self, update_tasks: List[UpdateTask], user_id: UUID
+    ) -> List[Optional[Task]]:
+        return self.shard(user_id).update_tasks(update_tasks, user_id)
+
+    def delete_tasks(self, task_ids: List[UUID], user_id: UUID) -> List[Optional[Task]]:
+        return self.shard(user_id).delete_tasks(task_ids, user_id)
+
+    def get_last_history_entry(
+        self, task_id: UUID, user_id: UUID
+    ) -> Optional[HistoryEntry]:
+        return self.shard(user_id).get_last_history_entry(task_id, user_id)
+
+    def restore_task(self, task_id: UUID, user_id: UUID) -> Optional[Task]:
+        return self.shard(user_id).restore_task(task_id, user_id)
+
+    def restore_tasks(
+        self,
+        user_id: UUID,
+        task_ids: Optional[List[UUID]] = None,
+        deleted_since: Optional[datetime.datetime] = None,
+    ) -> RestoredTasks:
+        return self.shard(user_id).restore_tasks(user_id, task_ids, deleted_since)
+
+
+class AsyncShardedTaskManager(AsyncTaskManager):
+    """The asyncio counterpart of ShardedTaskManager, which also writes the
+    shards of a create_tasks concurrently."""
+
+    def __init__(self, shards: Sequence[AsyncTaskManager]) -> None:
+        self.shards = shards
+
+    def shard(self, user_id: UUID) -> AsyncTaskManager:
+        return self.shards[shard_index(user_id, len(self.shards))]
+
+    async def create_task(self, create_task: CreateTask) -> Optional[Task]:
+        return await self.shard(create_task.user_id).create_task(create_task)
+
+    async def get_task(self, task_id: UUID, user_id: UUID) -> Optional[Task]:
+        return await self.shard(user_id).get_task(task_id, user_id)
+
+    async def get_tasks(
+        self, user_id: UUID, query: Optional[TaskQuery] = None
+    ) -> List[Task]:
+        return await self.shard(user_id).get_tasks(user_id, query)
+
+    def iter_tasks(self, user_id: UUID) -> AsyncIterator[Task]:
+        return self.shard(user_id).iter_tasks(user_id)
+
+    async def get_tasks_page(
+        self,
+        user_id: UUID,
+        limit: int,
+        cursor: Optional[str] = None,
+        query: Optional[TaskQuery] = None,
+    ) -> TaskPage:
+        return await self.shard(user_id).get_tasks_page(user_id, limit, cursor, query)
+
+    async def get_task_version(self, task_id: UUID, user_id: UUID) -> Optional[int]:
+        return await self.shard(user_id).get_task_version(task_id, user_id)
+
+    async def get_tasks_version(self, user_id: UUID) -> int:
+        return await self.shard(user_id).get_tasks_version(user_id)
+
+    async def update_task(
+        self,
+        update_task: UpdateTask,
+        user_id: UUID,
+        expected_version: Optional[int] = None,
+    ) -> Optional[VersionedTask]:
+        return await self.shard(user_id).update_task(
+            update_task, user_id, expected_version
+        )
+
+    async def delete_task(
+        self, task_id: UUID, user_id: UUID, expected_version: Optional[int] = None
+    ) -> Optional[Task]:
+        return await self.shard(user_id).delete_task(task_id, user_id, expected_version)
+
+    async def create_tasks(self, create_tasks: List[CreateTask]) -> List[Task]:
+        shard_positions = group_by_shard(create_tasks, len(self.shards))
+        shard_tasks = await asyncio.gather(
+            *(
+                self.shards[index].create_tasks(
+                    [create_tasks[position] for position in positions]
+                )
+                for index, positions in shard_positions.items()
+            )
+        )
+        tasks: List[Optional[Task]] = [None] * len(create_tasks)
+        for positions, created_tasks in zip(shard_positions.values(), shard_tasks):
+            for position, task in zip(positions, created_tasks):
+                tasks[position] = task
+        return cast(List[Task], tasks)
+
+    async def update_tasks(
+        self, update_tasks: List[UpdateTask], user_id: UUID
+    ) -> List[Optional[Task]]:
+        return await self.shard(user_id).update_tasks(update_tasks, user_id)
+
+    async def delete_tasks(
+        self, task_ids: List[UUID], user_id: UUID
+    ) -> List[Optional[Task]]:
+        return await self.shard(user_id).delete_tasks(task_ids, user_id)
+
+    async def get_last_history_entry(
+        self, task_id: UUID, user_id: UUID
+    ) -> Optional[HistoryEntry]:
+        return await self.shard(user_id).get_last_history_entry(task_id, user_id)
+
+    async def restore_task(self, task_id: UUID, user_id: UUID) -> Optional[Task]:
+        return await self.shard(user_id).restore_task(task_id, user_id)
+
+    async def restore_tasks(
+        self,
+        user_id: UUID,
+        task_ids: Optional[List[UUID]] = None,
+        deleted_since: Optional[datetime.datetime] = None,
+    ) -> RestoredTasks:
+        return await self.shard(user_id).restore_tasks(user_id, task_ids, deleted_since)
@@ -1,23 +1,67 @@
 import abc
 import datetime
 import json
-from contextlib import AbstractContextManager
-from typing import Callable, cast, Dict, List, Optional, Set
+from array import array
+from bisect import bisect_left, bisect_right, insort
+from contextlib import AbstractContextManager, contextmanager
+from typing import (
+    Any,
+    Callable,
+    cast,
+    Dict,
+    FrozenSet,
+    Hashable,
+    Iterable,
+    Iterator,
+    List,
+    Optional,
+    Set,
+    Tuple,
+    TypeVar,
+    Union,
+)
 from uuid import UUID, uuid4
 
-from sqlalchemy import ColumnElement, delete, insert, select
-from sqlalchemy.orm import Session
-
-from app.entities import HistoryEntity, LabelEntity, TaskEntity
+from sqlalchemy import (
+    ColumnElement,
+    delete,
+    func,
+    insert,
+    Integer,
+    literal_column,
+    Row,
+    select,
+    Select,
+    String,
+    tuple_,
+    update,
+)
+from sqlalchemy.dialects.sqlite import insert as sqlite_insert
+from sqlalchemy.orm import Session, selectinload
+
+from app.entities import (
+    HistoryEntity,
+    LabelEntity,
+    TaskEntity,
+    task_label_table,
+    TasksVersionEntity,
+)
 from app.domain.models import (
     CreateTask,
     Task,
     UpdateTask,
+    VersionedTask,
     HistoryEntry,
     HistoryEntryType,
     HistoryEntryVersion,
+    RestoredTasks,
+    TaskPage,
+    TaskQuery,
+    TaskSortField,
+    TaskStatus,
 )
-from app.domain.errors import TaskAlreadyExists
+from app.domain.errors import InvalidCursor, TaskAlreadyExists, TaskVersionMismatch
+from app.domain.pagination import decode_cursor, paginate
 
 
 class TaskManager(metaclass=abc.ABCMeta):
@@ -31,15 +75,78 @@ class TaskManager(metaclass=abc.ABCMeta):
         pass
 
     @abc.abstractmethod
-    def get_tasks(self, user_id: UUID) -> List[Task]:
+    def get_tasks(self, user_id: UUID, query: Optional[TaskQuery] = None) -> List[Task]:
+        pass
+
+    @abc.abstractmethod
+    def iter_tasks(self, user_id: UUID) -> Iterator[Task]:
+        """Every one of the user's tasks, in the order they were created. The tasks
+        are produced as they are iterated, so memory stays constant however many
+        tasks the user has."""
+        pass
+
+    @abc.abstractmethod
+    def get_tasks_page(
+        self,
+        user_id: UUID,
+        limit: int,
+        cursor: Optional[str] = None,
+        query: Optional[TaskQuery] = None,
+    ) -> TaskPage:
+        """Returns up to limit of the tasks matching the query, starting after the
+        task the cursor points at. Raises InvalidCursor if the cursor can't be
+        decoded or came from a differently sorted page."""
+        pass
+
+    @abc.abstractmethod
+    def get_task_version(self, task_id: UUID, user_id: UUID) -> Optional[int]:
+        """The task's version, which changes whenever the task is written. None if
+        the task doesn't exist."""
+        pass
+
+    @abc.abstractmethod
+    def get_tasks_version(self, user_id: UUID) -> int:
+        """The version of the user's tasks, which changes whenever any of them is
+        written."""
+        pass
+
+    @abc.abstractmethod
+    def update_task(
+        self,
+        update_task: UpdateTask,
+        user_id: UUID,
+        expected_version: Optional[int] = None,
+    ) -> Optional[VersionedTask]:
+        """Returns the updated task with its new version, from the same write. Raises
+        TaskVersionMismatch if expected_version is given and the task is at a
+        different version."""
         pass
 
     @abc.abstractmethod
-    def update_task(self, update_task: UpdateTask, user_id: UUID) -> Optional[Task]:
+    def delete_task(
+        self, task_id: UUID, user_id: UUID, expected_version: Optional[int] = None
+    ) -> Optional[Task]:
+        """Raises TaskVersionMismatch if expected_version is given and the task is
+        at a different version."""
         pass
 
     @abc.abstractmethod
-    def delete_task(self, task_id: UUID, user_id: UUID) -> Optional[Task]:
+    def create_tasks(self, create_tasks: List[CreateTask]) -> List[Task]:
+        """Creates all of the tasks at once, in the order given."""
+        pass
+
+    @abc.abstractmethod
+    def update_tasks(
+        self, update_tasks: List[UpdateTask], user_id: UUID
+    ) -> List[Optional[Task]]:
+        """Updates all of the tasks at once. The result for each update is in the
+        same position as the update, and is None if the task wasn't found."""
+        pass
+
+    @abc.abstractmethod
+    def delete_tasks(self, task_ids: List[UUID], user_id: UUID) -> List[Optional[Task]]:
+        """Deletes all of the tasks at once. The result for each id is in the same
+        position as the id, and is None if the task wasn't found."""
         pass
 
     @abc.abstractmethod
@@ -52,10 +159,286 @@ class TaskManager(metaclass=abc.ABCMeta):
     def restore_task(self, task_id: UUID, user_id: UUID) -> Optional[Task]:
         pass
 
+    @abc.abstractmethod
+    def restore_tasks(
+        self,
+        user_id: UUID,
+        task_ids: Optional[List[UUID]] = None,
+        deleted_since: Optional[datetime.datetime] = None,
+    ) -> RestoredTasks:
+        """Restores the user's deleted tasks with the given ids that were deleted
+        since deleted_since, all at once. Either filter left as None matches every
+        deleted task. A task is restored as it was when it was last deleted, unless
+        a task with its id exists, when it is a conflict instead."""
+        pass
+
+
+# How many tasks iter_tasks reads at a time
+ITER_TASKS_CHUNK_SIZE = 1000
+# How many ids go in one IN list, which keeps statements under the 999 bound
+# parameters older versions of sqlite allow
+IN_CHUNK_SIZE = 900
+# Sorting tasks without a due date on this date puts them last
+NO_DUE_DATE = datetime.date.max.isoformat()
+
+
+def sort_position(
+    task: Union[Task, "TaskRecord"], position: int, sort: TaskSortField
+) -> List[Any]:
+    """The keyset position of a task in the given sort order.
+
+    This is the sort field, the value sorted on and the task's insertion position
+    to break ties. It is what a cursor encodes, and is the same for every task
+    manager so the tasks come back in the same order.
+    """
+    if sort == TaskSortField.CREATED:
+        return [sort.value, position]
+    if sort == TaskSortField.DUE_DATE:
+        value = task.due_date.isoformat() if task.due_date else NO_DUE_DATE
+    elif sort == TaskSortField.NAME:
+        value = task.name
+    else:
+        value = task.status.name
+    return [sort.value, value, position]
+
+
+def decode_position(cursor: str, sort: TaskSortField) -> List[Any]:
+    if sort == TaskSortField.CREATED:
+        position = decode_cursor(cursor, str, int)
+    else:
+        position = decode_cursor(cursor, str, str, int)
+    if position[0] != sort.value:
+        raise InvalidCursor(cursor)
+
+    if sort == TaskSortField.DUE_DATE:
+        try:
+            datetime.date.fromisoformat(position[1])
+        except ValueError:
+            raise InvalidCursor(cursor)
+    elif sort == TaskSortField.STATUS and position[1] not in TaskStatus.__members__:
+        raise InvalidCursor(cursor)
+    return position
+
+
+def task_matches(
+    task: Union[Task, "TaskRecord"], query: TaskQuery, today: datetime.date
+) -> bool:
+    if query.statuses and task.status not in query.statuses:
+        return False
+    if query.labels_any and query.labels_any.isdisjoint(task.labels):
+        return False
+    if query.labels_all and not query.labels_all <= task.labels:
+        return False
+    if query.due_after is not None and (
+        task.due_date is None or task.due_date < query.due_after
+    ):
+        return False
+    if query.due_before is not None and (
+        task.due_date is None or task.due_date > query.due_before
+    ):
+        return False
+    if query.overdue and (
+        task.due_date is None
+        or task.due_date >= today
+        or task.status == TaskStatus.DONE
+    ):
+        return False
+    return True
+
+
+H = TypeVar("H", bound=Hashable)
+K = TypeVar("K")
+T = TypeVar("T")
+
+
+class TaskRecord:
+    """How InMemoryTaskManager stores a task, a fraction of the size of a Task.
+
+    The user id is what the record is stored under, so it isn't kept again. Labels
+    and sub tasks are immutable so equal values can be shared between records.
+    """
+
+    __slots__ = (
+        "id",
+        "name",
+        "status",
+        "labels",
+        "due_date",
+        "sub_tasks",
+        "position",
+        "version",
+    )
+
+    def __init__(
+        self,
+        id: UUID,
+        name: str,
+        status: TaskStatus,
+        labels: FrozenSet[str],
+        due_date: Optional[datetime.date],
+        sub_tasks: Tuple[Any, ...],
+        position: int,
+        version: int,
+    ):
+        self.id = id
+        self.name = name
+        self.status = status
+        self.labels = labels
+        self.due_date = due_date
+        self.sub_tasks = sub_tasks
+        self.position = position
+        self.version = version
+
+    def to_task(self, user_id: UUID) -> Task:
+        # The fields were validated before they were stored
+        return Task.model_construct(
+            id=self.id,
+            name=self.name,
+            status=self.status,
+            labels=set(self.labels),
+            due_date=self.due_date,
+            sub_tasks=list(self.sub_tasks),
+            user_id=user_id,
+        )
+
+
+class TaskOrder:
+    """A user's task ids in the order they were stored. Their positions are kept in
+    a parallel array of machine ints, so seeking to a position is a binary search
+    without a tuple and an int object per task."""
+
+    __slots__ = ("positions", "task_ids")
+
+    def __init__(self) -> None:
+        self.positions = array("q")
+        self.task_ids: List[UUID] = []
+
+    def __len__(self) -> int:
+        return len(self.task_ids)
+
+    def append(self, position: int, task_id: UUID) -> None:
+        # Positions only increase, so appending keeps the array sorted
+        self.positions.append(position)
+        self.task_ids.append(task_id)
+
+    def remove(self, position: int) -> None:
+        index = bisect_left(self.positions, position)
+        del self.positions[index]
+        del self.task_ids[index]
+
+    def after(self, position: int) -> int:
+        """The index of the first task stored after the position."""
+        return bisect_right(self.positions, position)
+
+
+def discard(index: Dict[K, Set[UUID]], key: K, task_id: UUID) -> bool:
+    """Removes a task id from an index, and the key once no task has it. Returns
+    whether the key was removed."""
+    task_ids = index[key]
+    task_ids.discard(task_id)
+    if task_ids:
+        return False
+    del index[key]
+    return True
+
+
+class TaskIndexes:
+    """A user's task ids by status, label and due date, so a query only looks at
+    the tasks that can match it rather than all of the user's tasks."""
+
+    __slots__ = ("statuses", "labels", "due_dates", "sorted_due_dates")
+
+    def __init__(self) -> None:
+        self.statuses: Dict[TaskStatus, Set[UUID]] = {}
+        self.labels: Dict[str, Set[UUID]] = {}
+        self.due_dates: Dict[datetime.date, Set[UUID]] = {}
+        # The keys of due_dates in order, for finding the dates in a range
+        self.sorted_due_dates: List[datetime.date] = []
+
+    def add(self, record: TaskRecord) -> None:
+        self.statuses.setdefault(record.status, set()).add(record.id)
+        for label in record.labels:
+            self.labels.setdefault(label, set()).add(record.id)
+        if record.due_date is not None:
+            if record.due_date not in self.due_dates:
+                self.due_dates[record.due_date] = set()
+                insort(self.sorted_due_dates, record.due_date)
+            self.due_dates[record.due_date].add(record.id)
+
+    def remove(self, record: TaskRecord) -> None:
+        discard(self.statuses, record.status, record.id)
+        for label in record.labels:
+            discard(self.labels, label, record.id)
+        if record.due_date is not None and discard(
+            self.due_dates, record.due_date, record.id
+        ):
+            del self.sorted_due_dates[
+                bisect_left(self.sorted_due_dates, record.due_date)
+            ]
+
+    def candidates(self, query: TaskQuery, today: datetime.date) -> Optional[Set[UUID]]:
+        """The ids of the tasks that could match the query, or None if no index
+        applies to it.
+
+        Each filter with an index gives a union or intersection of id sets, and
+        the one with the fewest ids is used. The candidates still have to be
+        checked against the whole query.
+        """
+        # (how many ids at most, the sets, whether to intersect rather than union)
+        lookups: List[Tuple[int, List[Set[UUID]], bool]] = []
+
+        def union(task_id_sets: List[Set[UUID]]) -> None:
+            lookups.append((sum(map(len, task_id_sets)), task_id_sets, False))
+
+        if query.statuses:
+            union([self.statuses.get(status, set()) for status in query.statuses])
+        if query.labels_any:
+            union([self.labels.get(label, set()) for label in query.labels_any])
+        if query.labels_all:
+            task_id_sets = [self.labels.get(label, set()) for label in query.labels_all]
+            lookups.append((min(map(len, task_id_sets)), task_id_sets, True))
+        if query.due_after is not None or query.due_before is not None or query.overdue:
+            start = 0
+            end = len(self.sorted_due_dates)
+            if query.due_after is not None:
+                start = bisect_left(self.sorted_due_dates, query.due_after)
+            if query.due_before is not None:
+                end = bisect_right(self.sorted_due_dates, query.due_before)
+            if query.overdue:
+                end = min(end, bisect_left(self.sorted_due_dates, today))
+            union(
+                [
+                    self.due_dates[due_date]
+                    for due_date in self.sorted_due_dates[start:end]
+                ]
+            )
+
+        if not lookups:
+            return None
+        _, task_id_sets, intersect = min(lookups, key=lambda lookup: lookup[0])
+        if intersect:
+            return set.intersection(*sorted(task_id_sets, key=len))
+        return set().union(*task_id_sets)
+
 
 class InMemoryTaskManager(TaskManager):
-    tasks: Dict[UUID, Dict[UUID, Task]]
+    tasks: Dict[UUID, Dict[UUID, TaskRecord]]
     history: Dict[UUID, Dict[UUID, List[HistoryEntry]]] = {}
+    # Each stored task gets an increasing position, and every user's task ids are
+    # kept in position order so that a page can seek to its cursor with a binary
+    # search instead of walking the user's tasks.
+    task_order: Dict[UUID, TaskOrder]
+    indexes: Dict[UUID, TaskIndexes]
+    # See SqliteTaskManager for how tasks are versioned
+    tasks_versions: Dict[UUID, int]
+    # Labels, label sets and due dates repeat across tasks, so records share one
+    # copy of each. Entries are never removed, there are only as many as there
+    # are distinct values.
+    interned: Dict[Any, Any]
+    # Kept as tasks and history entries are stored, so they are read without
+    # walking every user's tasks
+    task_count: int
+    history_entry_count: int
 
     def __init__(
         self,
@@ -66,90 +449,304 @@ class InMemoryTaskManager(TaskManager):
             tasks = {}
         if history is None:
             history = {}
-        self.tasks = tasks
+        self.tasks = {}
+        # The latest entry is last, see delete_task
+        for user_history in history.values():
+            for task_history in user_history.values():
+                task_history.sort(key=lambda entry: entry.created_at)
         self.history = history
+        self.task_count = 0
+        self.history_entry_count = sum(
+            len(task_history)
+            for user_history in history.values()
+            for task_history in user_history.values()
+        )
+        self.task_order = {}
+        self.indexes = {}
+        self.next_position = 0
+        self.tasks_versions = {}
+        self.interned = {}
+        for user_id, user_tasks in tasks.items():
+            for task in user_tasks.values():
+                self.store(task.id, task, user_id)
+
+    def intern(self, value: H) -> H:
+        return self.interned.setdefault(value, value)
+
+    def store(
+        self, task_id: UUID, task: Union[CreateTask, Task], user_id: UUID
+    ) -> TaskRecord:
+        """Stores a new task after the user's other tasks."""
+        position = self.next_position
+        self.next_position += 1
+        record = self.make_record(
+            task_id, task, position, self.increment_tasks_version(user_id)
+        )
+        self.store_record(user_id, record)
+        return record
+
+    def store_record(self, user_id: UUID, record: TaskRecord) -> None:
+        """Stores a record positioned after the user's other tasks."""
+        self.tasks.setdefault(user_id, {})[record.id] = record
+        self.task_count += 1
+        self.task_order.setdefault(user_id, TaskOrder()).append(
+            record.position, record.id
+        )
+        self.indexes.setdefault(user_id, TaskIndexes()).add(record)
+
+    def replace(
+        self, user_id: UUID, record: TaskRecord, task: Union[UpdateTask, Task]
+    ) -> TaskRecord:
+        """Replaces a stored task with a new version of it, in the same position."""
+        updated_record = self.make_record(
+            record.id, task, record.position, self.increment_tasks_version(user_id)
+        )
+        self.tasks[user_id][record.id] = updated_record
+        self.indexes[user_id].remove(record)
+        self.indexes[user_id].add(updated_record)
+        return updated_record
 
-    def create_task(self, create_task: CreateTask) -> Optional[Task]:
-        task = Task(
-            id=uuid4(),
-            name=create_task.name,
-            status=create_task.status,
-            labels=create_task.labels,
-            due_date=create_task.due_date,
-            sub_tasks=create_task.sub_tasks,
-            user_id=create_task.user_id,
+    def remove(
+        self,
+        user_id: UUID,
+        record: TaskRecord,
+        history_entry_id: UUID,
+        deleted_at: datetime.datetime,
+    ) -> Task:
+        """Removes a stored task, recording it in the task's history."""
+        del self.tasks[user_id][record.id]
+        self.task_count -= 1
+        self.task_order[user_id].remove(record.position)
+        self.indexes[user_id].remove(record)
+        self.increment_tasks_version(user_id)
+        deleted_task = record.to_task(user_id)
+
+        history_entry = HistoryEntry(
+            id=history_entry_id,
+            entity_id=record.id,
+            user_id=user_id,
+            type=HistoryEntryType.TASK_DELETED,
+            version=HistoryEntryVersion.TASK,
+            event=deleted_task.model_dump_json(),
+            created_at=deleted_at,
         )
-        user_tasks = self.tasks.get(task.user_id, None)
-        if user_tasks is None:
-            self.tasks.update({task.user_id: {task.id: task}})
-        else:
-            user_tasks.update({task.id: task})
 
-        return task
+        # Entries are appended as they are made, so each list stays in created
+        # order. The task moves to the end of the user's history, which keeps the
+        # tasks in the order of their latest entries.
+        user_history = self.history.setdefault(user_id, {})
+        task_history = user_history.pop(record.id, [])
+        task_history.append(history_entry)
+        user_history[record.id] = task_history
+        self.history_entry_count += 1
+
+        return deleted_task
+
+    def make_record(
+        self,
+        task_id: UUID,
+        task: Union[CreateTask, UpdateTask, Task],
+        position: int,
+        version: int,
+    ) -> TaskRecord:
+        return TaskRecord(
+            id=task_id,
+            name=task.name,
+            status=task.status,
+            labels=self.intern(frozenset(self.intern(label) for label in task.labels)),
+            due_date=self.intern(task.due_date),
+            sub_tasks=tuple(task.sub_tasks),
+            position=position,
+            version=version,
+        )
+
+    def increment_tasks_version(self, user_id: UUID) -> int:
+        version = self.tasks_versions.get(user_id, 0) + 1
+        self.tasks_versions[user_id] = version
+        return version
+
+    def check_version(
+        self, record: TaskRecord, expected_version: Optional[int] = None
+    ) -> None:
+        if expected_version is not None and record.version != expected_version:
+            raise TaskVersionMismatch(record.id)
+
+    def create_task(self, create_task: CreateTask) -> Optional[Task]:
+        return self.store(uuid4(), create_task, create_task.user_id).to_task(
+            create_task.user_id
+        )
 
     def get_task(self, task_id: UUID, user_id: UUID) -> Optional[Task]:
-        user_tasks = self.tasks.get(user_id, None)
-        if user_tasks is None:
+        record = self.tasks.get(user_id, {}).get(task_id)
+        if record is None:
+            return None
+        return record.to_task(user_id)
+
+    def get_task_version(self, task_id: UUID, user_id: UUID) -> Optional[int]:
+        record = self.tasks.get(user_id, {}).get(task_id)
+        if record is None:
             return None
-        return user_tasks.get(task_id, None)
+        return record.version
+
+    def get_tasks_version(self, user_id: UUID) -> int:
+        return self.tasks_versions.get(user_id, 0)
+
+    def get_tasks(self, user_id: UUID, query: Optional[TaskQuery] = None) -> List[Task]:
+        if query is not None and query != TaskQuery():
+            return [
+                record.to_task(user_id)
+                for record, _ in self.query_tasks(user_id, query)
+            ]
 
-    def get_tasks(self, user_id: UUID) -> List[Task]:
         user_tasks = self.tasks.get(user_id)
         if user_tasks is None:
             return []
         else:
-            return list(user_tasks.values())
+            return [record.to_task(user_id) for record in user_tasks.values()]
+
+    def iter_tasks(self, user_id: UUID) -> Iterator[Task]:
+        # Walk task_order a chunk at a time, seeking past the last position after
+        # each chunk, so tasks written while iterating don't break the iteration
+        task_order = self.task_order.get(user_id, TaskOrder())
+        start = 0
+        while start < len(task_order):
+            positions = task_order.positions[start : start + ITER_TASKS_CHUNK_SIZE]
+            task_ids = task_order.task_ids[start : start + ITER_TASKS_CHUNK_SIZE]
+            user_tasks = self.tasks.get(user_id, {})
+            for task_id in task_ids:
+                record = user_tasks.get(task_id)
+                if record is not None:
+                    yield record.to_task(user_id)
+            start = task_order.after(positions[-1])
+
+    def query_tasks(
+        self, user_id: UUID, query: TaskQuery
+    ) -> List[Tuple[TaskRecord, List[Any]]]:
+        """The user's tasks matching the query, with their sort positions, sorted."""
+        user_tasks = self.tasks.get(user_id, {})
+        today = datetime.date.today()
+        candidates = self.indexes.get(user_id, TaskIndexes()).candidates(query, today)
+        if candidates is None:
+            task_ids: Iterable[UUID] = self.task_order.get(
+                user_id, TaskOrder()
+            ).task_ids
+        else:
+            task_ids = candidates
+        rows = []
+        for task_id in task_ids:
+            record = user_tasks[task_id]
+            if task_matches(record, query, today):
+                rows.append(
+                    (record, sort_position(record, record.position, query.sort))
+                )
+        # task_order is already in created order, the candidates are in no order
+        if candidates is not None or query.sort != TaskSortField.CREATED:
+            rows.sort(key=lambda row: row[1])
+        return rows
 
-    def update_task(self, update_task: UpdateTask, user_id: UUID) -> Optional[Task]:
+    def get_tasks_page(
+        self,
+        user_id: UUID,
+        limit: int,
+        cursor: Optional[str] = None,
+        query: Optional[TaskQuery] = None,
+    ) -> TaskPage:
+        if query is None:
+            query = TaskQuery()
+
+        if query == TaskQuery():
+            # Every task in insertion order, which task_order already is
+            user_tasks = self.tasks.get(user_id, {})
+            task_order = self.task_order.get(user_id, TaskOrder())
+            start = 0
+            if cursor is not None:
+                _, after = decode_position(cursor, query.sort)
+                start = task_order.after(after)
+            rows = [
+                (record, sort_position(record, record.position, query.sort))
+                for record in (
+                    user_tasks[task_id]
+                    for task_id in task_order.task_ids[start : start + limit + 1]
+                )
+            ]
+        else:
+            rows = self.query_tasks(user_id, query)
+            if cursor is not None:
+                after = decode_position(cursor, query.sort)
+                start = bisect_right([position for _, position in rows], after)
+                rows = rows[start:]
+            rows = rows[: limit + 1]
+
+        records, next_cursor = paginate(rows, limit)
+        return TaskPage(
+            tasks=[record.to_task(user_id) for record in records],
+            next_cursor=next_cursor,
+        )
+
+    def update_task(
+        self,
+        update_task: UpdateTask,
+        user_id: UUID,
+        expected_version: Optional[int] = None,
+    ) -> Optional[VersionedTask]:
+        record = self.update_record(update_task, user_id, expected_version)
+        if record is None:
+            return None
+        return VersionedTask(task=record.to_task(user_id), version=record.version)
+
+    def update_record(
+        self,
+        update_task: UpdateTask,
+        user_id: UUID,
+        expected_version: Optional[int] = None,
+    ) -> Optional[TaskRecord]:
         user_tasks = self.tasks.get(user_id)
         if user_tasks is None:
             return None
-        if update_task.id not in user_tasks:
+        record = user_tasks.get(update_task.id)
+        if record is None:
             return None
+        self.check_version(record, expected_version)
 
-        updated_task = Task(**{**update_task.model_dump(), "user_id": user_id})
-        user_tasks.update({update_task.id: updated_task})
-
-        return updated_task
+        return self.replace(user_id, record, update_task)
 
-    def delete_task(self, task_id: UUID, user_id: UUID) -> Optional[Task]:
+    def delete_task(
+        self, task_id: UUID, user_id: UUID, expected_version: Optional[int] = None
+    ) -> Optional[Task]:
         user_tasks = self.tasks.get(user_id)
         if user_tasks is None:
             return None
-        if task_id not in user_tasks:
+        record = user_tasks.get(task_id)
+        if record is None:
             return None
+        self.check_version(record, expected_version)
 
-        deleted_task = user_tasks.pop(task_id)
+        return self.remove(user_id, record, uuid4(), datetime.datetime.now())
 
-        history_entry = HistoryEntry(
-            id=uuid4(),
-            entity_id=task_id,
-            type=HistoryEntryType.TASK_DELETED,
-            version=HistoryEntryVersion.TASK,
-            event=deleted_task.model_dump_json(),
-            created_at=datetime.datetime.now(),
-        )
+    def create_tasks(self, create_tasks: List[CreateTask]) -> List[Task]:
+        return [self.create_task(create_task) for create_task in create_tasks]
 
-        user_history = self.history.get(user_id, None)
-        if user_history is None or task_id not in user_history:
-            self.history.update({user_id: {task_id: [history_entry]}})
-        else:
-            task_history = user_history.get(task_id, [])
-            task_history.append(history_entry)
+    def update_tasks(
+        self, update_tasks: List[UpdateTask], user_id: UUID
+    ) -> List[Optional[Task]]:
+        records = [
+            self.update_record(update_task, user_id) for update_task in update_tasks
+        ]
+        return [
+            record.to_task(user_id) if record is not None else None
+            for record in records
+        ]
 
-        return deleted_task
+    def delete_tasks(self, task_ids: List[UUID], user_id: UUID) -> List[Optional[Task]]:
+        return [self.delete_task(task_id, user_id) for task_id in task_ids]
 
     def get_last_history_entry(
         self, task_id: UUID, user_id: UUID
     ) -> Optional[HistoryEntry]:
-        user_history = self.history.get(user_id)
-        if user_history is None:
-            return None
-        if task_id not in user_history:
+        task_history = self.history.get(user_id, {}).get(task_id)
+        if not task_history:
             return None
-
-        task_history = user_history.get(task_id, [])
-        return sorted(task_history, key=lambda entry: entry.created_at, reverse=True)[0]
+        return task_history[-1]
 
     def restore_task(self, task_id: UUID, user_id: UUID) -> Optional[Task]:
         if self.get_task(task_id, user_id) is not None:
@@ -160,244 +757,794 @@ class InMemoryTaskManager(TaskManager):
         if last_history_entry is None:
             return None
 
-        deleted_task = Task(**json.loads(last_history_entry.model_dump().get("event")))
-
-        if deleted_task.user_id not in self.tasks:
-            self.tasks.update({deleted_task.user_id: {deleted_task.id: deleted_task}})
-        else:
-            self.tasks.get(deleted_task.user_id, {}).update(
-                {deleted_task.id: deleted_task}
-            )
+        deleted_task = Task.model_validate_json(last_history_entry.event)
+        self.store(deleted_task.id, deleted_task, deleted_task.user_id)
 
         return deleted_task
 
-
-def create_or_get_labels(labels: Set[str], session: Session) -> Set[LabelEntity]:
-    label_entities = set()
-    for label in labels:
+    def restore_tasks(
+        self,
+        user_id: UUID,
+        task_ids: Optional[List[UUID]] = None,
+        deleted_since: Optional[datetime.datetime] = None,
+    ) -> RestoredTasks:
+        user_history = self.history.get(user_id, {})
+        wanted_task_ids = None if task_ids is None else set(task_ids)
+
+        # The user's history is in the order of each task's latest entry, so
+        # entries created at the same time, as a batch delete's are, stay in the
+        # order they were made
+        last_entries = []
+        for task_id, task_history in user_history.items():
+            if wanted_task_ids is not None and task_id not in wanted_task_ids:
+                continue
+            last_entry = task_history[-1]
+            if deleted_since is None or last_entry.created_at >= deleted_since:
+                last_entries.append(last_entry)
+        last_entries.sort(key=lambda entry: entry.created_at)
+
+        restored_tasks = RestoredTasks()
+        user_tasks = self.tasks.get(user_id, {})
+        for last_entry in last_entries:
+            deleted_task = Task.model_validate_json(last_entry.event)
+            if deleted_task.id in user_tasks:
+                restored_tasks.conflicts.append(deleted_task)
+            else:
+                self.store(deleted_task.id, deleted_task, user_id)
+                restored_tasks.restored.append(deleted_task)
+        return restored_tasks
+
+
+def resolve_labels(labels: Set[str], session: Session) -> Set[LabelEntity]:
+    """Resolve label names to label entities, creating the labels that are missing.
+
+    This takes three statements for up to IN_CHUNK_SIZE // 2 labels: a select for
+    the existing labels, a single insert for the missing ones and a select to load
+    the inserted rows. More labels are looked up and inserted a chunk at a time.
+
+    The insert ignores conflicts on the unique label.name, so when two requests
+    create the same label concurrently both end up with the row that won. Nothing
+    is committed, that is left to the caller.
+    """
+    if not labels:
+        return set()
+
+    label_entities: Set[LabelEntity] = set()
+    for labels_chunk in chunked(list(labels)):
+        statement = select(LabelEntity).where(
+            cast(ColumnElement[bool], LabelEntity.name.in_(labels_chunk))
+        )
+        label_entities.update(session.execute(statement).scalars().all())
+
+    missing_labels = labels - {label_entity.name for label_entity in label_entities}
+    # Each inserted row binds two parameters
+    for missing_labels_chunk in chunked(list(missing_labels), IN_CHUNK_SIZE // 2):
+        insert_statement = (
+            sqlite_insert(LabelEntity)
+            .values([{"id": uuid4(), "name": label} for label in missing_labels_chunk])
+            .on_conflict_do_nothing(index_elements=[LabelEntity.name])
+        )
+        session.execute(insert_statement)
 
         statement = select(LabelEntity).where(
-            cast(ColumnElement[bool], LabelEntity.name == label)
+            cast(ColumnElement[bool], LabelEntity.name.in_(missing_labels_chunk))
         )
-        label_result = session.execute(statement)
-        label_entity = label_result.scalars().first()
-        if label_entity is None:
-            label_entity = LabelEntity(id=uuid4(), name=label)
-            session.add(label_entity)
-
-        label_entities.add(label_entity)
-        session.commit()
+        label_entities.update(session.execute(statement).scalars().all())
+
     return label_entities
 
 
+def task_from_entity(task_entity: TaskEntity) -> Task:
+    return Task(
+        id=task_entity.id,
+        name=task_entity.name,
+        status=task_entity.status,
+        labels={label_entity.name for label_entity in task_entity.labels},
+        due_date=task_entity.due_date,
+        sub_tasks=[],
+        user_id=task_entity.user_id,
+    )
+
+
+def reserve_positions(user_id: UUID, count: int, session: Session) -> Tuple[int, int]:
+    """Increments the user's tasks version and reserves the positions of count new
+    tasks after their other tasks, in one statement. Returns the version and the
+    first of the positions."""
+    statement = (
+        sqlite_insert(TasksVersionEntity)
+        .values(user_id=user_id, version=1, next_position=count)
+        .on_conflict_do_update(
+            index_elements=[TasksVersionEntity.user_id],
+            set_={
+                "version": TasksVersionEntity.version + 1,
+                "next_position": TasksVersionEntity.next_position + count,
+            },
+        )
+        .returning(TasksVersionEntity.version, TasksVersionEntity.next_position)
+    )
+    version, next_position = session.execute(statement).one()
+    return version, next_position - count
+
+
+def increment_tasks_version(user_id: UUID, session: Session) -> int:
+    """Increments the user's tasks version and returns it, in one statement."""
+    version, _ = reserve_positions(user_id, 0, session)
+    return version
+
+
+def insert_tasks(tasks: List[Task], user_id: UUID, session: Session) -> None:
+    """Inserts the user's tasks after their other tasks and links their labels, with
+    one executemany per table."""
+    version, position = reserve_positions(user_id, len(tasks), session)
+    session.execute(
+        insert(TaskEntity.__table__),
+        [
+            {
+                "id": task.id,
+                "name": task.name,
+                "status": task.status,
+                "due_date": task.due_date,
+                "user_id": task.user_id,
+                "version": version,
+                "position": position + i,
+            }
+            for i, task in enumerate(tasks)
+        ],
+    )
+    insert_task_labels(tasks, session)
+
+
+def insert_task_labels(tasks: List[Task], session: Session) -> None:
+    labels = set().union(*(task.labels for task in tasks))
+    if not labels:
+        return
+
+    label_ids = {
+        label_entity.name: label_entity.id
+        for label_entity in resolve_labels(labels, session)
+    }
+    # Inserting in primary key order keeps the b-tree writes close together
+    task_labels = sorted(
+        (task.id, label_ids[label]) for task in tasks for label in task.labels
+    )
+    session.execute(
+        insert(task_label_table),
+        [
+            {"task_id": task_id, "label_id": label_id}
+            for task_id, label_id in task_labels
+        ],
+    )
+
+
+def chunked(items: List[T], size: int = IN_CHUNK_SIZE) -> Iterator[List[T]]:
+    for start in range(0, len(items), size):
+        yield items[start : start + size]
+
+
+def delete_task_labels(task_ids: List[UUID], session: Session) -> None:
+    for task_ids_chunk in chunked(task_ids):
+        session.execute(
+            delete(task_label_table).where(
+                cast(
+                    ColumnElement[bool], task_label_table.c.task_id.in_(task_ids_chunk)
+                )
+            )
+        )
+
+
+def existing_task_ids(
+    task_ids: List[UUID], user_id: UUID, session: Session
+) -> Set[UUID]:
+    """Which of the ids are the ids of the user's tasks."""
+    existing = set()
+    for task_ids_chunk in chunked(task_ids):
+        statement = select(TaskEntity.id).where(
+            cast(ColumnElement[bool], TaskEntity.user_id == user_id),
+            cast(ColumnElement[bool], TaskEntity.id.in_(task_ids_chunk)),
+        )
+        existing.update(session.execute(statement).scalars())
+    return existing
+
+
+def group_by_user(tasks: List[Task]) -> Dict[UUID, List[Task]]:
+    user_tasks: Dict[UUID, List[Task]] = {}
+    for task in tasks:
+        user_tasks.setdefault(task.user_id, []).append(task)
+    return user_tasks
+
+
+def get_task_entity(
+    task_id: UUID, user_id: UUID, session: Session
+) -> Optional[TaskEntity]:
+    statement = (
+        select(TaskEntity)
+        .where(
+            cast(ColumnElement[bool], TaskEntity.id == task_id),
+            cast(ColumnElement[bool], TaskEntity.user_id == user_id),
+        )
+        .options(selectinload(TaskEntity.labels))
+    )
+    result = session.execute(statement)
+    return result.scalars().first()
+
+
+def get_last_history_entry(
+    task_id: UUID, user_id: UUID, session: Session
+) -> Optional[HistoryEntry]:
+    # A seek on ix_history_user_id_entity_id_type_created_at, which also keeps
+    # one user from seeing another's history
+    statement = (
+        select(HistoryEntity)
+        .where(
+            cast(ColumnElement[bool], HistoryEntity.user_id == user_id),
+            cast(ColumnElement[bool], HistoryEntity.entity_id == task_id),
+            cast(
+                ColumnElement[bool],
+                HistoryEntity.type == HistoryEntryType.TASK_DELETED,
+            ),
+        )
+        .order_by(HistoryEntity.created_at.desc())
+        .limit(1)
+    )
+    history_entity = session.execute(statement).scalar_one_or_none()
+    if history_entity is None:
+        return None
+
+    return HistoryEntry(
+        id=history_entity.id,
+        entity_id=history_entity.entity_id,
+        user_id=history_entity.user_id,
+        type=history_entity.type,
+        version=history_entity.version,
+        event=history_entity.event,
+        created_at=history_entity.created_at,
+    )
+
+
+# Follows insertion order
+history_rowid = literal_column("history.rowid", Integer)
+
+
+def last_deleted_tasks(
+    user_id: UUID,
+    task_ids: Optional[List[UUID]],
+    deleted_since: Optional[datetime.datetime],
+    session: Session,
+) -> Dict[UUID, Task]:
+    """The user's deleted tasks as they were when they were last deleted, in the
+    order they were deleted. Filtered the same way as restore_tasks."""
+    # Sqlite takes the bare event and rowid columns from the row with the
+    # max(created_at), so this is the latest entry of each task, grouped while
+    # walking ix_history_user_id_entity_id_type_created_at
+    statement = (
+        select(
+            HistoryEntity.event,
+            func.max(HistoryEntity.created_at),
+            history_rowid,
+        )
+        .where(
+            cast(ColumnElement[bool], HistoryEntity.user_id == user_id),
+            cast(
+                ColumnElement[bool],
+                HistoryEntity.type == HistoryEntryType.TASK_DELETED,
+            ),
+        )
+        .group_by(HistoryEntity.entity_id)
+    )
+    if deleted_since is not None:
+        # A task with any entry since deleted_since also has its latest one since
+        statement = statement.where(
+            cast(ColumnElement[bool], HistoryEntity.created_at >= deleted_since)
+        )
+
+    if task_ids is None:
+        statements = [statement]
+    else:
+        statements = [
+            statement.where(
+                cast(ColumnElement[bool], HistoryEntity.entity_id.in_(task_ids_chunk))
+            )
+            for task_ids_chunk in chunked(list(dict.fromkeys(task_ids)))
+        ]
+    rows = [row for statement in statements for row in session.execute(statement)]
+    # A batch delete gives every entry the same created_at, the rowids keep them
+    # in the order they were deleted
+    rows.sort(key=lambda row: (row[1], row[2]))
+    deleted_tasks = (Task.model_validate_json(event) for event, _, _ in rows)
+    return {task.id: task for task in deleted_tasks}
+
+
+# Matches the ix_task_user_id_due_date expression index
+task_due_date_or_last = func.coalesce(
+    TaskEntity.due_date, literal_column(f"'{NO_DUE_DATE}'"), type_=String
+)
+
+sort_columns: Dict[TaskSortField, List[ColumnElement[Any]]] = {
+    TaskSortField.CREATED: [TaskEntity.position],
+    TaskSortField.DUE_DATE: [task_due_date_or_last, TaskEntity.position],
+    TaskSortField.NAME: [TaskEntity.name, TaskEntity.position],
+    TaskSortField.STATUS: [TaskEntity.status, TaskEntity.position],
+}
+
+
+def task_filters(query: TaskQuery, today: datetime.date) -> List[ColumnElement[bool]]:
+    filters = []
+    if query.statuses:
+        filters.append(TaskEntity.status.in_(query.statuses))
+    if query.labels_any:
+        filters.append(TaskEntity.labels.any(LabelEntity.name.in_(query.labels_any)))
+    if query.labels_all:
+        matching_labels = (
+            select(func.count())
+            .select_from(task_label_table.join(LabelEntity))
+            .where(
+                cast(ColumnElement[bool], task_label_table.c.task_id == TaskEntity.id),
+                cast(ColumnElement[bool], LabelEntity.name.in_(query.labels_all)),
+            )
+            .scalar_subquery()
+        )
+        filters.append(matching_labels == len(query.labels_all))
+    if query.due_after is not None:
+        filters.append(TaskEntity.due_date >= query.due_after)
+    if query.due_before is not None:
+        filters.append(TaskEntity.due_date <= query.due_before)
+    if query.overdue:
+        filters.append(TaskEntity.due_date < today)
+        filters.append(TaskEntity.status != TaskStatus.DONE)
+    return [cast(ColumnElement[bool], task_filter) for task_filter in filters]
+
+
+def tasks_statement(user_id: UUID, query: TaskQuery) -> Select:
+    """Selects the user's tasks matching the query, sorted."""
+    return (
+        select(TaskEntity)
+        .where(
+            cast(ColumnElement[bool], TaskEntity.user_id == user_id),
+            *task_filters(query, datetime.date.today()),
+        )
+        .order_by(*sort_columns[query.sort])
+        .options(selectinload(TaskEntity.labels))
+    )
+
+
+# The task's label names as a JSON array, so a task and its labels come back in
+# one row and tasks can be streamed without eager loading
+task_labels_json = (
+    select(func.json_group_array(LabelEntity.name))
+    .select_from(task_label_table.join(LabelEntity))
+    .where(cast(ColumnElement[bool], task_label_table.c.task_id == TaskEntity.id))
+    .scalar_subquery()
+)
+
+
+def iter_tasks_statement(user_id: UUID) -> Select:
+    return (
+        select(
+            TaskEntity.id,
+            TaskEntity.name,
+            TaskEntity.status,
+            TaskEntity.due_date,
+            TaskEntity.user_id,
+            task_labels_json,
+        )
+        .where(cast(ColumnElement[bool], TaskEntity.user_id == user_id))
+        .order_by(TaskEntity.position)
+        .execution_options(yield_per=ITER_TASKS_CHUNK_SIZE)
+    )
+
+
+def task_from_row(row: Row) -> Task:
+    task_id, name, status, due_date, user_id, labels = row
+    return Task(
+        id=task_id,
+        name=name,
+        status=status,
+        labels=set(json.loads(labels)),
+        due_date=due_date,
+        sub_tasks=[],
+        user_id=user_id,
+    )
+
+
 class SqliteTaskManager(TaskManager):
+    """Every write increments the user's tasks version and stamps the tasks it
+    writes with the new version."""
 
     def __init__(
-        self, session_factory: Callable[..., AbstractContextManager[Session]]
+        self,
+        session_factory: Callable[..., AbstractContextManager[Session]],
+        archive_session_factory: Optional[
+            Callable[..., AbstractContextManager[Session]]
+        ] = None,
     ) -> None:
         self.session_factory = session_factory
+        # Where HistoryCompactor moves old history entries to
+        self.archive_session_factory = archive_session_factory
+
+    @contextmanager
+    def unit_of_work(self) -> Iterator[Session]:
+        """Run the block in a single transaction, committed once when it exits.
+
+        Every write method reads and writes through one unit of work, so a write
+        costs exactly one commit and either all of it is persisted or none of it is.
+        """
+        with self.session_factory() as session, session.begin():
+            yield session
 
     def create_task(self, create_task: CreateTask) -> Optional[Task]:
-        with self.session_factory() as session:
+        with self.unit_of_work() as session:
+            version, position = reserve_positions(create_task.user_id, 1, session)
             task_entity = TaskEntity(
                 id=uuid4(),
                 name=create_task.name,
                 status=create_task.status,
                 due_date=create_task.due_date,
-                labels=set(),
+                labels=resolve_labels(create_task.labels, session),
                 # sub_tasks=create_task.sub_tasks,
                 user_id=create_task.user_id,
+                version=version,
+                position=position,
             )
             session.add(task_entity)
-            session.commit()
-
-            label_entities = create_or_get_labels(create_task.labels, session)
 
-            task_entity.labels = label_entities
-            session.commit()
+            return task_from_entity(task_entity)
 
-            task = Task(
-                id=task_entity.id,
-                name=task_entity.name,
-                status=task_entity.status,
-                labels=create_task.labels,
-                due_date=task_entity.due_date,
-                sub_tasks=[],
-                user_id=task_entity.user_id,
-            )
+    def get_task(self, task_id: UUID, user_id: UUID) -> Optional[Task]:
+        with self.session_factory() as session:
+            task_entity = get_task_entity(task_id, user_id, session)
+            if task_entity is None:
+                return None
 
-            return task
+            return task_from_entity(task_entity)
 
-    def get_task(self, task_id: UUID, user_id: UUID) -> Optional[Task]:
+    def get_task_version(self, task_id: UUID, user_id: UUID) -> Optional[int]:
         with self.session_factory() as session:
-            statement = select(TaskEntity).where(
+            statement = select(TaskEntity.version).where(
                 cast(ColumnElement[bool], TaskEntity.id == task_id),
                 cast(ColumnElement[bool], TaskEntity.user_id == user_id),
             )
-            result = session.execute(statement)
-            task_entity = result.scalars().first()
-            if task_entity is None:
-                return None
+            return session.execute(statement).scalar_one_or_none()
 
-            task = Task(
-                id=task_entity.id,
-                name=task_entity.name,
-                status=task_entity.status,
-                labels={label_entity.name for label_entity in task_entity.labels},
-                due_date=task_entity.due_date,
-                sub_tasks=[],
-                user_id=task_entity.user_id,
+    def get_tasks_version(self, user_id: UUID) -> int:
+        with self.session_factory() as session:
+            statement = select(TasksVersionEntity.version).where(
+                cast(ColumnElement[bool], TasksVersionEntity.user_id == user_id)
             )
+            version = session.execute(statement).scalar_one_or_none()
+            return 0 if version is None else version
 
-            return task
+    def get_tasks(self, user_id: UUID, query: Optional[TaskQuery] = None) -> List[Task]:
+        if query is None:
+            query = TaskQuery()
 
-    def get_tasks(self, user_id: UUID) -> List[Task]:
         with self.session_factory() as session:
-            statement = select(TaskEntity).where(
-                cast(ColumnElement[bool], TaskEntity.user_id == user_id),
-            )
-            result = session.execute(statement)
-            task_entities = result.scalars().all()
-
-            tasks = []
-            for task_entity in task_entities:
-                task = Task(
-                    id=task_entity.id,
-                    name=task_entity.name,
-                    status=task_entity.status,
-                    labels={label_entity.name for label_entity in task_entity.labels},
-                    due_date=task_entity.due_date,
-                    sub_tasks=[],
-                    user_id=task_entity.user_id,
-                )
-                tasks.append(task)
+            # Labels are loaded with a single "SELECT ... WHERE task_id IN (...)"
+            # for the whole result set, rather than lazily once per task.
+            result = session.execute(tasks_statement(user_id, query))
 
-            return tasks
+            return [task_from_entity(task_entity) for task_entity in result.scalars()]
 
-    def update_task(self, update_task: UpdateTask, user_id: UUID) -> Optional[Task]:
-        task_to_update = self.get_task(update_task.id, user_id)
-        if task_to_update is None:
-            return None
+    def iter_tasks(self, user_id: UUID) -> Iterator[Task]:
+        """Streams the tasks from a server side cursor. The session is held open
+        until the iteration finishes, and Database.session is scoped to the
+        thread, so finish iterating before using this task manager again on the
+        same thread."""
+        with self.session_factory() as session:
+            for row in session.execute(iter_tasks_statement(user_id)):
+                yield task_from_row(row)
+
+    def get_tasks_page(
+        self,
+        user_id: UUID,
+        limit: int,
+        cursor: Optional[str] = None,
+        query: Optional[TaskQuery] = None,
+    ) -> TaskPage:
+        if query is None:
+            query = TaskQuery()
 
         with self.session_factory() as session:
-            label_entities = create_or_get_labels(update_task.labels, session)
+            statement = tasks_statement(user_id, query).limit(limit + 1)
+            if cursor is not None:
+                # Skip the sort field at the start of the position
+                after = decode_position(cursor, query.sort)[1:]
+                statement = statement.where(
+                    tuple_(*sort_columns[query.sort]) > tuple_(*after)
+                )
 
-            statement = select(TaskEntity).where(
-                cast(ColumnElement[bool], TaskEntity.id == update_task.id),
-                cast(ColumnElement[bool], TaskEntity.user_id == user_id),
-            )
+            rows = []
+            for task_entity in session.execute(statement).scalars():
+                task = task_from_entity(task_entity)
+                rows.append(
+                    (task, sort_position(task, task_entity.position, query.sort))
+                )
+            tasks, next_cursor = paginate(rows, limit)
+            return TaskPage(tasks=tasks, next_cursor=next_cursor)
 
-            result = session.execute(statement)
-            task_entity = result.scalar()
+    def update_task(
+        self,
+        update_task: UpdateTask,
+        user_id: UUID,
+        expected_version: Optional[int] = None,
+    ) -> Optional[VersionedTask]:
+        with self.unit_of_work() as session:
+            task_entity = get_task_entity(update_task.id, user_id, session)
             if task_entity is None:
                 return None
+            if expected_version is not None and task_entity.version != expected_version:
+                raise TaskVersionMismatch(update_task.id)
 
-            task_entity.labels.clear()
-            task_entity.labels = label_entities
+            task_entity.version = increment_tasks_version(user_id, session)
+            task_entity.labels = resolve_labels(update_task.labels, session)
             task_entity.name = update_task.name
             task_entity.status = update_task.status
             task_entity.due_date = update_task.due_date
-            session.commit()
 
-            return self.get_task(update_task.id, user_id)
-
-    def delete_task(self, task_id: UUID, user_id: UUID) -> Optional[Task]:
-        task_to_delete = self.get_task(task_id, user_id)
-        if task_to_delete is None:
-            return None
-
-        with self.session_factory() as session:
-            statement = delete(TaskEntity).where(
-                cast(ColumnElement[bool], TaskEntity.id == task_to_delete.id),
-                cast(ColumnElement[bool], TaskEntity.user_id == user_id),
+            return VersionedTask(
+                task=task_from_entity(task_entity), version=task_entity.version
             )
 
-            result = session.execute(statement)
-            if result.rowcount == 0:
+    def delete_task(
+        self, task_id: UUID, user_id: UUID, expected_version: Optional[int] = None
+    ) -> Optional[Task]:
+        with self.unit_of_work() as session:
+            task_entity = get_task_entity(task_id, user_id, session)
+            if task_entity is None:
                 return None
+            if expected_version is not None and task_entity.version != expected_version:
+                raise TaskVersionMismatch(task_id)
+
+            increment_tasks_version(user_id, session)
+            deleted_task = task_from_entity(task_entity)
+            # Deleting through the session also removes the task's task_label rows
+            session.delete(task_entity)
+            session.add(
+                HistoryEntity(
+                    id=uuid4(),
+                    entity_id=task_id,
+                    user_id=user_id,
+                    type=HistoryEntryType.TASK_DELETED,
+                    version=HistoryEntryVersion.TASK,
+                    event=deleted_task.model_dump_json(),
+                    created_at=datetime.datetime.now(),
+                )
+            )
+
+            return deleted_task
 
-            history_insert_statement = insert(HistoryEntity).values(
+    def create_tasks(self, create_tasks: List[CreateTask]) -> List[Task]:
+        # The create tasks are already validated, so skip validating them again
+        tasks = [
+            Task.model_construct(
                 id=uuid4(),
-                entity_id=task_id,
-                type=HistoryEntryType.TASK_DELETED,
-                version=HistoryEntryVersion.TASK,
-                event=task_to_delete.model_dump_json(),
-                created_at=datetime.datetime.now(),
+                name=create_task.name,
+                status=create_task.status,
+                labels=create_task.labels,
+                due_date=create_task.due_date,
+                sub_tasks=[],
+                user_id=create_task.user_id,
             )
-            history_insert_result = session.execute(history_insert_statement)
-            if history_insert_result.rowcount == 0:
-                return None
+            for create_task in create_tasks
+        ]
+        if not tasks:
+            return []
 
-            session.commit()
+        with self.unit_of_work() as session:
+            for user_id, user_tasks in group_by_user(tasks).items():
+                insert_tasks(user_tasks, user_id, session)
 
-            return task_to_delete
+        return tasks
 
-    def get_last_history_entry(
-        self, task_id: UUID, user_id: UUID
-    ) -> Optional[HistoryEntry]:
-        if user_id is None:
-            return None
-        with self.session_factory() as session:
-            statement = (
-                select(HistoryEntity)
-                .where(
-                    cast(ColumnElement[bool], HistoryEntity.entity_id == task_id),
-                    cast(
-                        ColumnElement[bool],
-                        HistoryEntity.type == HistoryEntryType.TASK_DELETED,
-                    ),
-                )
-                .order_by(HistoryEntity.created_at.desc())
-            )
-            result = session.execute(statement)
-            history_entity: HistoryEntity = result.scalars().first()
-            if history_entity is None:
-                return None
+    def update_tasks(
+        self, update_tasks: List[UpdateTask], user_id: UUID
+    ) -> List[Optional[Task]]:
+        if not update_tasks:
+            return []
 
-            history_entry = HistoryEntry(
-                id=history_entity.id,
-                entity_id=history_entity.entity_id,
-                type=history_entity.type,
-                version=history_entity.version,
-                event=history_entity.event,
-                created_at=history_entity.created_at,
-            )
-            # TODO: figure out how to dynamically restore the HistoryEntry.event based on the version
-            task_deleted_event = Task(
-                **json.loads(history_entry.model_dump().get("event"))
+        with self.unit_of_work() as session:
+            found_task_ids = existing_task_ids(
+                list(dict.fromkeys(update_task.id for update_task in update_tasks)),
+                user_id,
+                session,
             )
 
-            if task_deleted_event.user_id != user_id:
-                return None
+            tasks = [
+                (
+                    Task(
+                        id=update_task.id,
+                        name=update_task.name,
+                        status=update_task.status,
+                        labels=update_task.labels,
+                        due_date=update_task.due_date,
+                        sub_tasks=[],
+                        user_id=user_id,
+                    )
+                    if update_task.id in found_task_ids
+                    else None
+                )
+                for update_task in update_tasks
+            ]
+            # If a task is updated more than once the last update wins
+            updated_tasks = {task.id: task for task in tasks if task is not None}
+            if updated_tasks:
+                version = increment_tasks_version(user_id, session)
+                session.execute(
+                    update(TaskEntity),
+                    [
+                        {
+                            "id": task.id,
+                            "name": task.name,
+                            "status": task.status,
+                            "due_date": task.due_date,
+                            "version": version,
+                        }
+                        for task in updated_tasks.values()
+                    ],
+                )
+                delete_task_labels(list(updated_tasks), session)
+                insert_task_labels(list(updated_tasks.values()), session)
 
-            return history_entry
+            return tasks
 
-    def restore_task(self, task_id: UUID, user_id: UUID) -> Optional[Task]:
-        if self.get_task(task_id, user_id) is not None:
-            raise TaskAlreadyExists(task_id)
+    def delete_tasks(self, task_ids: List[UUID], user_id: UUID) -> List[Optional[Task]]:
+        if not task_ids:
+            return []
 
-        last_history_entry = self.get_last_history_entry(task_id, user_id)
+        with self.unit_of_work() as session:
+            deleted_tasks: Dict[UUID, Task] = {}
+            for task_ids_chunk in chunked(list(dict.fromkeys(task_ids))):
+                statement = (
+                    select(TaskEntity)
+                    .where(
+                        cast(ColumnElement[bool], TaskEntity.user_id == user_id),
+                        cast(ColumnElement[bool], TaskEntity.id.in_(task_ids_chunk)),
+                    )
+                    .options(selectinload(TaskEntity.labels))
+                )
+                deleted_tasks.update(
+                    (task_entity.id, task_from_entity(task_entity))
+                    for task_entity in session.execute(statement).scalars()
+                )
+            if deleted_tasks:
+                increment_tasks_version(user_id, session)
+                delete_task_labels(list(deleted_tasks), session)
+                for task_ids_chunk in chunked(list(deleted_tasks)):
+                    session.execute(
+                        delete(TaskEntity)
+                        .where(
+                            cast(ColumnElement[bool], TaskEntity.id.in_(task_ids_chunk))
+                        )
+                        .execution_options(synchronize_session=False)
+                    )
+                created_at = datetime.datetime.now()
+                # Inserted in the order the ids were given, which is the order
+                # restore_tasks gives back entries created at the same time
+                session.execute(
+                    insert(HistoryEntity),
+                    [
+                        {
+                            "id": uuid4(),
+                            "entity_id": task_id,
+                            "user_id": user_id,
+                            "type": HistoryEntryType.TASK_DELETED,
+                            "version": HistoryEntryVersion.TASK,
+                            "event": deleted_tasks[task_id].model_dump_json(),
+                            "created_at": created_at,
+                        }
+                        for task_id in dict.fromkeys(task_ids)
+                        if task_id in deleted_tasks
+                    ],
+                )
 
-        if last_history_entry is None:
+            # Like deleting one at a time, a task is only deleted the first time
+            # its id is given
+            return [deleted_tasks.pop(task_id, None) for task_id in task_ids]
+
+    def get_last_history_entry(
+        self, task_id: UUID, user_id: UUID
+    ) -> Optional[HistoryEntry]:
+        if user_id is None:
             return None
+        with self.session_factory() as session:
+            history_entry = get_last_history_entry(task_id, user_id, session)
+        if history_entry is None:
+            history_entry = self.get_archived_history_entry(task_id, user_id)
+        return history_entry
 
-        deleted_task = Task(**json.loads(last_history_entry.model_dump().get("event")))
+    def get_archived_history_entry(
+        self, task_id: UUID, user_id: UUID
+    ) -> Optional[HistoryEntry]:
+        """The latest of the task's archived history entries. Archived entries are
+        always older than the ones left in the main database."""
+        if self.archive_session_factory is None:
+            return None
+        with self.archive_session_factory() as session:
+            return get_last_history_entry(task_id, user_id, session)
 
-        with self.session_factory() as session:
+    def restore_task(self, task_id: UUID, user_id: UUID) -> Optional[Task]:
+        with self.unit_of_work() as session:
+            if get_task_entity(task_id, user_id, session) is not None:
+                raise TaskAlreadyExists(task_id)
 
-            statement = insert(TaskEntity).values(
-                id=deleted_task.id,
-                name=deleted_task.name,
-                status=deleted_task.status,
-                # labels=deleted_task.labels,
-                due_date=deleted_task.due_date,
-                # sub_tasks=deleted_task.sub_tasks,
-                user_id=deleted_task.user_id,
-            )
-            result = session.execute(statement)
-            session.commit()
+            last_history_entry = get_last_history_entry(task_id, user_id, session)
+            if last_history_entry is None:
+                last_history_entry = self.get_archived_history_entry(task_id, user_id)
 
-            if result.rowcount == 0:
+            if last_history_entry is None:
                 return None
 
+            # TODO: figure out how to dynamically restore the HistoryEntry.event based on the version
+            deleted_task = Task.model_validate_json(last_history_entry.event)
+
+            version, position = reserve_positions(deleted_task.user_id, 1, session)
+            session.add(
+                TaskEntity(
+                    id=deleted_task.id,
+                    name=deleted_task.name,
+                    status=deleted_task.status,
+                    labels=resolve_labels(deleted_task.labels, session),
+                    due_date=deleted_task.due_date,
+                    # sub_tasks=deleted_task.sub_tasks,
+                    user_id=deleted_task.user_id,
+                    version=version,
+                    position=position,
+                )
+            )
+
             return deleted_task
+
+    def restore_tasks(
+        self,
+        user_id: UUID,
+        task_ids: Optional[List[UUID]] = None,
+        deleted_since: Optional[datetime.datetime] = None,
+    ) -> RestoredTasks:
+        """Restores the tasks with a fixed number of statements however many there
+        are, in one transaction, so either every task is restored or none are."""
+        with self.unit_of_work() as session:
+            deleted_tasks = last_deleted_tasks(
+                user_id, task_ids, deleted_since, session
+            )
+            deleted_tasks = {
+                **self.last_archived_deleted_tasks(
+                    user_id, task_ids, deleted_since, deleted_tasks
+                ),
+                **deleted_tasks,
+            }
+
+            existing = existing_task_ids(list(deleted_tasks), user_id, session)
+            restored_tasks = RestoredTasks()
+            for deleted_task in deleted_tasks.values():
+                if deleted_task.id in existing:
+                    restored_tasks.conflicts.append(deleted_task)
+                else:
+                    restored_tasks.restored.append(deleted_task)
+
+            if restored_tasks.restored:
+                insert_tasks(restored_tasks.restored, user_id, session)
+            return restored_tasks
+
+    def last_archived_deleted_tasks(
+        self,
+        user_id: UUID,
+        task_ids: Optional[List[UUID]],
+        deleted_since: Optional[datetime.datetime],
+        deleted_tasks: Dict[UUID, Task],
+    ) -> Dict[UUID, Task]:
+        """The deleted tasks that only have archived history entries. The tasks
+        are older than any in deleted_tasks, which come from the main database."""
+        if self.archive_session_factory is None:
+            return {}
+        if task_ids is not None:
+            task_ids = [task_id for task_id in task_ids if task_id not in deleted_tasks]
+            if not task_ids:
+                return {}
+        with self.archive_session_factory() as session:
+            archived_tasks = last_deleted_tasks(
+                user_id, task_ids, deleted_since, session
+            )
+        return {
+            task_id: task
+            for task_id, task in archived_tasks.items()
+            if task_id not in deleted_tasks
+        }
@@ -2,7 +2,7 @@ from datetime import date, datetime
 from typing import Any, Optional, Set
 from uuid import UUID
 
-from sqlalchemy import Column, ForeignKey, JSON, Table
+from sqlalchemy import Column, ForeignKey, Index, JSON, Table, text
 from sqlalchemy.orm import DeclarativeBase, Mapped, mapped_column, relationship
 
 from app.domain.models import HistoryEntryType, HistoryEntryVersion, TaskStatus
@@ -17,11 +17,31 @@ task_label_table = Table(
     Base.metadata,
     Column("task_id", ForeignKey("task.id"), primary_key=True),
     Column("label_id", ForeignKey("label.id"), primary_key=True),
+    # The primary key covers task -> labels, this covers label -> tasks
+    Index("ix_task_label_label_id_task_id", "label_id", "task_id"),
+    # Rows are only ever looked up by their key, so a rowid would just be one more
+    # b-tree to write on every insert
+    sqlite_with_rowid=False,
 )
 
 
 class TaskEntity(Base):
     __tablename__ = "task"
+    # Serve sorted pages of a user's tasks, each ending in the position that
+    # breaks ties. The due date index sorts tasks without a due date last, matching
+    # the coalesce in SqliteTaskManager's queries.
+    __table_args__ = (
+        Index("ix_task_user_id_position", "user_id", "position", unique=True),
+        Index("ix_task_user_id_name", "user_id", "name", "position"),
+        Index("ix_task_user_id_status", "user_id", "status", "position"),
+        Index(
+            "ix_task_user_id_due_date",
+            "user_id",
+            text("coalesce(due_date, '9999-12-31')"),
+            "position",
+        ),
+    )
+
     id: Mapped[UUID] = mapped_column(primary_key=True)
     name: Mapped[str]
 
@@ -34,13 +54,34 @@ class TaskEntity(Base):
     # TODO: create a new model for sub tasks
     # sub_tasks: Mapped[List[Any]]
     user_id: Mapped[UUID]
+    # The user's tasks version when the task was last written, see
+    # TasksVersionEntity
+    version: Mapped[int] = mapped_column(server_default="1")
+    # Where the task was stored among the user's tasks, handed out by
+    # TasksVersionEntity. Unlike the rowid it's never reused after a delete or
+    # renumbered by a VACUUM, so pagination cursors stay valid.
+    position: Mapped[int]
+
+
+class TasksVersionEntity(Base):
+    """A counter per user, increased by every write to their tasks. It versions
+    the user's task list, and stamping written tasks with it gives each task a
+    version that never repeats, even across a delete and restore. Stored tasks
+    are positioned from a second counter, in the same row."""
+
+    __tablename__ = "tasks_version"
+
+    user_id: Mapped[UUID] = mapped_column(primary_key=True)
+    version: Mapped[int]
+    # The position the user's next stored task gets
+    next_position: Mapped[int] = mapped_column(server_default="0")
 
 
 class LabelEntity(Base):
     __tablename__ = "label"
 
     id: Mapped[UUID] = mapped_column(primary_key=True)
-    name: Mapped[str]
+    name: Mapped[str] = mapped_column(unique=True, index=True)
     tasks: Mapped[Set[TaskEntity]] = relationship(
         "TaskEntity", secondary=task_label_table, back_populates="labels"
     )
@@ -48,8 +89,20 @@ class LabelEntity(Base):
 
 class HistoryEntity(Base):
     __tablename__ = "history"
+    __table_args__ = (
+        # Finds the latest entry of a type for one of a user's entities
+        Index(
+            "ix_history_user_id_entity_id_type_created_at",
+            "user_id",
+            "entity_id",
+            "type",
+            "created_at",
+        ),
+    )
+
     id: Mapped[UUID] = mapped_column(primary_key=True)
     entity_id: Mapped[UUID] = mapped_column()
+    user_id: Mapped[UUID]
 
     type: Mapped[HistoryEntryType]
     version: Mapped[HistoryEntryVersion]
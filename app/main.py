@@ -1,17 +1,86 @@
+import asyncio
 import os
+from contextlib import asynccontextmanager, suppress
+from typing import AsyncIterator
 
 from fastapi import FastAPI
 
-from app.api.exception_handlers import task_already_exists_exception_handler
+from app.api.exception_handlers import (
+    invalid_cursor_exception_handler,
+    task_already_exists_exception_handler,
+    task_version_mismatch_exception_handler,
+)
 from app.api.main import api_router
 from app.containers import Container
-from app.domain.errors import TaskAlreadyExists
+from app.database import DEFAULT_PRAGMAS
+from app.domain.errors import InvalidCursor, TaskAlreadyExists, TaskVersionMismatch
+from app.domain.history_archive import run_history_compaction
+from app.metrics import (
+    instrument_database,
+    instrument_in_memory_store,
+    instrument_task_cache,
+    MetricsMiddleware,
+    QueryTimingMiddleware,
+)
 
 APP_DIR = os.path.dirname(os.path.abspath(__file__))
 
 
+def env_flag(value: str) -> bool:
+    return value.strip().lower() in ("1", "true", "yes", "on")
+
+
+def instrument_storage(container: Container) -> None:
+    """Adds the metrics of the storage behind the configured task manager."""
+    metrics = container.metrics()
+    task_manager_type = container.config.task_manager.type()
+    if task_manager_type in ("sqlite", "cached_sqlite"):
+        for database in (
+            container.async_db(),
+            container.async_archive_db(),
+            container.db(),
+            container.archive_db(),
+        ):
+            instrument_database(metrics, database)
+    elif task_manager_type == "sharded_sqlite":
+        for database in container.async_shard_dbs():
+            instrument_database(metrics, database)
+    elif task_manager_type == "in_memory":
+        instrument_in_memory_store(metrics, container.in_memory_task_manager())
+    elif task_manager_type == "durable_in_memory":
+        instrument_in_memory_store(metrics, container.durable_in_memory_task_manager())
+    if task_manager_type == "cached_sqlite":
+        instrument_task_cache(metrics, container.task_cache())
+
+
+def close_task_manager(container: Container) -> None:
+    """Waits for a running snapshot and closes the log of the durable task
+    manager, the other task managers have nothing to close."""
+    if container.config.task_manager.type() == "durable_in_memory":
+        container.durable_in_memory_task_manager().close()
+
+
+@asynccontextmanager
+async def lifespan(app: FastAPI) -> AsyncIterator[None]:
+    config = app.container.config
+    if config.metrics.enabled():
+        instrument_storage(app.container)
+    compaction = None
+    interval = config.history.compaction.interval()
+    if config.task_manager.type() in ("sqlite", "cached_sqlite") and interval:
+        compaction = asyncio.create_task(
+            run_history_compaction(app.container.history_compactor(), interval)
+        )
+    yield
+    if compaction is not None:
+        compaction.cancel()
+        with suppress(asyncio.CancelledError):
+            await compaction
+    await asyncio.to_thread(close_task_manager, app.container)
+
+
 def create_app() -> FastAPI:
-    app = FastAPI()
+    app = FastAPI(lifespan=lifespan)
     app.include_router(api_router)
     container = Container()
     container.config.from_dict(
@@ -19,18 +88,83 @@ def create_app() -> FastAPI:
             "task_manager": {
                 "sqlite": {},
                 "in_memory": {},
+                "durable_in_memory": {},
+                "cached_sqlite": {},
+                "sharded_sqlite": {},
+            },
+            "cache": {
+                "max_size": 10000,
+                # seconds
+                "ttl": 60,
             },
             # The amount slashes in the database url are important. For absolute paths, 4 slashes are needed.
             # APP_DIR has a leading /
-            "db": {"url": f"sqlite:///{APP_DIR}/task.db"},
+            "db": {
+                "url": f"sqlite:///{APP_DIR}/task.db",
+                "echo": False,
+                "pragmas": DEFAULT_PRAGMAS,
+                # Sqlite only allows one writer at a time, so a large pool only
+                # adds connections waiting on the same lock
+                "pool_size": 5,
+                "max_overflow": 10,
+                # Statements taking this long or longer are logged with their
+                # query plan, None turns this off
+                "slow_query_seconds": 0.1,
+            },
+            # Used by sharded_sqlite, each user's tasks are stored in one of these
+            # databases. Changing the list moves users between them, see
+            # app/reshard.py.
+            "shards": {
+                "urls": [
+                    f"sqlite:///{APP_DIR}/task_shard_{shard}.db" for shard in range(4)
+                ],
+            },
+            # Used by durable_in_memory, which logs every write here and snapshots
+            # the tasks every snapshot_every logged changes
+            "durable": {
+                "directory": f"{APP_DIR}/task_log",
+                "snapshot_every": 100000,
+            },
+            "history": {
+                "archive": {"url": f"sqlite:///{APP_DIR}/task_archive.db"},
+                # Entries past either limit are moved to the archive, where
+                # restore_task can still find them
+                "retention": {
+                    # seconds
+                    "max_age": 90 * 24 * 60 * 60,
+                    "max_entries_per_entity": 10,
+                },
+                "compaction": {
+                    # seconds, 0 turns compaction off
+                    "interval": 60 * 60,
+                    "batch_size": 1000,
+                },
+            },
         }
     )
 
     container.config.task_manager.type.from_env(
         "TASK_MANAGER_TYPE", default="in_memory"
     )
+    # Off by default, so requests and task manager calls aren't timed unless the
+    # metrics are scraped
+    container.config.metrics.enabled.from_env(
+        "METRICS_ENABLED", default="false", as_=env_flag
+    )
+    # Adds a Server-Timing header with each request's sql statements
+    container.config.query_timing.enabled.from_env(
+        "QUERY_TIMING_ENABLED", default="false", as_=env_flag
+    )
     app.container = container
+    if container.config.query_timing.enabled():
+        app.add_middleware(QueryTimingMiddleware)
+    if container.config.metrics.enabled():
+        app.add_middleware(MetricsMiddleware, metrics=container.metrics())
     app.add_exception_handler(TaskAlreadyExists, task_already_exists_exception_handler)
+    app.add_exception_handler(InvalidCursor, invalid_cursor_exception_handler)
+    app.add_exception_handler(
+        TaskVersionMismatch, task_version_mismatch_exception_handler
+    )
     return app
 
 
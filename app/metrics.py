@@ -0,0 +1,399 @@
+"""Request, TaskManager and database metrics, served in the Prometheus text format
+on /metrics when config.metrics.enabled is set, and per request query timings
+when config.query_timing.enabled is.
+
+Nothing is recorded while metrics are disabled: the middleware isn't added, the
+task manager isn't wrapped and no database events are listened to.
+"""
+
+import abc
+import bisect
+import logging
+import os
+import threading
+import time
+from typing import Callable, Dict, Iterator, List, Sequence, Tuple, TypeVar, Union
+
+from sqlalchemy import event
+from sqlalchemy.orm import Session, SessionTransaction
+from starlette.types import ASGIApp, Message, Receive, Scope, Send
+
+from app.database import AsyncDatabase, Database, record_queries
+from app.domain.caching_task_managers import TaskCache
+from app.domain.task_managers import InMemoryTaskManager
+
+logger = logging.getLogger(__name__)
+
+CONTENT_TYPE = "text/plain; version=0.0.4; charset=utf-8"
+# Seconds, from a dictionary lookup in memory up to a slow sqlite write
+DEFAULT_BUCKETS = (
+    0.0001,
+    0.0005,
+    0.001,
+    0.0025,
+    0.005,
+    0.01,
+    0.025,
+    0.05,
+    0.1,
+    0.25,
+    0.5,
+    1.0,
+    2.5,
+    5.0,
+    10.0,
+)
+
+LabelValues = Tuple[str, ...]
+
+
+def escape(value: str) -> str:
+    return value.replace("\\", "\\\\").replace("\n", "\\n").replace('"', '\\"')
+
+
+def format_labels(names: Sequence[str], values: Sequence[str]) -> str:
+    if not names:
+        return ""
+    pairs = ",".join(f'{name}="{escape(value)}"' for name, value in zip(names, values))
+    return f"{{{pairs}}}"
+
+
+def format_value(value: float) -> str:
+    if value == float("inf"):
+        return "+Inf"
+    return repr(float(value)) if value != int(value) else str(int(value))
+
+
+class Metric(metaclass=abc.ABCMeta):
+    type = "untyped"
+
+    def __init__(self, name: str, help: str, label_names: Sequence[str] = ()) -> None:
+        self.name = name
+        self.help = help
+        self.label_names = tuple(label_names)
+        self.lock = threading.Lock()
+
+    @abc.abstractmethod
+    def samples(self) -> Iterator[Tuple[str, str, float]]:
+        """Each sample's name suffix, formatted labels and value."""
+        pass
+
+    def render(self) -> str:
+        lines = [f"# HELP {self.name} {self.help}", f"# TYPE {self.name} {self.type}"]
+        for suffix, labels, value in self.samples():
+            lines.append(f"{self.name}{suffix}{labels} {format_value(value)}")
+        return "\n".join(lines) + "\n"
+
+
+M = TypeVar("M", bound=Metric)
+
+
+class Counter(Metric):
+    type = "counter"
+
+    def __init__(self, name: str, help: str, label_names: Sequence[str] = ()) -> None:
+        super().__init__(name, help, label_names)
+        self.values: Dict[LabelValues, float] = {}
+
+    def inc(self, label_values: LabelValues = (), amount: float = 1) -> None:
+        with self.lock:
+            self.values[label_values] = self.values.get(label_values, 0) + amount
+
+    def samples(self) -> Iterator[Tuple[str, str, float]]:
+        with self.lock:
+            values = list(self.values.items())
+        for label_values, value in values:
+            yield "", format_labels(self.label_names, label_values), value
+
+
+class Histogram(Metric):
+    type = "histogram"
+
+    def __init__(
+        self,
+        name: str,
+        help: str,
+        label_names: Sequence[str] = (),
+        buckets: Sequence[float] = DEFAULT_BUCKETS,
+    ) -> None:
+        super().__init__(name, help, label_names)
+        self.buckets = tuple(buckets)
+        # Per label values, the count in each bucket, with the last for values
+        # over every bucket, then the sum of every value
+        self.values: Dict[LabelValues, Tuple[List[int], List[float]]] = {}
+
+    def observe(self, label_values: LabelValues, value: float) -> None:
+        index = bisect.bisect_left(self.buckets, value)
+        with self.lock:
+            entry = self.values.get(label_values)
+            if entry is None:
+                entry = self.values[label_values] = ([0] * (len(self.buckets) + 1), [0])
+            entry[0][index] += 1
+            entry[1][0] += value
+
+    def samples(self) -> Iterator[Tuple[str, str, float]]:
+        with self.lock:
+            values = [
+                (label_values, list(counts), total[0])
+                for label_values, (counts, total) in self.values.items()
+            ]
+        label_names = self.label_names + ("le",)
+        for label_values, counts, total in values:
+            cumulative = 0
+            for bound, count in zip(self.buckets + (float("inf"),), counts):
+                cumulative += count
+                yield "_bucket", format_labels(
+                    label_names, label_values + (format_value(bound),)
+                ), cumulative
+            labels = format_labels(self.label_names, label_values)
+            yield "_sum", labels, total
+            yield "_count", labels, cumulative
+
+
+class Collected(Metric):
+    """A metric read when it is scraped, such as the size of a store, so keeping
+    it costs nothing between scrapes."""
+
+    def __init__(
+        self,
+        name: str,
+        help: str,
+        type: str,
+        label_names: Sequence[str],
+        collect: Callable[[], Dict[LabelValues, float]],
+    ) -> None:
+        super().__init__(name, help, label_names)
+        self.type = type
+        self.collect = collect
+
+    def samples(self) -> Iterator[Tuple[str, str, float]]:
+        for label_values, value in self.collect().items():
+            yield "", format_labels(self.label_names, label_values), value
+
+
+class Metrics:
+    """Every metric the app records, in the order they are rendered."""
+
+    def __init__(self) -> None:
+        self.metrics: List[Metric] = []
+        self.request_seconds = self.add(
+            Histogram(
+                "http_request_duration_seconds",
+                "Time to handle a request, until its response was sent",
+                ("method", "route", "status"),
+            )
+        )
+        self.task_manager_seconds = self.add(
+            Histogram(
+                "task_manager_call_duration_seconds",
+                "Time taken by each TaskManager method",
+                ("task_manager", "method"),
+            )
+        )
+        self.task_manager_errors = self.add(
+            Counter(
+                "task_manager_errors_total",
+                "Exceptions raised by each TaskManager method",
+                ("task_manager", "method", "error"),
+            )
+        )
+        self.db_transaction_seconds = self.add(
+            Histogram(
+                "db_transaction_duration_seconds",
+                "Time each sqlite session transaction was open, until it committed "
+                "or rolled back",
+                ("database", "outcome"),
+            )
+        )
+        self.db_commit_seconds = self.add(
+            Histogram(
+                "db_commit_duration_seconds",
+                "Time to flush and commit a sqlite session transaction",
+                ("database",),
+            )
+        )
+
+    def add(self, metric: M) -> M:
+        self.metrics.append(metric)
+        return metric
+
+    def render(self) -> str:
+        return "".join(metric.render() for metric in self.metrics)
+
+
+class MetricsMiddleware:
+    """Records the latency of every request by its route template, so requests
+    for different tasks are counted together."""
+
+    def __init__(self, app: ASGIApp, metrics: Metrics) -> None:
+        self.app = app
+        self.metrics = metrics
+
+    async def __call__(self, scope: Scope, receive: Receive, send: Send) -> None:
+        if scope["type"] != "http":
+            await self.app(scope, receive, send)
+            return
+
+        start = time.perf_counter()
+        # A request that raised before responding is answered with a 500
+        status_code = 500
+
+        async def send_with_status(message: Message) -> None:
+            nonlocal status_code
+            if message["type"] == "http.response.start":
+                status_code = message["status"]
+            await send(message)
+
+        try:
+            await self.app(scope, receive, send_with_status)
+        finally:
+            # Set by the router once a route matched
+            route = scope.get("route")
+            self.metrics.request_seconds.observe(
+                (
+                    scope["method"],
+                    "unmatched" if route is None else route.path,
+                    str(status_code),
+                ),
+                time.perf_counter() - start,
+            )
+
+
+class QueryTimingMiddleware:
+    """Counts and times the sql statements each request runs, adding them to the
+    response as a Server-Timing header and logging them once it is sent.
+
+    A streamed response's headers are sent before its body is read from the
+    database, so only the log includes those statements.
+    """
+
+    def __init__(self, app: ASGIApp) -> None:
+        self.app = app
+
+    async def __call__(self, scope: Scope, receive: Receive, send: Send) -> None:
+        if scope["type"] != "http":
+            await self.app(scope, receive, send)
+            return
+
+        with record_queries() as stats:
+
+            async def send_with_timing(message: Message) -> None:
+                if message["type"] == "http.response.start":
+                    timing = (
+                        f'db;dur={stats.seconds * 1000:.3f};desc="{stats.count} '
+                        f'queries", db-slowest;dur={stats.slowest_seconds * 1000:.3f}'
+                    )
+                    message["headers"] = list(message.get("headers", [])) + [
+                        (b"server-timing", timing.encode("latin-1"))
+                    ]
+                await send(message)
+
+            try:
+                await self.app(scope, receive, send_with_timing)
+            finally:
+                logger.info(
+                    "%s %s ran %d queries in %.1fms, the slowest took %.1fms: %s",
+                    scope["method"],
+                    scope["path"],
+                    stats.count,
+                    stats.seconds * 1000,
+                    stats.slowest_seconds * 1000,
+                    stats.slowest_statement,
+                )
+
+
+def instrument_database(
+    metrics: Metrics, database: Union[Database, AsyncDatabase]
+) -> None:
+    """Records how long the database's session transactions are open and how long
+    they take to commit."""
+    name = os.path.basename(database.engine.url.database or "memory")
+    session_class = database.session_class
+
+    @event.listens_for(session_class, "after_transaction_create")
+    def transaction_created(session: Session, transaction: SessionTransaction) -> None:
+        if transaction.parent is None:
+            session.info["metrics_transaction_start"] = time.perf_counter()
+
+    @event.listens_for(session_class, "before_commit")
+    def before_commit(session: Session) -> None:
+        session.info["metrics_commit_start"] = time.perf_counter()
+
+    @event.listens_for(session_class, "after_commit")
+    def after_commit(session: Session) -> None:
+        start = session.info.pop("metrics_commit_start", None)
+        if start is not None:
+            metrics.db_commit_seconds.observe((name,), time.perf_counter() - start)
+            session.info["metrics_committed"] = True
+
+    @event.listens_for(session_class, "after_transaction_end")
+    def transaction_ended(session: Session, transaction: SessionTransaction) -> None:
+        if transaction.parent is not None:
+            return
+        start = session.info.pop("metrics_transaction_start", None)
+        if start is not None:
+            outcome = (
+                "commit" if session.info.pop("metrics_committed", False) else "rollback"
+            )
+            metrics.db_transaction_seconds.observe(
+                (name, outcome), time.perf_counter() - start
+            )
+
+
+def instrument_in_memory_store(
+    metrics: Metrics, task_manager: InMemoryTaskManager
+) -> None:
+    def sizes() -> Dict[LabelValues, float]:
+        # Counts the task manager keeps, so a scrape doesn't walk the store
+        return {
+            ("users",): len(task_manager.tasks),
+            ("tasks",): task_manager.task_count,
+            ("history_entries",): task_manager.history_entry_count,
+            ("interned_values",): len(task_manager.interned),
+        }
+
+    metrics.add(
+        Collected(
+            "in_memory_store_size",
+            "Number of each kind of thing held by the in memory task manager",
+            "gauge",
+            ("kind",),
+            sizes,
+        )
+    )
+
+
+def instrument_task_cache(metrics: Metrics, cache: TaskCache) -> None:
+    metrics.add(
+        Collected(
+            "task_cache_entries",
+            "Number of tasks, task lists and pages cached",
+            "gauge",
+            (),
+            lambda: {(): len(cache.entries)},
+        )
+    )
+    metrics.add(
+        Collected(
+            "task_cache_lookups_total",
+            "Task cache lookups by result",
+            "counter",
+            ("result",),
+            lambda: {
+                ("hit",): cache.hits,
+                ("miss",): cache.misses,
+            },
+        )
+    )
+    metrics.add(
+        Collected(
+            "task_cache_removals_total",
+            "Entries removed from the task cache other than by invalidation",
+            "counter",
+            ("reason",),
+            lambda: {
+                ("eviction",): cache.evictions,
+                ("expiration",): cache.expirations,
+            },
+        )
+    )
@@ -0,0 +1,149 @@
+"""Move every user's tasks and history to their shard in a new list of shards.
+
+Run it while the app is stopped, then set the shards.urls config to the targets:
+
+    python -m app.reshard \\
+        --source sqlite:///app/task_shard_0.db sqlite:///app/task_shard_1.db \\
+        --target sqlite:///app/new_shard_0.db sqlite:///app/new_shard_1.db \\
+        sqlite:///app/new_shard_2.db
+
+The targets are migrated first and have to be empty. The sources are only read,
+so they are left as they were and can be deleted once the app is running on the
+targets. Tasks keep their versions and positions, so ETags and pagination cursors
+stay valid.
+"""
+
+import argparse
+import json
+from typing import Any, Callable, Dict, List
+
+from sqlalchemy import func, insert, select, Table
+from sqlalchemy.orm import Session
+
+from app.database import Database, upgrade_database
+from app.domain.models import Task
+from app.domain.sharded_task_managers import shard_index
+from app.domain.task_managers import insert_task_labels, task_labels_json
+from app.entities import HistoryEntity, TaskEntity, TasksVersionEntity
+
+# Rows read from a source and written to the targets at a time
+RESHARD_BATCH_SIZE = 5000
+
+task_table = TaskEntity.__table__
+history_table = HistoryEntity.__table__
+tasks_version_table = TasksVersionEntity.__table__
+
+
+def write_to_shards(
+    targets: List[Database],
+    rows: List[Dict[str, Any]],
+    write: Callable[[List[Dict[str, Any]], Session], None],
+) -> None:
+    """Writes each row to the target shard of its user_id, in a transaction per
+    target."""
+    shard_rows: Dict[int, List[Dict[str, Any]]] = {}
+    for row in rows:
+        shard_rows.setdefault(shard_index(row["user_id"], len(targets)), []).append(row)
+    for index, rows in shard_rows.items():
+        with targets[index].session() as session, session.begin():
+            write(rows, session)
+
+
+def insert_task_rows(rows: List[Dict[str, Any]], session: Session) -> None:
+    labels = [json.loads(row.pop("labels")) for row in rows]
+    session.execute(insert(task_table), rows)
+    # Label ids differ between shards, so the labels are linked by name
+    insert_task_labels(
+        [
+            Task.model_construct(id=row["id"], labels=set(task_labels))
+            for row, task_labels in zip(rows, labels)
+        ],
+        session,
+    )
+
+
+def copy_rows(
+    source: Database,
+    targets: List[Database],
+    table: Table,
+    batch_size: int,
+) -> int:
+    def insert_rows(rows: List[Dict[str, Any]], session: Session) -> None:
+        session.execute(insert(table), rows)
+
+    statement = select(table).execution_options(yield_per=batch_size)
+    return copy_selected(source, targets, statement, insert_rows)
+
+
+def copy_selected(
+    source: Database,
+    targets: List[Database],
+    statement: Any,
+    write: Callable[[List[Dict[str, Any]], Session], None],
+) -> int:
+    copied = 0
+    with source.session() as session:
+        for rows in session.execute(statement).mappings().partitions():
+            write_to_shards(targets, [dict(row) for row in rows], write)
+            copied += len(rows)
+    return copied
+
+
+def check_empty(database: Database) -> None:
+    with database.session() as session:
+        for table in (task_table, history_table, tasks_version_table):
+            count = session.execute(select(func.count()).select_from(table)).scalar()
+            if count:
+                raise ValueError(f"{database.engine.url} isn't empty")
+
+
+def reshard(
+    sources: List[Database],
+    targets: List[Database],
+    batch_size: int = RESHARD_BATCH_SIZE,
+) -> Dict[str, int]:
+    """Copies everything in the sources to the targets, returning how many rows
+    of each kind were copied."""
+    for target in targets:
+        check_empty(target)
+
+    # Tasks keep their positions, so each user's tasks keep the order they were
+    # created in
+    tasks_statement = select(
+        task_table, task_labels_json.label("labels")
+    ).execution_options(yield_per=batch_size)
+    copied = {"users": 0, "tasks": 0, "history": 0}
+    for source in sources:
+        copied["users"] += copy_rows(source, targets, tasks_version_table, batch_size)
+        copied["tasks"] += copy_selected(
+            source, targets, tasks_statement, insert_task_rows
+        )
+        copied["history"] += copy_rows(source, targets, history_table, batch_size)
+    return copied
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--source", nargs="+", required=True)
+    parser.add_argument("--target", nargs="+", required=True)
+    parser.add_argument("--batch-size", type=int, default=RESHARD_BATCH_SIZE)
+    args = parser.parse_args()
+    if set(args.source) & set(args.target):
+        parser.error("the targets have to be different databases to the sources")
+
+    for db_url in args.target:
+        upgrade_database(db_url)
+    sources = [Database(db_url) for db_url in args.source]
+    targets = [Database(db_url) for db_url in args.target]
+    copied = reshard(sources, targets, args.batch_size)
+    for database in sources + targets:
+        database.engine.dispose()
+
+    print(
+        f"copied {copied['users']} users, {copied['tasks']} tasks and "
+        f"{copied['history']} history entries to {len(targets)} shards"
+    )
+
+
+if __name__ == "__main__":
+    main()
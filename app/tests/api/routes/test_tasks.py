@@ -1,12 +1,14 @@
 import datetime
+import json
 from uuid import UUID, uuid4
 
 import pytest
 from httpx import QueryParams
 from starlette.testclient import TestClient
 from fastapi import status, FastAPI
+from app.api.resources import MAX_BATCH_SIZE, MAX_IMPORT_LINE_LENGTH
 from app.domain.task_managers import TaskManager
-from app.domain.models import CreateTask, TaskStatus
+from app.domain.models import CreateTask, TaskStatus, UpdateTask
 
 
 @pytest.fixture
@@ -90,12 +92,148 @@ def test_get_tasks(client: TestClient, task_manager: TaskManager, user_id_1: UUI
             task1.model_dump(mode="json", exclude={"user_id"}),
             task2.model_dump(mode="json", exclude={"user_id"}),
             task3.model_dump(mode="json", exclude={"user_id"}),
-        ]
+        ],
+        "next_cursor": None,
+    }
+
+    assert get_tasks_response.status_code == status.HTTP_200_OK
+
+
+def test_get_tasks_paginated(
+    client: TestClient, task_manager: TaskManager, user_id_1: UUID
+):
+    tasks = [
+        task_manager.create_task(CreateTask(name=f"Task {i}", user_id=user_id_1))
+        for i in range(5)
+    ]
+
+    pages = []
+    cursor = None
+    while True:
+        params = {"user_id": user_id_1, "limit": 2}
+        if cursor is not None:
+            params["cursor"] = cursor
+        get_tasks_response = client.get("/tasks", params=QueryParams(params))
+        assert get_tasks_response.status_code == status.HTTP_200_OK
+
+        get_tasks_payload = get_tasks_response.json()
+        pages.append([task["id"] for task in get_tasks_payload["data"]])
+        cursor = get_tasks_payload["next_cursor"]
+        if cursor is None:
+            break
+
+    assert pages == [
+        [str(tasks[0].id), str(tasks[1].id)],
+        [str(tasks[2].id), str(tasks[3].id)],
+        [str(tasks[4].id)],
+    ]
+
+
+def test_get_tasks_invalid_cursor(client: TestClient, user_id_1: UUID):
+    get_tasks_response = client.get(
+        "/tasks", params=QueryParams(user_id=user_id_1, cursor="not a cursor")
+    )
+
+    assert get_tasks_response.json() == {
+        "detail": {"key": "invalid_cursor", "message": "cursor is invalid"}
     }
+    assert get_tasks_response.status_code == status.HTTP_400_BAD_REQUEST
+
 
+def test_get_tasks_filtered_and_sorted(
+    client: TestClient, task_manager: TaskManager, user_id_1: UUID
+):
+    today = datetime.date.today()
+    task1 = task_manager.create_task(
+        CreateTask(name="Dishes", user_id=user_id_1, labels={"kitchen"})
+    )
+    task2 = task_manager.create_task(
+        CreateTask(
+            name="Cook", user_id=user_id_1, due_date=today, labels={"kitchen", "daily"}
+        )
+    )
+    task_manager.create_task(
+        CreateTask(
+            name="Bins", user_id=user_id_1, status=TaskStatus.DONE, labels={"kitchen"}
+        )
+    )
+
+    get_tasks_response = client.get(
+        "/tasks",
+        params=QueryParams(
+            user_id=user_id_1,
+            status=["Pending", "Doing"],
+            labels_any="kitchen",
+            sort="due_date",
+        ),
+    )
+    get_tasks_payload = get_tasks_response.json()
+    assert [task["id"] for task in get_tasks_payload["data"]] == [
+        str(task2.id),
+        str(task1.id),
+    ]
     assert get_tasks_response.status_code == status.HTTP_200_OK
 
 
+def test_get_task_not_modified(
+    client: TestClient, task_manager: TaskManager, user_id_1: UUID
+) -> None:
+    task = task_manager.create_task(CreateTask(name="Dishes", user_id=user_id_1))
+
+    get_task_response = client.get(
+        f"/tasks/{task.id}", params=QueryParams(user_id=user_id_1)
+    )
+    etag = get_task_response.headers["ETag"]
+
+    not_modified_response = client.get(
+        f"/tasks/{task.id}",
+        params=QueryParams(user_id=user_id_1),
+        headers={"If-None-Match": etag},
+    )
+    assert not_modified_response.status_code == status.HTTP_304_NOT_MODIFIED
+    assert not_modified_response.headers["ETag"] == etag
+    assert not_modified_response.content == b""
+
+    task_manager.update_task(
+        UpdateTask(**{**task.model_dump(), "status": TaskStatus.DONE}), user_id_1
+    )
+    modified_response = client.get(
+        f"/tasks/{task.id}",
+        params=QueryParams(user_id=user_id_1),
+        headers={"If-None-Match": etag},
+    )
+    assert modified_response.status_code == status.HTTP_200_OK
+    assert modified_response.json()["data"]["status"] == "Done"
+    assert modified_response.headers["ETag"] != etag
+
+
+def test_get_tasks_not_modified(
+    client: TestClient, task_manager: TaskManager, user_id_1: UUID, user_id_2: UUID
+) -> None:
+    task_manager.create_task(CreateTask(name="Dishes", user_id=user_id_1))
+
+    get_tasks_response = client.get("/tasks", params=QueryParams(user_id=user_id_1))
+    etag = get_tasks_response.headers["ETag"]
+
+    # Other users' writes don't change the user's tasks
+    task_manager.create_task(CreateTask(name="Dishes", user_id=user_id_2))
+    not_modified_response = client.get(
+        "/tasks",
+        params=QueryParams(user_id=user_id_1),
+        headers={"If-None-Match": f'W/{etag}, "other"'},
+    )
+    assert not_modified_response.status_code == status.HTTP_304_NOT_MODIFIED
+
+    task_manager.create_task(CreateTask(name="Cook", user_id=user_id_1))
+    modified_response = client.get(
+        "/tasks",
+        params=QueryParams(user_id=user_id_1),
+        headers={"If-None-Match": etag},
+    )
+    assert modified_response.status_code == status.HTTP_200_OK
+    assert len(modified_response.json()["data"]) == 2
+
+
 def test_update_task(client: TestClient, task_manager: TaskManager, user_id_1: UUID):
     task = task_manager.create_task(CreateTask(name="Dishes", user_id=user_id_1))
 
@@ -202,6 +340,86 @@ def test_update_task_not_found(
     assert update_tasks_response.status_code == status.HTTP_404_NOT_FOUND
 
 
+def test_update_task_if_match(
+    client: TestClient, task_manager: TaskManager, user_id_1: UUID
+) -> None:
+    task = task_manager.create_task(CreateTask(name="Dishes", user_id=user_id_1))
+    etag = client.get(
+        f"/tasks/{task.id}", params=QueryParams(user_id=user_id_1)
+    ).headers["ETag"]
+    update_task_request_body = {
+        "name": "Wash & Dry Dishes",
+        "status": "Done",
+        "due_date": None,
+        "labels": [],
+        "sub_tasks": [],
+    }
+
+    for if_match, expected_status in [
+        (etag, status.HTTP_200_OK),
+        # The first update changed the task
+        (etag, status.HTTP_412_PRECONDITION_FAILED),
+        (f"W/{etag}", status.HTTP_412_PRECONDITION_FAILED),
+        ("*", status.HTTP_200_OK),
+    ]:
+        update_task_response = client.put(
+            f"/tasks/{task.id}",
+            params=QueryParams(user_id=user_id_1),
+            json=update_task_request_body,
+            headers={"If-Match": if_match},
+        )
+        assert update_task_response.status_code == expected_status
+
+    assert update_task_response.json() == {
+        "data": {"id": str(task.id), **update_task_request_body}
+    }
+    # The updated task's ETag can be sent straight back without another GET
+    etag = update_task_response.headers["ETag"]
+    assert (
+        etag
+        == client.get(
+            f"/tasks/{task.id}", params=QueryParams(user_id=user_id_1)
+        ).headers["ETag"]
+    )
+    update_task_response = client.put(
+        f"/tasks/{task.id}",
+        params=QueryParams(user_id=user_id_1),
+        json={**update_task_request_body, "name": "Dishes again"},
+        headers={"If-Match": etag},
+    )
+    assert update_task_response.status_code == status.HTTP_200_OK
+    assert update_task_response.headers["ETag"] != etag
+
+
+def test_delete_task_if_match(
+    client: TestClient, task_manager: TaskManager, user_id_1: UUID
+) -> None:
+    task = task_manager.create_task(CreateTask(name="Dishes", user_id=user_id_1))
+
+    delete_task_response = client.delete(
+        f"/tasks/{task.id}",
+        params=QueryParams(user_id=user_id_1),
+        headers={"If-Match": '"0"'},
+    )
+    assert delete_task_response.json() == {
+        "detail": {
+            "key": "task_version_mismatch",
+            "message": "task has changed since it was read",
+        }
+    }
+    assert delete_task_response.status_code == status.HTTP_412_PRECONDITION_FAILED
+
+    etag = client.get(
+        f"/tasks/{task.id}", params=QueryParams(user_id=user_id_1)
+    ).headers["ETag"]
+    delete_task_response = client.delete(
+        f"/tasks/{task.id}",
+        params=QueryParams(user_id=user_id_1),
+        headers={"If-Match": etag},
+    )
+    assert delete_task_response.status_code == status.HTTP_204_NO_CONTENT
+
+
 def test_delete_task(
     client: TestClient, task_manager: TaskManager, user_id_1: UUID
 ) -> None:
@@ -232,6 +450,220 @@ def test_delete_task_not_found(
     assert delete_task_response.status_code == status.HTTP_404_NOT_FOUND
 
 
+def test_export_tasks(
+    client: TestClient, task_manager: TaskManager, user_id_1: UUID, user_id_2: UUID
+) -> None:
+    tasks = [
+        task_manager.create_task(
+            CreateTask(name=f"Task {i}", user_id=user_id_1, labels={"kitchen"})
+        )
+        for i in range(3)
+    ]
+    task_manager.create_task(CreateTask(name="Dishes", user_id=user_id_2))
+
+    export_tasks_response = client.get(
+        "/tasks/export", params=QueryParams(user_id=user_id_1)
+    )
+
+    assert export_tasks_response.status_code == status.HTTP_200_OK
+    assert export_tasks_response.headers["content-type"] == "application/x-ndjson"
+    assert [json.loads(line) for line in export_tasks_response.iter_lines()] == [
+        task.model_dump(mode="json", exclude={"user_id"}) for task in tasks
+    ]
+
+
+def test_import_tasks(
+    client: TestClient, task_manager: TaskManager, user_id_1: UUID
+) -> None:
+    body = "\n".join(
+        [
+            json.dumps({"name": "Dishes", "labels": ["kitchen"]}),
+            "",
+            json.dumps({"name": "Cook", "due_date": "not a date"}),
+            "{not json",
+            json.dumps({"name": "Bins", "due_date": "2024-06-01"}),
+        ]
+    )
+
+    import_tasks_response = client.post(
+        "/tasks/import",
+        params=QueryParams(user_id=user_id_1),
+        content=body.encode(),
+        headers={"content-type": "application/x-ndjson"},
+    )
+
+    assert import_tasks_response.status_code == status.HTTP_200_OK
+    result = import_tasks_response.json()["data"]
+    assert (result["imported"], result["failed"]) == (2, 2)
+    assert [(error["line"], error["key"]) for error in result["errors"]] == [
+        (3, "invalid_task"),
+        (4, "invalid_task"),
+    ]
+    assert result["errors"][0]["message"].startswith("due_date: ")
+    tasks = task_manager.get_tasks(user_id_1)
+    assert [(task.name, task.labels, task.due_date) for task in tasks] == [
+        ("Dishes", {"kitchen"}, None),
+        ("Bins", set(), datetime.date(2024, 6, 1)),
+    ]
+
+
+def test_import_reports_lines_that_are_too_long(
+    client: TestClient, task_manager: TaskManager, user_id_1: UUID
+) -> None:
+    body = "\n".join(
+        [
+            json.dumps({"name": "x" * MAX_IMPORT_LINE_LENGTH}),
+            json.dumps({"name": "Dishes"}),
+        ]
+    )
+
+    import_tasks_response = client.post(
+        "/tasks/import",
+        params=QueryParams(user_id=user_id_1),
+        content=body.encode(),
+        headers={"content-type": "application/x-ndjson"},
+    )
+
+    result = import_tasks_response.json()["data"]
+    assert (result["imported"], result["failed"]) == (1, 1)
+    assert [(error["line"], error["key"]) for error in result["errors"]] == [
+        (1, "line_too_long")
+    ]
+    assert [task.name for task in task_manager.get_tasks(user_id_1)] == ["Dishes"]
+
+
+def test_batch_create_update_and_delete_tasks(
+    client: TestClient, task_manager: TaskManager, user_id_1: UUID
+) -> None:
+    create_tasks_response = client.post(
+        "/tasks/batch/create",
+        params=QueryParams(user_id=user_id_1),
+        json={"tasks": [{"name": "Dishes", "labels": ["kitchen"]}, {"name": "Cook"}]},
+    )
+    assert create_tasks_response.status_code == status.HTTP_200_OK
+    created_tasks = create_tasks_response.json()["data"]
+    assert [(task["status"], task["data"]["name"]) for task in created_tasks] == [
+        (status.HTTP_201_CREATED, "Dishes"),
+        (status.HTTP_201_CREATED, "Cook"),
+    ]
+    task_ids = [task["data"]["id"] for task in created_tasks]
+
+    missing_task_id = str(uuid4())
+    update_tasks_response = client.post(
+        "/tasks/batch/update",
+        params=QueryParams(user_id=user_id_1),
+        json={
+            "tasks": [
+                {**created_tasks[0]["data"], "status": "Done"},
+                {**created_tasks[1]["data"], "id": missing_task_id},
+            ]
+        },
+    )
+    assert update_tasks_response.json() == {
+        "data": [
+            {
+                "status": status.HTTP_200_OK,
+                "data": {**created_tasks[0]["data"], "status": "Done"},
+                "error": None,
+            },
+            {
+                "status": status.HTTP_404_NOT_FOUND,
+                "data": None,
+                "error": {"key": "task_not_found", "message": "task not found"},
+            },
+        ]
+    }
+
+    delete_tasks_response = client.post(
+        "/tasks/batch/delete",
+        params=QueryParams(user_id=user_id_1),
+        json={"task_ids": [task_ids[0], missing_task_id, task_ids[1]]},
+    )
+    assert [task["status"] for task in delete_tasks_response.json()["data"]] == [
+        status.HTTP_204_NO_CONTENT,
+        status.HTTP_404_NOT_FOUND,
+        status.HTTP_204_NO_CONTENT,
+    ]
+    assert task_manager.get_tasks(user_id_1) == []
+
+
+def test_batch_too_large(client: TestClient, user_id_1: UUID) -> None:
+    create_tasks_response = client.post(
+        "/tasks/batch/create",
+        params=QueryParams(user_id=user_id_1),
+        json={"tasks": [{"name": "Dishes"}] * (MAX_BATCH_SIZE + 1)},
+    )
+    assert create_tasks_response.status_code == status.HTTP_422_UNPROCESSABLE_ENTITY
+
+
+def test_batch_restore_tasks(
+    client: TestClient, task_manager: TaskManager, user_id_1: UUID
+) -> None:
+    task_1, task_2 = task_manager.create_tasks(
+        [
+            CreateTask(name="Dishes", user_id=user_id_1, labels={"kitchen"}),
+            CreateTask(name="Cook", user_id=user_id_1),
+        ]
+    )
+    task_manager.delete_tasks([task_1.id, task_2.id], user_id_1)
+    task_manager.restore_task(task_2.id, user_id_1)
+    missing_task_id = str(uuid4())
+
+    restore_tasks_response = client.post(
+        "/tasks/batch/restore",
+        params=QueryParams(user_id=user_id_1),
+        json={"task_ids": [str(task_1.id), missing_task_id, str(task_2.id)]},
+    )
+
+    assert restore_tasks_response.json() == {
+        "data": [
+            {
+                "status": status.HTTP_200_OK,
+                "data": json.loads(task_1.model_dump_json(exclude={"user_id"})),
+                "error": None,
+            },
+            {
+                "status": status.HTTP_404_NOT_FOUND,
+                "data": None,
+                "error": {"key": "task_not_found", "message": "task not found"},
+            },
+            {
+                "status": status.HTTP_400_BAD_REQUEST,
+                "data": json.loads(task_2.model_dump_json(exclude={"user_id"})),
+                "error": {
+                    "key": "task_already_exists",
+                    "message": "task already exists",
+                },
+            },
+        ]
+    }
+    assert task_manager.get_task(task_1.id, user_id_1) == task_1
+
+    task_manager.delete_task(task_1.id, user_id_1)
+    restore_tasks_response = client.post(
+        "/tasks/batch/restore",
+        params=QueryParams(user_id=user_id_1),
+        json={
+            "deleted_since": (
+                datetime.datetime.now(datetime.timezone.utc)
+                - datetime.timedelta(minutes=1)
+            ).isoformat()
+        },
+    )
+    assert [
+        (result["status"], result["data"]["id"])
+        for result in restore_tasks_response.json()["data"]
+    ] == [
+        (status.HTTP_200_OK, str(task_1.id)),
+        (status.HTTP_400_BAD_REQUEST, str(task_2.id)),
+    ]
+
+    restore_tasks_response = client.post(
+        "/tasks/batch/restore", params=QueryParams(user_id=user_id_1), json={}
+    )
+    assert restore_tasks_response.status_code == status.HTTP_422_UNPROCESSABLE_ENTITY
+
+
 def test_restore_task(
     client: TestClient, task_manager: TaskManager, user_id_1: UUID
 ) -> None:
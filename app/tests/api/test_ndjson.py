@@ -0,0 +1,52 @@
+from typing import AsyncIterator, List
+
+import pytest
+
+from app.api.ndjson import ndjson_lines
+
+
+async def stream(chunks: List[bytes]) -> AsyncIterator[bytes]:
+    for chunk in chunks:
+        yield chunk
+
+
+@pytest.mark.anyio
+async def test_ndjson_lines() -> None:
+    chunks = [b'{"name": "Dis', b'hes"}\n\n  \n{"name"', b': "Cook"}\n{"name": "Bins"}']
+
+    lines = [line async for line in ndjson_lines(stream(chunks), 100)]
+
+    assert lines == [
+        (1, b'{"name": "Dishes"}'),
+        (4, b'{"name": "Cook"}'),
+        (5, b'{"name": "Bins"}'),
+    ]
+
+
+@pytest.mark.anyio
+async def test_lines_over_the_max_length_are_dropped() -> None:
+    chunks = [
+        b'{"name": "Dishes"}\n{"name": "',
+        b"x" * 30,
+        b"x" * 30 + b'"}\n{"name": "Cook"}\n',
+        b"y" * 50,
+        b"y" * 50,
+    ]
+
+    lines = [line async for line in ndjson_lines(stream(chunks), 40)]
+
+    assert lines == [
+        (1, b'{"name": "Dishes"}'),
+        (2, None),
+        (3, b'{"name": "Cook"}'),
+        (4, None),
+    ]
+
+
+@pytest.mark.anyio
+async def test_a_line_of_exactly_the_max_length_is_kept() -> None:
+    chunks = [b"a" * 5, b"b" * 5 + b"\n" + b"c" * 10]
+
+    lines = [line async for line in ndjson_lines(stream(chunks), 10)]
+
+    assert lines == [(1, b"a" * 5 + b"b" * 5), (2, b"c" * 10)]
@@ -0,0 +1,96 @@
+from datetime import date
+from typing import Any, List
+from uuid import UUID, uuid4
+
+import pytest
+from fastapi import status
+from fastapi.responses import JSONResponse
+from fastapi.routing import serialize_response
+from fastapi.utils import create_response_field
+
+from app.api.resources import (
+    BatchItemResult,
+    BatchResponse,
+    PaginatedResponse,
+    StandardResponse,
+    TaskResource,
+)
+from app.api.serialization import (
+    TASK_NOT_FOUND_RESULT,
+    task_batch_response,
+    task_json,
+    task_page_response,
+    task_response,
+)
+from app.domain.models import Task, TaskStatus
+
+
+async def fastapi_json(response_model: Any, content: Any) -> bytes:
+    """The body FastAPI renders for content returned by a route with this
+    response_model."""
+    field = create_response_field(name="response", type_=response_model)
+    return JSONResponse(
+        await serialize_response(field=field, response_content=content)
+    ).body
+
+
+@pytest.fixture
+def tasks(user_id_1: UUID) -> List[Task]:
+    return [
+        Task(id=uuid4(), name="Dishes", user_id=user_id_1),
+        Task(
+            id=uuid4(),
+            name='Café "crème" \\ ☕ \u0001\n\t',
+            status=TaskStatus.BLOCKED,
+            labels={"kitchen", "naïve", "😀"},
+            due_date=date(2024, 6, 30),
+            sub_tasks=[{"name": "Milk"}, 2.5, None],
+            user_id=user_id_1,
+        ),
+    ]
+
+
+@pytest.mark.anyio
+async def test_responses_match_fastapi(tasks: List[Task]) -> None:
+    resources = [TaskResource(**task.model_dump()) for task in tasks]
+
+    assert task_response(tasks[1]).body == await fastapi_json(
+        StandardResponse[TaskResource],
+        StandardResponse[TaskResource](data=resources[1]),
+    )
+    assert task_page_response(tasks, "cursor", '"1"').body == await fastapi_json(
+        PaginatedResponse[TaskResource],
+        PaginatedResponse[TaskResource](data=resources, next_cursor="cursor"),
+    )
+    assert task_page_response([], None, '"1"').body == await fastapi_json(
+        PaginatedResponse[TaskResource], PaginatedResponse[TaskResource](data=[])
+    )
+    assert task_batch_response(
+        [
+            BatchItemResult[Task].model_construct(
+                status=status.HTTP_201_CREATED, data=tasks[1]
+            ),
+            BatchItemResult[Task].model_construct(status=status.HTTP_204_NO_CONTENT),
+            TASK_NOT_FOUND_RESULT,
+        ]
+    ).body == await fastapi_json(
+        BatchResponse[TaskResource],
+        BatchResponse[TaskResource](
+            data=[
+                BatchItemResult[TaskResource](
+                    status=status.HTTP_201_CREATED, data=resources[1]
+                ),
+                BatchItemResult[TaskResource](status=status.HTTP_204_NO_CONTENT),
+                BatchItemResult[TaskResource](**TASK_NOT_FOUND_RESULT.model_dump()),
+            ]
+        ),
+    )
+    assert task_json(tasks[1]) == resources[1].model_dump_json().encode()
+
+
+def test_task_response_headers(tasks: List[Task]) -> None:
+    response = task_response(tasks[0], status_code=status.HTTP_201_CREATED, etag='"2"')
+
+    assert response.status_code == status.HTTP_201_CREATED
+    assert response.headers["content-type"] == "application/json"
+    assert response.headers["etag"] == '"2"'
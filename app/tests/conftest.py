@@ -1,10 +1,14 @@
+from contextlib import AbstractContextManager, contextmanager
+from typing import AsyncIterator, Callable, Iterator, List
 from uuid import uuid4
 
 import pytest
 from fastapi import FastAPI
 
-from app.domain.task_managers import TaskManager
-from app.main import create_app
+from app.database import AsyncDatabase, Database, QueryStats, record_queries
+from app.domain.async_task_managers import AsyncSqliteTaskManager, AsyncTaskManager
+from app.domain.task_managers import SqliteTaskManager, TaskManager
+from app.main import close_task_manager, create_app
 
 
 @pytest.fixture
@@ -18,13 +22,83 @@ def user_id_2():
 
 
 @pytest.fixture
-def app() -> FastAPI:
-    app = create_app()
-    yield app
-    # TODO figure out how to type hint container
-    app.container.unwire()
+def app_factory(tmp_path) -> Callable[[], FastAPI]:
+    """Creates apps whose durable task log is in the test's own directory, rather
+    than app/task_log. Set any environment variables before calling it."""
+    apps: List[FastAPI] = []
+
+    def factory() -> FastAPI:
+        app = create_app()
+        app.container.config.durable.directory.from_value(f"{tmp_path}/task_log")
+        apps.append(app)
+        return app
+
+    yield factory
+    for app in apps:
+        close_task_manager(app.container)
+        # TODO figure out how to type hint container
+        app.container.unwire()
+
+
+@pytest.fixture
+def app(app_factory: Callable[[], FastAPI]) -> FastAPI:
+    return app_factory()
 
 
 @pytest.fixture
 def task_manager(app: FastAPI) -> TaskManager:
     return app.container.task_manager()
+
+
+@pytest.fixture
+def async_task_manager(app: FastAPI) -> AsyncTaskManager:
+    return app.container.async_task_manager()
+
+
+@pytest.fixture
+def anyio_backend() -> str:
+    return "asyncio"
+
+
+@pytest.fixture
+def database(tmp_path) -> Database:
+    """A fresh sqlite database, independent of TASK_MANAGER_TYPE."""
+    database = Database(db_url=f"sqlite:///{tmp_path}/task.db")
+    database.create_database()
+    yield database
+    database.engine.dispose()
+
+
+@pytest.fixture
+def sqlite_task_manager(database: Database) -> SqliteTaskManager:
+    return SqliteTaskManager(session_factory=database.session)
+
+
+@pytest.fixture
+async def async_sqlite_task_manager(
+    database: Database,
+) -> AsyncIterator[AsyncSqliteTaskManager]:
+    async_database = AsyncDatabase(db_url=str(database.engine.url))
+    yield AsyncSqliteTaskManager(session_factory=async_database.session)
+    await async_database.engine.dispose()
+
+
+@pytest.fixture
+def max_queries() -> Callable[[int], AbstractContextManager[QueryStats]]:
+    """Fails the test if the block runs more than limit sql statements.
+
+    with max_queries(2):
+        task_manager.get_tasks(user_id)
+    """
+
+    @contextmanager
+    def assert_max_queries(limit: int) -> Iterator[QueryStats]:
+        with record_queries(QueryStats(statements=[])) as stats:
+            yield stats
+        assert (
+            stats.count <= limit
+        ), f"{stats.count} queries run, expected at most {limit}:\n" + "\n".join(
+            stats.statements or []
+        )
+
+    return assert_max_queries
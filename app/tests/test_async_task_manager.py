@@ -0,0 +1,106 @@
+from datetime import date
+from uuid import UUID
+
+import pytest
+
+from app.domain.async_task_managers import AsyncSqliteTaskManager, AsyncTaskManager
+from app.domain.errors import TaskAlreadyExists
+from app.domain.models import CreateTask, TaskStatus, UpdateTask
+from app.domain.task_managers import SqliteTaskManager, TaskManager
+
+pytestmark = pytest.mark.anyio
+
+
+async def test_task_lifecycle(
+    async_task_manager: AsyncTaskManager, user_id_1: UUID, user_id_2: UUID
+) -> None:
+    created_task = await async_task_manager.create_task(
+        CreateTask(
+            name="Dishes",
+            user_id=user_id_1,
+            due_date=date.today(),
+            labels={"kitchen", "daily"},
+        )
+    )
+    await async_task_manager.create_task(CreateTask(name="Cook", user_id=user_id_2))
+
+    assert await async_task_manager.get_task(created_task.id, user_id_1) == created_task
+    assert await async_task_manager.get_task(created_task.id, user_id_2) is None
+    assert await async_task_manager.get_tasks(user_id_1) == [created_task]
+
+    versioned_task = await async_task_manager.update_task(
+        UpdateTask(
+            **{
+                **created_task.model_dump(),
+                "status": TaskStatus.DONE,
+                "labels": {"kitchen", "hourly"},
+            }
+        ),
+        user_id_1,
+    )
+    updated_task = versioned_task.task
+    assert versioned_task.version == await async_task_manager.get_task_version(
+        created_task.id, user_id_1
+    )
+    assert updated_task == created_task.model_copy(
+        update={"status": TaskStatus.DONE, "labels": {"kitchen", "hourly"}}
+    )
+
+    assert await async_task_manager.delete_task(created_task.id, user_id_1) == (
+        updated_task
+    )
+    assert await async_task_manager.get_task(created_task.id, user_id_1) is None
+    history_entry = await async_task_manager.get_last_history_entry(
+        created_task.id, user_id_1
+    )
+    assert history_entry.entity_id == created_task.id
+
+    assert await async_task_manager.restore_task(created_task.id, user_id_1) == (
+        updated_task
+    )
+    with pytest.raises(TaskAlreadyExists):
+        await async_task_manager.restore_task(created_task.id, user_id_1)
+
+
+async def test_shares_storage_with_task_manager(
+    async_task_manager: AsyncTaskManager, task_manager: TaskManager, user_id_1: UUID
+) -> None:
+    task = task_manager.create_task(CreateTask(name="Dishes", user_id=user_id_1))
+
+    assert await async_task_manager.get_tasks(user_id_1) == [task]
+
+
+async def test_async_sqlite_task_manager(
+    async_sqlite_task_manager: AsyncSqliteTaskManager,
+    sqlite_task_manager: SqliteTaskManager,
+    user_id_1: UUID,
+) -> None:
+    created_task = await async_sqlite_task_manager.create_task(
+        CreateTask(name="Dishes", user_id=user_id_1, labels={"kitchen", "daily"})
+    )
+
+    assert sqlite_task_manager.get_tasks(user_id_1) == [created_task]
+    assert await async_sqlite_task_manager.get_tasks(user_id_1) == [created_task]
+
+
+async def test_iter_tasks(
+    async_task_manager: AsyncTaskManager,
+    async_sqlite_task_manager: AsyncSqliteTaskManager,
+    task_manager: TaskManager,
+    sqlite_task_manager: SqliteTaskManager,
+    user_id_1: UUID,
+) -> None:
+    for sync_task_manager, streaming_task_manager in [
+        (task_manager, async_task_manager),
+        (sqlite_task_manager, async_sqlite_task_manager),
+    ]:
+        tasks = sync_task_manager.create_tasks(
+            [
+                CreateTask(name=f"Task {i}", user_id=user_id_1, labels={f"label {i}"})
+                for i in range(3)
+            ]
+        )
+
+        assert [
+            task async for task in streaming_task_manager.iter_tasks(user_id_1)
+        ] == tasks
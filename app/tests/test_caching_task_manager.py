@@ -0,0 +1,208 @@
+from typing import List
+from uuid import UUID
+
+import pytest
+
+from app.domain.async_task_managers import AsyncInMemoryTaskManager
+from app.domain.caching_task_managers import (
+    AsyncCachingTaskManager,
+    CachingTaskManager,
+    TaskCache,
+)
+from app.domain.models import CreateTask, TaskQuery, TaskStatus, UpdateTask
+from app.domain.task_managers import InMemoryTaskManager
+
+
+class Clock:
+    def __init__(self) -> None:
+        self.now = 0.0
+
+    def __call__(self) -> float:
+        return self.now
+
+
+class CountingTaskManager(InMemoryTaskManager):
+    """Counts the reads that reach the wrapped task manager."""
+
+    def __init__(self) -> None:
+        super().__init__()
+        self.reads: List[str] = []
+
+    def get_task(self, task_id, user_id):
+        self.reads.append("get_task")
+        return super().get_task(task_id, user_id)
+
+    def get_tasks(self, user_id, query=None):
+        self.reads.append("get_tasks")
+        return super().get_tasks(user_id, query)
+
+
+@pytest.fixture
+def clock() -> Clock:
+    return Clock()
+
+
+@pytest.fixture
+def counting_task_manager() -> CountingTaskManager:
+    return CountingTaskManager()
+
+
+@pytest.fixture
+def caching_task_manager(
+    counting_task_manager: CountingTaskManager, clock: Clock
+) -> CachingTaskManager:
+    return CachingTaskManager(
+        counting_task_manager, TaskCache(max_size=3, ttl=10, clock=clock)
+    )
+
+
+def test_reads_are_cached(
+    caching_task_manager: CachingTaskManager,
+    counting_task_manager: CountingTaskManager,
+    user_id_1: UUID,
+) -> None:
+    task = caching_task_manager.create_task(
+        CreateTask(name="Dishes", user_id=user_id_1)
+    )
+
+    assert caching_task_manager.get_task(task.id, user_id_1) == task
+    assert caching_task_manager.get_task(task.id, user_id_1) == task
+    assert caching_task_manager.get_tasks(user_id_1) == [task]
+    assert caching_task_manager.get_tasks(user_id_1) == [task]
+
+    assert counting_task_manager.reads == ["get_task", "get_tasks"]
+    assert caching_task_manager.cache.stats() == {
+        "hits": 2,
+        "misses": 2,
+        "evictions": 0,
+        "expirations": 0,
+        "size": 2,
+    }
+
+
+def test_writes_invalidate_only_what_they_change(
+    caching_task_manager: CachingTaskManager,
+    counting_task_manager: CountingTaskManager,
+    user_id_1: UUID,
+    user_id_2: UUID,
+) -> None:
+    task_1 = caching_task_manager.create_task(
+        CreateTask(name="Dishes", user_id=user_id_1)
+    )
+    task_2 = caching_task_manager.create_task(
+        CreateTask(name="Cook", user_id=user_id_1)
+    )
+    other_users_task = caching_task_manager.create_task(
+        CreateTask(name="Bins", user_id=user_id_2)
+    )
+    caching_task_manager.get_task(task_1.id, user_id_1)
+    caching_task_manager.get_task(task_2.id, user_id_1)
+    caching_task_manager.get_tasks(user_id_2)
+    counting_task_manager.reads.clear()
+
+    updated_task = caching_task_manager.update_task(
+        UpdateTask(**{**task_1.model_dump(), "status": TaskStatus.DONE}), user_id_1
+    ).task
+
+    assert caching_task_manager.get_task(task_1.id, user_id_1) == updated_task
+    assert caching_task_manager.get_task(task_2.id, user_id_1) == task_2
+    assert caching_task_manager.get_tasks(user_id_2) == [other_users_task]
+    assert counting_task_manager.reads == ["get_task"]
+
+    caching_task_manager.delete_task(task_2.id, user_id_1)
+    assert caching_task_manager.get_task(task_2.id, user_id_1) is None
+    caching_task_manager.restore_task(task_2.id, user_id_1)
+    assert caching_task_manager.get_task(task_2.id, user_id_1) == task_2
+
+
+def test_task_lists_are_invalidated_by_any_write(
+    caching_task_manager: CachingTaskManager, user_id_1: UUID
+) -> None:
+    query = TaskQuery(statuses={TaskStatus.PENDING})
+    assert caching_task_manager.get_tasks(user_id_1, query) == []
+
+    task = caching_task_manager.create_task(
+        CreateTask(name="Dishes", user_id=user_id_1)
+    )
+    assert caching_task_manager.get_tasks(user_id_1, query) == [task]
+    assert caching_task_manager.get_tasks_page(user_id_1, 10, query=query).tasks == [
+        task
+    ]
+
+    caching_task_manager.update_tasks(
+        [UpdateTask(**{**task.model_dump(), "status": TaskStatus.DONE})], user_id_1
+    )
+    assert caching_task_manager.get_tasks(user_id_1, query) == []
+    assert caching_task_manager.get_tasks_page(user_id_1, 10, query=query).tasks == []
+
+
+def test_least_recently_used_entry_is_evicted(
+    caching_task_manager: CachingTaskManager,
+    counting_task_manager: CountingTaskManager,
+    user_id_1: UUID,
+) -> None:
+    tasks = caching_task_manager.create_tasks(
+        [CreateTask(name=f"Task {i}", user_id=user_id_1) for i in range(4)]
+    )
+    for task in tasks[:3]:
+        caching_task_manager.get_task(task.id, user_id_1)
+    # tasks[1] becomes the least recently used
+    caching_task_manager.get_task(tasks[0].id, user_id_1)
+    caching_task_manager.get_task(tasks[3].id, user_id_1)
+    counting_task_manager.reads.clear()
+
+    caching_task_manager.get_task(tasks[0].id, user_id_1)
+    caching_task_manager.get_task(tasks[1].id, user_id_1)
+
+    assert counting_task_manager.reads == ["get_task"]
+    assert caching_task_manager.cache.evictions == 2
+
+
+def test_entries_expire(
+    caching_task_manager: CachingTaskManager,
+    counting_task_manager: CountingTaskManager,
+    clock: Clock,
+    user_id_1: UUID,
+) -> None:
+    task = caching_task_manager.create_task(
+        CreateTask(name="Dishes", user_id=user_id_1)
+    )
+    caching_task_manager.get_task(task.id, user_id_1)
+
+    clock.now = 9
+    caching_task_manager.get_task(task.id, user_id_1)
+    clock.now = 10
+    caching_task_manager.get_task(task.id, user_id_1)
+
+    assert counting_task_manager.reads == ["get_task", "get_task"]
+    assert caching_task_manager.cache.expirations == 1
+
+
+def test_read_racing_a_write_is_not_cached(user_id_1: UUID) -> None:
+    cache = TaskCache()
+    generation = cache.generation(user_id_1)
+    cache.invalidate(user_id_1)
+
+    cache.put((user_id_1, "tasks", None), [], generation)
+
+    assert cache.stats()["size"] == 0
+
+
+@pytest.mark.anyio
+async def test_async_caching_task_manager_shares_the_cache(
+    caching_task_manager: CachingTaskManager,
+    counting_task_manager: CountingTaskManager,
+    user_id_1: UUID,
+) -> None:
+    async_caching_task_manager = AsyncCachingTaskManager(
+        AsyncInMemoryTaskManager(counting_task_manager), caching_task_manager.cache
+    )
+    task = await async_caching_task_manager.create_task(
+        CreateTask(name="Dishes", user_id=user_id_1)
+    )
+    assert await async_caching_task_manager.get_tasks(user_id_1) == [task]
+
+    caching_task_manager.delete_task(task.id, user_id_1)
+
+    assert await async_caching_task_manager.get_tasks(user_id_1) == []
+    assert counting_task_manager.reads == ["get_tasks", "get_tasks"]
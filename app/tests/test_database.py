@@ -0,0 +1,34 @@
+from app.database import Database
+
+
+def test_pragmas_are_applied_to_new_connections(database: Database) -> None:
+    with database.engine.connect() as connection:
+        pragma = connection.exec_driver_sql
+
+        assert pragma("PRAGMA journal_mode").scalar() == "wal"
+        assert pragma("PRAGMA synchronous").scalar() == 1  # NORMAL
+        assert pragma("PRAGMA busy_timeout").scalar() == 5000
+        assert pragma("PRAGMA cache_size").scalar() == -64000
+        assert pragma("PRAGMA foreign_keys").scalar() == 1
+
+
+def test_custom_pragmas(tmp_path) -> None:
+    database = Database(
+        db_url=f"sqlite:///{tmp_path}/task.db",
+        pragmas={"journal_mode": "DELETE", "busy_timeout": 100},
+    )
+
+    with database.engine.connect() as connection:
+        pragma = connection.exec_driver_sql
+
+        assert pragma("PRAGMA journal_mode").scalar() == "delete"
+        assert pragma("PRAGMA busy_timeout").scalar() == 100
+        assert pragma("PRAGMA foreign_keys").scalar() == 0
+
+    database.engine.dispose()
+
+
+def test_echo_is_off_by_default(tmp_path) -> None:
+    database = Database(db_url=f"sqlite:///{tmp_path}/task.db")
+
+    assert database.engine.echo is False
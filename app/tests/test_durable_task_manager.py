@@ -0,0 +1,163 @@
+import os
+import threading
+from datetime import date
+from typing import List
+from uuid import UUID
+
+import pytest
+
+from app.domain import durable_task_managers
+from app.domain.durable_task_managers import (
+    AsyncDurableInMemoryTaskManager,
+    DurableInMemoryTaskManager,
+)
+from app.domain.errors import TaskVersionMismatch
+from app.domain.models import CreateTask, TaskStatus, UpdateTask
+from app.domain.task_managers import InMemoryTaskManager
+
+
+def assert_same_tasks(
+    reopened: InMemoryTaskManager, task_manager: InMemoryTaskManager, user_id: UUID
+) -> None:
+    assert reopened.get_tasks(user_id) == task_manager.get_tasks(user_id)
+    assert reopened.get_tasks_version(user_id) == task_manager.get_tasks_version(
+        user_id
+    )
+    for task in task_manager.get_tasks(user_id):
+        assert reopened.get_task_version(
+            task.id, user_id
+        ) == task_manager.get_task_version(task.id, user_id)
+    assert reopened.history.get(user_id) == task_manager.history.get(user_id)
+    assert reopened.task_count == task_manager.task_count
+    assert reopened.history_entry_count == task_manager.history_entry_count
+
+
+def make_changes(task_manager: InMemoryTaskManager, user_id: UUID) -> List[UUID]:
+    created_tasks = task_manager.create_tasks(
+        [
+            CreateTask(
+                name=f"Task {i}",
+                user_id=user_id,
+                labels={f"label {i % 2}"},
+                due_date=date(2024, 6, i + 1),
+            )
+            for i in range(4)
+        ]
+    )
+    task_manager.update_task(
+        UpdateTask(**{**created_tasks[1].model_dump(), "status": TaskStatus.DONE}),
+        user_id,
+    )
+    task_manager.delete_task(created_tasks[2].id, user_id)
+    task_manager.delete_task(created_tasks[3].id, user_id)
+    task_manager.restore_task(created_tasks[3].id, user_id)
+    return [task.id for task in created_tasks]
+
+
+def test_writes_survive_a_restart(tmp_path, user_id_1: UUID) -> None:
+    task_manager = DurableInMemoryTaskManager(str(tmp_path))
+    task_ids = make_changes(task_manager, user_id_1)
+    with pytest.raises(TaskVersionMismatch):
+        task_manager.delete_task(task_ids[0], user_id_1, expected_version=100)
+    task_manager.close()
+
+    reopened = DurableInMemoryTaskManager(str(tmp_path))
+
+    assert_same_tasks(reopened, task_manager, user_id_1)
+    assert reopened.restore_task(task_ids[2], user_id_1) is not None
+    # New tasks are still stored after the replayed ones
+    created_task = reopened.create_task(CreateTask(name="Later", user_id=user_id_1))
+    assert reopened.get_tasks(user_id_1)[-1] == created_task
+
+
+def test_snapshot_and_log_tail_are_loaded(tmp_path, user_id_1: UUID) -> None:
+    task_manager = DurableInMemoryTaskManager(str(tmp_path), snapshot_every=3)
+    make_changes(task_manager, user_id_1)
+    task_manager.snapshotting.join()
+    # Changes made after the last snapshot
+    task_manager.create_task(CreateTask(name="Tail", user_id=user_id_1))
+    task_manager.close()
+
+    files = os.listdir(tmp_path)
+    assert "snapshot.json" in files
+    assert "log.00000001" not in files
+
+    reopened = DurableInMemoryTaskManager(str(tmp_path), snapshot_every=3)
+
+    assert_same_tasks(reopened, task_manager, user_id_1)
+    assert reopened.get_tasks(user_id_1)[-1].name == "Tail"
+
+
+def test_partly_written_change_is_ignored(tmp_path, user_id_1: UUID) -> None:
+    task_manager = DurableInMemoryTaskManager(str(tmp_path))
+    task_manager.create_task(CreateTask(name="Synced", user_id=user_id_1))
+    task_manager.close()
+    with open(task_manager.log.path, "ab") as file:
+        file.write(b'["p","')
+
+    reopened = DurableInMemoryTaskManager(str(tmp_path))
+
+    assert [task.name for task in reopened.get_tasks(user_id_1)] == ["Synced"]
+
+
+def test_restarts_without_writes_reuse_the_empty_segment(
+    tmp_path, user_id_1: UUID
+) -> None:
+    task_manager = DurableInMemoryTaskManager(str(tmp_path))
+    task_manager.create_task(CreateTask(name="Synced", user_id=user_id_1))
+    task_manager.close()
+    for _ in range(3):
+        DurableInMemoryTaskManager(str(tmp_path)).close()
+
+    reopened = DurableInMemoryTaskManager(str(tmp_path))
+
+    assert sorted(os.listdir(tmp_path)) == ["log.00000001", "log.00000002"]
+    assert [task.name for task in reopened.get_tasks(user_id_1)] == ["Synced"]
+
+
+def test_concurrent_writes_share_fsyncs(tmp_path, monkeypatch, user_id_1: UUID) -> None:
+    fsyncs = []
+    fsync = os.fsync
+
+    def slow_fsync(fd: int) -> None:
+        fsyncs.append(fd)
+        threading.Event().wait(0.01)
+        fsync(fd)
+
+    task_manager = DurableInMemoryTaskManager(str(tmp_path))
+    monkeypatch.setattr(durable_task_managers.os, "fsync", slow_fsync)
+
+    def write(i: int) -> None:
+        for j in range(5):
+            task_manager.create_task(
+                CreateTask(name=f"Task {i} {j}", user_id=user_id_1)
+            )
+
+    threads = [threading.Thread(target=write, args=(i,)) for i in range(8)]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+
+    assert len(task_manager.get_tasks(user_id_1)) == 40
+    assert len(fsyncs) < 40
+    task_manager.close()
+    reopened = DurableInMemoryTaskManager(str(tmp_path))
+    assert_same_tasks(reopened, task_manager, user_id_1)
+
+
+@pytest.mark.anyio
+async def test_async_durable_task_manager(tmp_path, user_id_1: UUID) -> None:
+    task_manager = DurableInMemoryTaskManager(str(tmp_path))
+    async_task_manager = AsyncDurableInMemoryTaskManager(task_manager)
+
+    created_tasks = await async_task_manager.create_tasks(
+        [CreateTask(name=f"Task {i}", user_id=user_id_1) for i in range(3)]
+    )
+    await async_task_manager.delete_tasks([created_tasks[0].id], user_id_1)
+    restored_tasks = await async_task_manager.restore_tasks(user_id_1)
+    task_manager.close()
+
+    assert restored_tasks.restored == [created_tasks[0]]
+    reopened = DurableInMemoryTaskManager(str(tmp_path))
+    assert_same_tasks(reopened, task_manager, user_id_1)
@@ -0,0 +1,224 @@
+import datetime
+import sqlite3
+from typing import List
+from uuid import UUID
+
+import pytest
+from sqlalchemy import event, func, select
+
+from app.database import AsyncDatabase, create_archive_database, Database
+from app.domain.async_task_managers import AsyncSqliteTaskManager
+from app.domain.history_archive import HistoryCompactor, HistoryRetention
+from app.domain.models import CreateTask, RestoredTasks, Task, UpdateTask
+from app.domain.task_managers import SqliteTaskManager
+from app.entities import HistoryEntity
+
+
+@pytest.fixture
+def archive_database(tmp_path) -> Database:
+    archive_database = create_archive_database(
+        db_url=f"sqlite:///{tmp_path}/task_archive.db"
+    )
+    yield archive_database
+    archive_database.engine.dispose()
+
+
+@pytest.fixture
+def task_manager(database: Database, archive_database: Database) -> SqliteTaskManager:
+    return SqliteTaskManager(
+        session_factory=database.session,
+        archive_session_factory=archive_database.session,
+    )
+
+
+def compactor(
+    database: Database,
+    archive_database: Database,
+    retention: HistoryRetention,
+    now: datetime.datetime,
+) -> HistoryCompactor:
+    return HistoryCompactor(
+        database.session,
+        archive_database.session,
+        retention,
+        batch_size=2,
+        clock=lambda: now,
+    )
+
+
+def history_count(database: Database) -> int:
+    with database.session() as session:
+        return session.execute(select(func.count()).select_from(HistoryEntity)).scalar()
+
+
+def delete_tasks(
+    task_manager: SqliteTaskManager, user_id: UUID, count: int
+) -> List[Task]:
+    tasks = task_manager.create_tasks(
+        [CreateTask(name=f"Task {i}", user_id=user_id) for i in range(count)]
+    )
+    for task in tasks:
+        task_manager.delete_task(task.id, user_id)
+    return tasks
+
+
+def test_old_entries_are_archived(
+    database: Database,
+    archive_database: Database,
+    task_manager: SqliteTaskManager,
+    user_id_1: UUID,
+) -> None:
+    tasks = delete_tasks(task_manager, user_id_1, 5)
+    retention = HistoryRetention(max_age=datetime.timedelta(days=1))
+
+    not_yet = compactor(database, archive_database, retention, datetime.datetime.now())
+    assert not_yet.compact() == 0
+
+    tomorrow = datetime.datetime.now() + datetime.timedelta(days=1, seconds=1)
+    assert compactor(database, archive_database, retention, tomorrow).compact() == 5
+    assert history_count(database) == 0
+    assert history_count(archive_database) == 5
+
+    # Archived entries can still be restored
+    history_entry = task_manager.get_last_history_entry(tasks[0].id, user_id_1)
+    assert Task.model_validate_json(history_entry.event) == tasks[0]
+    assert task_manager.restore_task(tasks[0].id, user_id_1) == tasks[0]
+    assert task_manager.get_task(tasks[0].id, user_id_1) == tasks[0]
+
+
+def test_only_the_newest_entries_are_kept(
+    database: Database,
+    archive_database: Database,
+    task_manager: SqliteTaskManager,
+    user_id_1: UUID,
+    user_id_2: UUID,
+) -> None:
+    task = task_manager.create_task(CreateTask(name="Dishes", user_id=user_id_1))
+    for i in range(4):
+        task_manager.update_task(
+            UpdateTask(**{**task.model_dump(), "name": f"Dishes {i}"}), user_id_1
+        )
+        task_manager.delete_task(task.id, user_id_1)
+        task_manager.restore_task(task.id, user_id_1)
+    delete_tasks(task_manager, user_id_2, 2)
+    retention = HistoryRetention(max_entries_per_entity=1)
+
+    compacted = compactor(
+        database, archive_database, retention, datetime.datetime.now()
+    )
+    assert compacted.compact() == 3
+    assert history_count(database) == 3
+    assert history_count(archive_database) == 3
+
+    history_entry = task_manager.get_last_history_entry(task.id, user_id_1)
+    assert Task.model_validate_json(history_entry.event).name == "Dishes 3"
+
+
+@pytest.mark.skipif(
+    not hasattr(sqlite3.Connection, "setlimit"), reason="needs Connection.setlimit"
+)
+def test_large_batches_are_archived(
+    database: Database,
+    archive_database: Database,
+    task_manager: SqliteTaskManager,
+    user_id_1: UUID,
+) -> None:
+    @event.listens_for(database.engine, "connect")
+    def limit_variables(dbapi_connection, connection_record) -> None:
+        # The limit of sqlite versions before 3.32
+        dbapi_connection.setlimit(sqlite3.SQLITE_LIMIT_VARIABLE_NUMBER, 999)
+
+    database.engine.dispose()
+    tasks = task_manager.create_tasks(
+        [CreateTask(name=f"Task {i}", user_id=user_id_1) for i in range(1000)]
+    )
+    task_manager.delete_tasks([task.id for task in tasks], user_id_1)
+    tomorrow = datetime.datetime.now() + datetime.timedelta(days=1)
+    compactor = HistoryCompactor(
+        database.session,
+        archive_database.session,
+        HistoryRetention(max_age=datetime.timedelta(hours=1)),
+        batch_size=1000,
+        clock=lambda: tomorrow,
+    )
+
+    assert compactor.compact() == 1000
+    assert history_count(database) == 0
+    assert task_manager.restore_tasks(user_id_1).restored == tasks
+
+
+def test_entries_already_in_the_archive_are_moved_again(
+    database: Database,
+    archive_database: Database,
+    task_manager: SqliteTaskManager,
+    user_id_1: UUID,
+) -> None:
+    delete_tasks(task_manager, user_id_1, 3)
+    with database.session() as session:
+        entries = session.execute(select(HistoryEntity.__table__)).mappings().all()
+    # As if a run stopped after copying entries to the archive but before
+    # deleting them
+    with archive_database.session() as session, session.begin():
+        session.execute(HistoryEntity.__table__.insert(), [dict(entries[0])])
+
+    tomorrow = datetime.datetime.now() + datetime.timedelta(days=1, seconds=1)
+    retention = HistoryRetention(max_age=datetime.timedelta(days=1))
+
+    assert compactor(database, archive_database, retention, tomorrow).compact() == 3
+    assert history_count(database) == 0
+    assert history_count(archive_database) == 3
+
+
+@pytest.mark.anyio
+async def test_async_restore_from_the_archive(
+    database: Database,
+    archive_database: Database,
+    task_manager: SqliteTaskManager,
+    user_id_1: UUID,
+) -> None:
+    async_archive_database = AsyncDatabase(db_url=str(archive_database.engine.url))
+    async_task_manager = AsyncSqliteTaskManager(
+        session_factory=AsyncDatabase(db_url=str(database.engine.url)).session,
+        archive_session_factory=async_archive_database.sync_session,
+    )
+    archive_statements = []
+    event.listen(
+        async_archive_database.engine.sync_engine,
+        "before_cursor_execute",
+        lambda conn, cursor, statement, *args: archive_statements.append(statement),
+    )
+    task_1, task_2 = delete_tasks(task_manager, user_id_1, 2)
+    retention = HistoryRetention(max_entries_per_entity=0)
+    compactor(database, archive_database, retention, datetime.datetime.now()).compact()
+
+    assert await async_task_manager.restore_task(task_1.id, user_id_1) == task_1
+    assert await async_task_manager.restore_tasks(user_id_1) == RestoredTasks(
+        restored=[task_2], conflicts=[task_1]
+    )
+    # Read through aiosqlite, so the event loop isn't blocked
+    assert archive_statements
+    await async_archive_database.engine.dispose()
+
+
+def test_restore_tasks_from_the_archive(
+    database: Database,
+    archive_database: Database,
+    task_manager: SqliteTaskManager,
+    user_id_1: UUID,
+) -> None:
+    task_1, task_2 = delete_tasks(task_manager, user_id_1, 2)
+    retention = HistoryRetention(max_entries_per_entity=0)
+    compactor(database, archive_database, retention, datetime.datetime.now()).compact()
+    task_manager.restore_task(task_2.id, user_id_1)
+    updated_task_2 = task_manager.update_task(
+        UpdateTask(**{**task_2.model_dump(), "name": "Task 1 updated"}), user_id_1
+    ).task
+    (task_3,) = delete_tasks(task_manager, user_id_1, 1)
+    task_manager.delete_task(task_2.id, user_id_1)
+
+    restored_tasks = task_manager.restore_tasks(user_id_1)
+
+    # The archived entries are older than any in the main database, and an entry
+    # in the main database wins over an archived one for the same task
+    assert restored_tasks.restored == [task_1, task_3, updated_task_2]
+    assert task_manager.restore_tasks(user_id_1, [task_1.id]).conflicts == [task_1]
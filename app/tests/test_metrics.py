@@ -0,0 +1,173 @@
+import re
+from typing import Callable
+from uuid import UUID
+
+import pytest
+from fastapi import FastAPI
+from httpx import QueryParams
+from sqlalchemy import text
+from starlette.testclient import TestClient
+
+from app.database import Database
+from app.domain.async_task_managers import AsyncInMemoryTaskManager
+from app.domain.errors import TaskVersionMismatch
+from app.domain.instrumented_task_managers import InstrumentedAsyncTaskManager
+from app.domain.models import CreateTask
+from app.domain.task_managers import InMemoryTaskManager, SqliteTaskManager
+from app.metrics import (
+    Counter,
+    Histogram,
+    instrument_database,
+    instrument_in_memory_store,
+    Metrics,
+)
+
+
+def sample(metrics: str, name: str) -> float:
+    match = re.search(rf"^{re.escape(name)} (\S+)$", metrics, re.MULTILINE)
+    assert match is not None, f"{name} not in\n{metrics}"
+    return float(match.group(1))
+
+
+@pytest.fixture
+def metrics_app(monkeypatch, app_factory: Callable[[], FastAPI]) -> FastAPI:
+    monkeypatch.setenv("METRICS_ENABLED", "true")
+    monkeypatch.setenv("TASK_MANAGER_TYPE", "in_memory")
+    return app_factory()
+
+
+def test_render() -> None:
+    histogram = Histogram("latency_seconds", "Latency", ("route",), buckets=(0.1, 1))
+    histogram.observe(("/a",), 0.05)
+    histogram.observe(("/a",), 0.1)
+    histogram.observe(("/a",), 5)
+    counter = Counter("errors_total", "Errors", ("error",))
+    counter.inc(('Bad "value"\n',))
+
+    assert histogram.render() == (
+        "# HELP latency_seconds Latency\n"
+        "# TYPE latency_seconds histogram\n"
+        'latency_seconds_bucket{route="/a",le="0.1"} 2\n'
+        'latency_seconds_bucket{route="/a",le="1"} 2\n'
+        'latency_seconds_bucket{route="/a",le="+Inf"} 3\n'
+        'latency_seconds_sum{route="/a"} 5.15\n'
+        'latency_seconds_count{route="/a"} 3\n'
+    )
+    assert counter.render() == (
+        "# HELP errors_total Errors\n"
+        "# TYPE errors_total counter\n"
+        'errors_total{error="Bad \\"value\\"\\n"} 1\n'
+    )
+
+
+def test_metrics_endpoint(metrics_app: FastAPI, user_id_1: UUID) -> None:
+    with TestClient(metrics_app) as client:
+        task_id = client.post(
+            "/tasks", params=QueryParams(user_id=user_id_1), json={"name": "Dishes"}
+        ).json()["data"]["id"]
+        client.get(f"/tasks/{task_id}", params=QueryParams(user_id=user_id_1))
+        client.get(f"/tasks/{task_id}", params=QueryParams(user_id=user_id_1))
+        response = client.get("/metrics")
+
+    assert response.status_code == 200
+    assert response.headers["content-type"].startswith("text/plain; version=0.0.4")
+    metrics = response.text
+    assert (
+        sample(
+            metrics,
+            'http_request_duration_seconds_count{method="GET",route="/tasks/{task_id}",'
+            'status="200"}',
+        )
+        == 2
+    )
+    assert (
+        sample(
+            metrics,
+            'task_manager_call_duration_seconds_count{task_manager="in_memory",'
+            'method="create_task"}',
+        )
+        == 1
+    )
+    assert sample(metrics, 'in_memory_store_size{kind="tasks"}') >= 1
+
+
+def test_metrics_are_disabled_by_default(
+    monkeypatch, app_factory: Callable[[], FastAPI]
+) -> None:
+    monkeypatch.delenv("METRICS_ENABLED", raising=False)
+    app = app_factory()
+    response = TestClient(app).get("/metrics")
+
+    assert response.status_code == 404
+    assert not isinstance(
+        app.container.async_task_manager(), InstrumentedAsyncTaskManager
+    )
+
+
+def test_in_memory_store_size(user_id_1: UUID, user_id_2: UUID) -> None:
+    metrics = Metrics()
+    task_manager = InMemoryTaskManager()
+    instrument_in_memory_store(metrics, task_manager)
+    tasks = task_manager.create_tasks(
+        [CreateTask(name=f"Task {i}", user_id=user_id_1) for i in range(3)]
+    )
+    task_manager.create_task(CreateTask(name="Other", user_id=user_id_2))
+    task_manager.delete_tasks([task.id for task in tasks[:2]], user_id_1)
+    task_manager.restore_task(tasks[0].id, user_id_1)
+
+    rendered = metrics.render()
+    assert sample(rendered, 'in_memory_store_size{kind="users"}') == 2
+    assert sample(rendered, 'in_memory_store_size{kind="tasks"}') == 3
+    assert sample(rendered, 'in_memory_store_size{kind="history_entries"}') == 2
+
+
+@pytest.mark.anyio
+async def test_task_manager_errors_are_counted(user_id_1: UUID) -> None:
+    metrics = Metrics()
+    task_manager = InstrumentedAsyncTaskManager(
+        AsyncInMemoryTaskManager(InMemoryTaskManager()), metrics, "in_memory"
+    )
+    task = await task_manager.create_task(CreateTask(name="Dishes", user_id=user_id_1))
+
+    with pytest.raises(TaskVersionMismatch):
+        await task_manager.delete_task(task.id, user_id_1, expected_version=5)
+
+    assert metrics.task_manager_errors.values == {
+        ("in_memory", "delete_task", "TaskVersionMismatch"): 1
+    }
+    assert [task async for task in task_manager.iter_tasks(user_id_1)] == [task]
+    assert set(metrics.task_manager_seconds.values) == {
+        ("in_memory", "create_task"),
+        ("in_memory", "delete_task"),
+        ("in_memory", "iter_tasks"),
+    }
+
+
+def test_database_commits_are_timed(database: Database, user_id_1: UUID) -> None:
+    metrics = Metrics()
+    instrument_database(metrics, database)
+    task_manager = SqliteTaskManager(session_factory=database.session)
+
+    task_manager.create_task(CreateTask(name="Dishes", user_id=user_id_1))
+    with pytest.raises(ZeroDivisionError), database.session() as session:
+        session.execute(text("SELECT 1"))
+        1 / 0
+
+    rendered = metrics.render()
+    assert sample(rendered, 'db_commit_duration_seconds_count{database="task.db"}') == 1
+    assert (
+        sample(
+            rendered,
+            'db_transaction_duration_seconds_count{database="task.db",'
+            'outcome="commit"}',
+        )
+        == 1
+    )
+    assert (
+        sample(
+            rendered,
+            'db_transaction_duration_seconds_count{database="task.db",'
+            'outcome="rollback"}',
+        )
+        == 1
+    )
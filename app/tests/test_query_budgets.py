@@ -0,0 +1,221 @@
+import logging
+import re
+from typing import Callable, List
+from uuid import UUID
+
+import pytest
+from fastapi import FastAPI
+from httpx import QueryParams
+from starlette.testclient import TestClient
+
+from app.database import Database, record_queries
+from app.domain.async_task_managers import AsyncSqliteTaskManager
+from app.domain.models import CreateTask, Task, TaskQuery, TaskStatus, UpdateTask
+from app.domain.task_managers import SqliteTaskManager
+
+
+def update(task: Task, labels: set) -> UpdateTask:
+    return UpdateTask(
+        id=task.id,
+        name="Renamed",
+        status=TaskStatus.DOING,
+        labels=labels,
+        due_date=None,
+        sub_tasks=[],
+    )
+
+
+# The most statements each method may run, however many tasks the user has
+BUDGETS: List[tuple] = [
+    (
+        "create_task",
+        6,
+        lambda task_manager, tasks, user_id: task_manager.create_task(
+            CreateTask(name="New", labels={"new", "home"}, user_id=user_id)
+        ),
+    ),
+    (
+        "create_tasks",
+        6,
+        lambda task_manager, tasks, user_id: task_manager.create_tasks(
+            [
+                CreateTask(name=f"New {i}", labels={f"new {i}"}, user_id=user_id)
+                for i in range(10)
+            ]
+        ),
+    ),
+    (
+        "get_task",
+        2,
+        lambda task_manager, tasks, user_id: task_manager.get_task(
+            tasks[0].id, user_id
+        ),
+    ),
+    (
+        "get_tasks",
+        2,
+        lambda task_manager, tasks, user_id: task_manager.get_tasks(user_id),
+    ),
+    (
+        "get_tasks with a query",
+        2,
+        lambda task_manager, tasks, user_id: task_manager.get_tasks(
+            user_id, TaskQuery(labels_any={"home"})
+        ),
+    ),
+    (
+        "iter_tasks",
+        1,
+        lambda task_manager, tasks, user_id: list(task_manager.iter_tasks(user_id)),
+    ),
+    (
+        "get_tasks_page",
+        2,
+        lambda task_manager, tasks, user_id: task_manager.get_tasks_page(user_id, 5),
+    ),
+    (
+        "get_task_version",
+        1,
+        lambda task_manager, tasks, user_id: task_manager.get_task_version(
+            tasks[0].id, user_id
+        ),
+    ),
+    (
+        "get_tasks_version",
+        1,
+        lambda task_manager, tasks, user_id: task_manager.get_tasks_version(user_id),
+    ),
+    (
+        "update_task",
+        9,
+        lambda task_manager, tasks, user_id: task_manager.update_task(
+            update(tasks[0], {"new", "home"}), user_id
+        ),
+    ),
+    (
+        "update_tasks",
+        8,
+        lambda task_manager, tasks, user_id: task_manager.update_tasks(
+            [update(task, {"new", "home"}) for task in tasks], user_id
+        ),
+    ),
+    (
+        "delete_task",
+        6,
+        lambda task_manager, tasks, user_id: task_manager.delete_task(
+            tasks[0].id, user_id
+        ),
+    ),
+    (
+        "delete_tasks",
+        6,
+        lambda task_manager, tasks, user_id: task_manager.delete_tasks(
+            [task.id for task in tasks], user_id
+        ),
+    ),
+]
+
+
+@pytest.mark.parametrize("task_count", [1, 25])
+@pytest.mark.parametrize(
+    "method,limit,call", BUDGETS, ids=[budget[0] for budget in BUDGETS]
+)
+def test_query_budget(
+    sqlite_task_manager: SqliteTaskManager,
+    max_queries,
+    user_id_1: UUID,
+    task_count: int,
+    method: str,
+    limit: int,
+    call: Callable,
+) -> None:
+    tasks = sqlite_task_manager.create_tasks(
+        [
+            CreateTask(
+                name=f"Task {i}", labels={f"label {i}", "home"}, user_id=user_id_1
+            )
+            for i in range(task_count)
+        ]
+    )
+
+    with max_queries(limit):
+        call(sqlite_task_manager, tasks, user_id_1)
+
+
+@pytest.mark.parametrize("task_count", [1, 25])
+def test_restore_query_budget(
+    sqlite_task_manager: SqliteTaskManager, max_queries, user_id_1: UUID, task_count
+) -> None:
+    tasks = sqlite_task_manager.create_tasks(
+        [
+            CreateTask(name=f"Task {i}", labels={"home"}, user_id=user_id_1)
+            for i in range(task_count)
+        ]
+    )
+    sqlite_task_manager.delete_tasks([task.id for task in tasks], user_id_1)
+
+    with max_queries(1):
+        sqlite_task_manager.get_last_history_entry(tasks[0].id, user_id_1)
+    with max_queries(6):
+        sqlite_task_manager.restore_task(tasks[0].id, user_id_1)
+    with max_queries(6):
+        sqlite_task_manager.restore_tasks(user_id_1)
+
+
+@pytest.mark.anyio
+async def test_async_queries_are_recorded(
+    async_sqlite_task_manager: AsyncSqliteTaskManager, user_id_1: UUID
+) -> None:
+    await async_sqlite_task_manager.create_tasks(
+        [
+            CreateTask(name=f"Task {i}", labels={"home"}, user_id=user_id_1)
+            for i in range(5)
+        ]
+    )
+
+    with record_queries() as stats:
+        await async_sqlite_task_manager.get_tasks(user_id_1)
+
+    assert stats.count == 2
+    assert stats.slowest_statement is not None
+    assert 0 < stats.slowest_seconds <= stats.seconds
+
+
+def test_slow_queries_are_logged_with_their_plan(
+    tmp_path, caplog, user_id_1: UUID
+) -> None:
+    database = Database(f"sqlite:///{tmp_path}/task.db", slow_query_seconds=0)
+    database.create_database()
+    task_manager = SqliteTaskManager(session_factory=database.session)
+
+    with caplog.at_level(logging.WARNING, logger="app.database"):
+        task_manager.get_tasks(user_id_1)
+
+    messages = [record.getMessage() for record in caplog.records]
+    assert any(
+        message.startswith("Slow query took") and "SEARCH" in message
+        for message in messages
+    ), messages
+    database.engine.dispose()
+
+
+def test_server_timing_header(
+    monkeypatch, app_factory: Callable[[], FastAPI], user_id_1: UUID
+) -> None:
+    monkeypatch.setenv("QUERY_TIMING_ENABLED", "true")
+    app = app_factory()
+
+    with TestClient(app) as client:
+        client.post(
+            "/tasks", params=QueryParams(user_id=user_id_1), json={"name": "Dishes"}
+        )
+        response = client.get("/tasks", params=QueryParams(user_id=user_id_1))
+
+    assert response.status_code == 200
+    match = re.fullmatch(
+        r'db;dur=[\d.]+;desc="(\d+) queries", db-slowest;dur=[\d.]+',
+        response.headers["server-timing"],
+    )
+    assert match is not None
+    if app.container.config.task_manager.type() in ("sqlite", "sharded_sqlite"):
+        assert int(match.group(1)) > 0
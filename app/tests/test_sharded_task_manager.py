@@ -0,0 +1,145 @@
+from datetime import date
+from typing import List
+from uuid import UUID, uuid4
+
+import pytest
+from sqlalchemy import func, select
+
+from app.database import AsyncDatabase, Database
+from app.domain.async_task_managers import AsyncSqliteTaskManager
+from app.domain.models import CreateTask, TaskStatus, UpdateTask
+from app.domain.sharded_task_managers import (
+    AsyncShardedTaskManager,
+    shard_index,
+    ShardedTaskManager,
+)
+from app.domain.task_managers import SqliteTaskManager
+from app.entities import TaskEntity
+from app.reshard import reshard
+
+
+def shard_databases(tmp_path, name: str, count: int) -> List[Database]:
+    databases = [
+        Database(db_url=f"sqlite:///{tmp_path}/{name}_{shard}.db")
+        for shard in range(count)
+    ]
+    for database in databases:
+        database.create_database()
+    return databases
+
+
+@pytest.fixture
+def databases(tmp_path) -> List[Database]:
+    databases = shard_databases(tmp_path, "task_shard", 2)
+    yield databases
+    for database in databases:
+        database.engine.dispose()
+
+
+def sharded_task_manager(databases: List[Database]) -> ShardedTaskManager:
+    return ShardedTaskManager(
+        [SqliteTaskManager(session_factory=database.session) for database in databases]
+    )
+
+
+def task_count(database: Database, user_id: UUID) -> int:
+    with database.session() as session:
+        return session.execute(
+            select(func.count()).where(TaskEntity.user_id == user_id)
+        ).scalar()
+
+
+def create_tasks(user_ids: List[UUID]) -> List[CreateTask]:
+    return [
+        CreateTask(
+            name=f"Task {i}",
+            user_id=user_ids[i % len(user_ids)],
+            labels={f"label {i % 3}"},
+            due_date=date(2024, 6, i % 28 + 1),
+        )
+        for i in range(len(user_ids) * 3)
+    ]
+
+
+def test_shard_index_is_stable() -> None:
+    user_id = UUID("50fd38cc-6dc3-4202-b3aa-0eeee458184a")
+
+    assert [shard_index(user_id, count) for count in range(1, 5)] == [0, 1, 0, 1]
+
+
+def test_users_are_stored_on_their_shard(databases: List[Database]) -> None:
+    task_manager = sharded_task_manager(databases)
+    user_ids = [uuid4() for _ in range(20)]
+
+    create = create_tasks(user_ids)
+    created_tasks = task_manager.create_tasks(create)
+
+    assert [task.name for task in created_tasks] == [task.name for task in create]
+    for user_id in user_ids:
+        user_tasks = task_manager.get_tasks(user_id)
+        assert user_tasks == [task for task in created_tasks if task.user_id == user_id]
+        counts = [task_count(database, user_id) for database in databases]
+        assert counts[shard_index(user_id, len(databases))] == 3
+        assert sum(counts) == 3
+    assert {shard_index(user_id, len(databases)) for user_id in user_ids} == {0, 1}
+
+
+@pytest.mark.anyio
+async def test_async_create_tasks_writes_every_shard(
+    databases: List[Database],
+) -> None:
+    task_manager = AsyncShardedTaskManager(
+        [
+            AsyncSqliteTaskManager(
+                session_factory=AsyncDatabase(db_url=str(database.engine.url)).session
+            )
+            for database in databases
+        ]
+    )
+    user_ids = [uuid4() for _ in range(10)]
+
+    create = create_tasks(user_ids)
+    created_tasks = await task_manager.create_tasks(create)
+
+    assert [task.name for task in created_tasks] == [task.name for task in create]
+    for user_id in user_ids:
+        assert await task_manager.get_tasks(user_id) == [
+            task for task in created_tasks if task.user_id == user_id
+        ]
+
+
+def test_reshard(tmp_path, databases: List[Database]) -> None:
+    task_manager = sharded_task_manager(databases)
+    user_ids = [uuid4() for _ in range(10)]
+    created_tasks = task_manager.create_tasks(create_tasks(user_ids))
+    deleted_task = created_tasks[0]
+    task_manager.delete_task(deleted_task.id, deleted_task.user_id)
+    task_manager.update_task(
+        UpdateTask(**{**created_tasks[1].model_dump(), "status": TaskStatus.DONE}),
+        created_tasks[1].user_id,
+    )
+    targets = shard_databases(tmp_path, "new_shard", 3)
+
+    copied = reshard(databases, targets, batch_size=4)
+
+    assert copied == {"users": 10, "tasks": 29, "history": 1}
+    resharded_task_manager = sharded_task_manager(targets)
+    for user_id in user_ids:
+        assert resharded_task_manager.get_tasks(user_id) == task_manager.get_tasks(
+            user_id
+        )
+        assert resharded_task_manager.get_tasks_version(
+            user_id
+        ) == task_manager.get_tasks_version(user_id)
+        assert task_count(targets[shard_index(user_id, len(targets))], user_id) == len(
+            task_manager.get_tasks(user_id)
+        )
+    assert (
+        resharded_task_manager.restore_task(deleted_task.id, deleted_task.user_id)
+        == deleted_task
+    )
+    with pytest.raises(ValueError):
+        reshard(databases, targets)
+
+    for database in targets:
+        database.engine.dispose()
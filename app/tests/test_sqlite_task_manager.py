@@ -0,0 +1,374 @@
+import re
+import sqlite3
+from contextlib import contextmanager
+from typing import Any, Iterator, List, Tuple
+from uuid import UUID, uuid4
+
+import pytest
+from sqlalchemy import event, insert, select
+
+from app.api.resources import MAX_BATCH_SIZE
+from app.database import Database, record_queries
+from app.domain.models import (
+    CreateTask,
+    TaskQuery,
+    TaskSortField,
+    TaskStatus,
+    UpdateTask,
+)
+from app.domain.task_managers import SqliteTaskManager, resolve_labels
+from app.entities import LabelEntity
+
+
+@contextmanager
+def record_query_plans(database: Database) -> Iterator[List[Tuple[str, List[str]]]]:
+    """Records each select, update and delete with the steps of its query plan."""
+    statements: List[Tuple[str, Any]] = []
+
+    def before_cursor_execute(
+        conn, cursor, statement, parameters, context, executemany
+    ) -> None:
+        if statement.startswith(("SELECT", "UPDATE", "DELETE")):
+            statements.append((statement, parameters[0] if executemany else parameters))
+
+    query_plans: List[Tuple[str, List[str]]] = []
+    event.listen(database.engine, "before_cursor_execute", before_cursor_execute)
+    try:
+        yield query_plans
+    finally:
+        event.remove(database.engine, "before_cursor_execute", before_cursor_execute)
+
+    with database.engine.connect() as connection:
+        for statement, parameters in statements:
+            query_plan = connection.exec_driver_sql(
+                f"EXPLAIN QUERY PLAN {statement}", parameters
+            )
+            query_plans.append((statement, [detail for _, _, _, detail in query_plan]))
+
+
+def is_table_scan(detail: str) -> bool:
+    """Whether a query plan step scans a whole table, or sorts rows, without an
+    index."""
+    return bool(
+        re.fullmatch(r"SCAN (TABLE )?\w+( AS \w+)?", detail)
+        or detail.startswith("USE TEMP B-TREE")
+    )
+
+
+@contextmanager
+def record_commits(database: Database) -> Iterator[List[None]]:
+    commits: List[None] = []
+
+    def commit(conn) -> None:
+        commits.append(None)
+
+    event.listen(database.engine, "commit", commit)
+    try:
+        yield commits
+    finally:
+        event.remove(database.engine, "commit", commit)
+
+
+def test_get_tasks_query_count_is_constant(
+    sqlite_task_manager: SqliteTaskManager, user_id_1: UUID
+) -> None:
+    for i in range(2):
+        sqlite_task_manager.create_task(
+            CreateTask(name=f"Task {i}", user_id=user_id_1, labels={f"label {i}"})
+        )
+    with record_queries() as stats:
+        assert len(sqlite_task_manager.get_tasks(user_id_1)) == 2
+    small_query_count = stats.count
+
+    for i in range(2, 50):
+        sqlite_task_manager.create_task(
+            CreateTask(
+                name=f"Task {i}", user_id=user_id_1, labels={f"label {i}", "shared"}
+            )
+        )
+    with record_queries() as stats:
+        tasks = sqlite_task_manager.get_tasks(user_id_1)
+
+    assert len(tasks) == 50
+    assert stats.count == small_query_count == 2
+    assert all(task.labels for task in tasks)
+
+
+def test_iter_tasks_is_one_statement(
+    sqlite_task_manager: SqliteTaskManager, user_id_1: UUID
+) -> None:
+    sqlite_task_manager.create_tasks(
+        [
+            CreateTask(
+                name=f"Task {i}", user_id=user_id_1, labels={f"label {i}", "daily"}
+            )
+            for i in range(50)
+        ]
+    )
+
+    with record_queries() as stats:
+        tasks = list(sqlite_task_manager.iter_tasks(user_id_1))
+
+    assert tasks == sqlite_task_manager.get_tasks(user_id_1)
+    assert stats.count == 1
+
+
+def test_get_task_query_count(
+    sqlite_task_manager: SqliteTaskManager, user_id_1: UUID
+) -> None:
+    task = sqlite_task_manager.create_task(
+        CreateTask(name="Dishes", user_id=user_id_1, labels={"kitchen", "daily"})
+    )
+
+    with record_queries() as stats:
+        assert sqlite_task_manager.get_task(task.id, user_id_1) == task
+
+    assert stats.count == 2
+
+
+def test_resolve_labels_query_count(
+    database: Database, sqlite_task_manager: SqliteTaskManager, user_id_1: UUID
+) -> None:
+    sqlite_task_manager.create_task(
+        CreateTask(name="Dishes", user_id=user_id_1, labels={"kitchen", "daily"})
+    )
+    labels = {"kitchen", "daily"} | {f"label {i}" for i in range(10)}
+
+    with database.session() as session:
+        with record_queries() as stats:
+            label_entities = resolve_labels(labels, session)
+        assert {label_entity.name for label_entity in label_entities} == labels
+        session.commit()
+
+    assert stats.count == 3
+
+    with database.session() as session:
+        with record_queries() as stats:
+            label_entities = resolve_labels(labels, session)
+        assert {label_entity.name for label_entity in label_entities} == labels
+
+    assert stats.count == 1
+
+
+def test_resolve_labels_created_concurrently(
+    database: Database, sqlite_task_manager: SqliteTaskManager
+) -> None:
+    concurrent_label_id = uuid4()
+    label_created = False
+
+    def create_label_concurrently(conn, cursor, statement, *args) -> None:
+        # Simulates another request committing the same label after this
+        # request looked the labels up, but before it inserted the missing ones.
+        nonlocal label_created
+        if statement.startswith("INSERT INTO label") and not label_created:
+            label_created = True
+            with database.engine.begin() as connection:
+                connection.execute(
+                    insert(LabelEntity).values(id=concurrent_label_id, name="kitchen")
+                )
+
+    event.listen(database.engine, "before_cursor_execute", create_label_concurrently)
+    with database.session() as session:
+        labels = {
+            label_entity.name: label_entity.id
+            for label_entity in resolve_labels({"kitchen", "daily"}, session)
+        }
+        session.commit()
+    event.remove(database.engine, "before_cursor_execute", create_label_concurrently)
+
+    assert labels.keys() == {"kitchen", "daily"}
+    assert labels["kitchen"] == concurrent_label_id
+    with database.session() as session:
+        assert len(session.execute(select(LabelEntity)).scalars().all()) == 2
+
+
+def test_writes_commit_once(
+    database: Database, sqlite_task_manager: SqliteTaskManager, user_id_1: UUID
+) -> None:
+    with record_commits(database) as commits:
+        task = sqlite_task_manager.create_task(
+            CreateTask(name="Dishes", user_id=user_id_1, labels={"kitchen", "daily"})
+        )
+    assert len(commits) == 1
+
+    with record_commits(database) as commits:
+        sqlite_task_manager.update_task(
+            UpdateTask(**{**task.model_dump(), "labels": {"kitchen", "hourly"}}),
+            user_id_1,
+        )
+    assert len(commits) == 1
+
+    with record_commits(database) as commits:
+        sqlite_task_manager.delete_task(task.id, user_id_1)
+    assert len(commits) == 1
+
+    with record_commits(database) as commits:
+        restored_task = sqlite_task_manager.restore_task(task.id, user_id_1)
+    assert len(commits) == 1
+    assert restored_task.labels == {"kitchen", "hourly"}
+
+
+def test_batch_writes_commit_once(
+    database: Database,
+    sqlite_task_manager: SqliteTaskManager,
+    max_queries,
+    user_id_1: UUID,
+) -> None:
+    create_tasks = [
+        CreateTask(name=f"Task {i}", user_id=user_id_1, labels={f"label {i}", "daily"})
+        for i in range(50)
+    ]
+    # the tasks version, tasks, labels and their links are each written in one
+    # statement
+    with record_commits(database) as commits, max_queries(6):
+        tasks = sqlite_task_manager.create_tasks(create_tasks)
+    assert len(commits) == 1
+
+    update_tasks = [
+        UpdateTask(**{**task.model_dump(), "labels": {"weekly"}}) for task in tasks
+    ]
+    with record_commits(database) as commits, max_queries(8):
+        sqlite_task_manager.update_tasks(update_tasks, user_id_1)
+    assert len(commits) == 1
+
+    with record_commits(database) as commits, max_queries(6):
+        sqlite_task_manager.delete_tasks([task.id for task in tasks], user_id_1)
+    assert len(commits) == 1
+    assert sqlite_task_manager.get_tasks(user_id_1) == []
+
+
+@pytest.mark.skipif(
+    not hasattr(sqlite3.Connection, "setlimit"), reason="needs Connection.setlimit"
+)
+def test_batch_writes_at_max_batch_size(tmp_path, user_id_1: UUID) -> None:
+    database = Database(db_url=f"sqlite:///{tmp_path}/task.db")
+
+    @event.listens_for(database.engine, "connect")
+    def limit_variables(dbapi_connection, connection_record) -> None:
+        # The limit of sqlite versions before 3.32
+        dbapi_connection.setlimit(sqlite3.SQLITE_LIMIT_VARIABLE_NUMBER, 999)
+
+    database.create_database()
+    sqlite_task_manager = SqliteTaskManager(session_factory=database.session)
+
+    tasks = sqlite_task_manager.create_tasks(
+        [
+            CreateTask(name=f"Task {i}", user_id=user_id_1, labels={f"label {i}"})
+            for i in range(MAX_BATCH_SIZE)
+        ]
+    )
+    updated_tasks = sqlite_task_manager.update_tasks(
+        [
+            UpdateTask(**{**task.model_dump(), "labels": {f"new label {i}"}})
+            for i, task in enumerate(tasks)
+        ],
+        user_id_1,
+    )
+    deleted_tasks = sqlite_task_manager.delete_tasks(
+        [task.id for task in tasks], user_id_1
+    )
+    restored_tasks = sqlite_task_manager.restore_tasks(
+        user_id_1, [task.id for task in tasks]
+    )
+
+    assert len(tasks) == MAX_BATCH_SIZE
+    assert deleted_tasks == updated_tasks
+    assert restored_tasks.restored == updated_tasks
+    database.engine.dispose()
+
+
+def test_failed_write_is_rolled_back(
+    database: Database, sqlite_task_manager: SqliteTaskManager, user_id_1: UUID
+) -> None:
+    def fail_on_task_insert(conn, cursor, statement, *args) -> None:
+        if statement.startswith("INSERT INTO task "):
+            raise RuntimeError("crashed while creating task")
+
+    event.listen(database.engine, "before_cursor_execute", fail_on_task_insert)
+    try:
+        with pytest.raises(RuntimeError):
+            sqlite_task_manager.create_task(
+                CreateTask(name="Dishes", user_id=user_id_1, labels={"kitchen"})
+            )
+    finally:
+        event.remove(database.engine, "before_cursor_execute", fail_on_task_insert)
+
+    assert sqlite_task_manager.get_tasks(user_id_1) == []
+    with database.session() as session:
+        assert session.execute(select(LabelEntity)).scalars().all() == []
+
+
+def test_queries_use_indexes(
+    database: Database,
+    sqlite_task_manager: SqliteTaskManager,
+    user_id_1: UUID,
+    user_id_2: UUID,
+) -> None:
+    with record_query_plans(database) as query_plans:
+        task = sqlite_task_manager.create_task(
+            CreateTask(name="Dishes", user_id=user_id_1, labels={"kitchen", "daily"})
+        )
+        sqlite_task_manager.create_task(CreateTask(name="Cook", user_id=user_id_1))
+        sqlite_task_manager.create_task(
+            CreateTask(name="Cook", user_id=user_id_2, labels={"kitchen"})
+        )
+        sqlite_task_manager.get_task(task.id, user_id_1)
+        sqlite_task_manager.get_task_version(task.id, user_id_1)
+        sqlite_task_manager.get_tasks_version(user_id_1)
+        sqlite_task_manager.get_tasks(user_id_1)
+        list(sqlite_task_manager.iter_tasks(user_id_1))
+        first_page = sqlite_task_manager.get_tasks_page(user_id_1, limit=1)
+        sqlite_task_manager.get_tasks_page(
+            user_id_1, limit=1, cursor=first_page.next_cursor
+        )
+        for sort in TaskSortField:
+            query = TaskQuery(sort=sort)
+            first_page = sqlite_task_manager.get_tasks_page(user_id_1, 1, query=query)
+            sqlite_task_manager.get_tasks_page(
+                user_id_1, 1, first_page.next_cursor, query
+            )
+        sqlite_task_manager.get_tasks(
+            user_id_1,
+            TaskQuery(
+                statuses={TaskStatus.PENDING},
+                labels_any={"kitchen"},
+                labels_all={"kitchen", "daily"},
+            ),
+        )
+        sqlite_task_manager.update_task(
+            UpdateTask(**{**task.model_dump(), "labels": {"kitchen", "hourly"}}),
+            user_id_1,
+        )
+        sqlite_task_manager.delete_task(task.id, user_id_1)
+        sqlite_task_manager.get_last_history_entry(task.id, user_id_1)
+        sqlite_task_manager.restore_task(task.id, user_id_1)
+        tasks = sqlite_task_manager.create_tasks(
+            [CreateTask(name="Sweep", user_id=user_id_1, labels={"kitchen"})]
+        )
+        sqlite_task_manager.update_tasks(
+            [UpdateTask(**{**tasks[0].model_dump(), "labels": {"daily"}})], user_id_1
+        )
+        sqlite_task_manager.delete_tasks([tasks[0].id], user_id_1)
+        sqlite_task_manager.restore_tasks(user_id_1, [tasks[0].id])
+        sqlite_task_manager.delete_tasks([tasks[0].id], user_id_1)
+        sqlite_task_manager.restore_tasks(user_id_1)
+
+    table_scans = [
+        f"{detail}: {statement}"
+        for statement, query_plan in query_plans
+        for detail in query_plan
+        if is_table_scan(detail)
+    ]
+    assert table_scans == []
+    # Restoring finds the last deleted tasks by seeking the history index
+    history_plans = [
+        query_plan
+        for statement, query_plan in query_plans
+        if statement.startswith("SELECT") and "FROM history" in statement
+    ]
+    assert len(history_plans) == 4
+    for query_plan in history_plans:
+        assert any(
+            "USING INDEX ix_history_user_id_entity_id_type_created_at" in detail
+            for detail in query_plan
+        ), query_plan
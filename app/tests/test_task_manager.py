@@ -1,10 +1,14 @@
 import json
-from datetime import date
+from datetime import date, timedelta
+from random import Random
+from typing import List
 from uuid import UUID, uuid4
 
 import pytest
 
+from app.domain import task_managers
 from app.domain.task_managers import (
+    InMemoryTaskManager,
     TaskManager,
 )
 from app.domain.models import (
@@ -15,8 +19,13 @@ from app.domain.models import (
     HistoryEntry,
     HistoryEntryType,
     HistoryEntryVersion,
+    RestoredTasks,
+    TaskPage,
+    TaskQuery,
+    TaskSortField,
 )
-from app.domain.errors import TaskAlreadyExists
+from app.domain.errors import InvalidCursor, TaskAlreadyExists, TaskVersionMismatch
+from app.domain.pagination import encode_cursor
 
 
 def test_create_task(task_manager: TaskManager, user_id_1: UUID) -> None:
@@ -84,6 +93,316 @@ def test_get_tasks(task_manager: TaskManager, user_id_1: UUID, user_id_2: UUID)
     assert tasks == [created_task_1, created_task_2]
 
 
+def test_iter_tasks(
+    task_manager: TaskManager, user_id_1: UUID, user_id_2: UUID
+) -> None:
+    tasks = [
+        task_manager.create_task(
+            CreateTask(name=f"Task {i}", user_id=user_id_1, labels={f"label {i}"})
+        )
+        for i in range(5)
+    ]
+    task_manager.create_task(CreateTask(name="Dishes", user_id=user_id_2))
+    task_manager.delete_task(tasks[2].id, user_id_1)
+
+    assert list(task_manager.iter_tasks(user_id_1)) == [
+        tasks[0],
+        tasks[1],
+        tasks[3],
+        tasks[4],
+    ]
+    assert list(task_manager.iter_tasks(uuid4())) == []
+
+
+def test_in_memory_iter_tasks_with_concurrent_writes(
+    monkeypatch: pytest.MonkeyPatch, user_id_1: UUID
+) -> None:
+    monkeypatch.setattr(task_managers, "ITER_TASKS_CHUNK_SIZE", 2)
+    task_manager = InMemoryTaskManager()
+    tasks = task_manager.create_tasks(
+        [CreateTask(name=f"Task {i}", user_id=user_id_1) for i in range(5)]
+    )
+
+    iterated_tasks = []
+    for task in task_manager.iter_tasks(user_id_1):
+        iterated_tasks.append(task)
+        if task == tasks[1]:
+            task_manager.delete_task(tasks[0].id, user_id_1)
+            task_manager.delete_task(tasks[3].id, user_id_1)
+            created_task = task_manager.create_task(
+                CreateTask(name="Task 5", user_id=user_id_1)
+            )
+
+    assert iterated_tasks == [tasks[0], tasks[1], tasks[2], tasks[4], created_task]
+
+
+def test_in_memory_tasks_share_repeated_values(user_id_1: UUID) -> None:
+    task_manager = InMemoryTaskManager()
+    tasks = task_manager.create_tasks(
+        [
+            CreateTask(
+                name=f"Task {i}",
+                labels={"kitchen", "daily"},
+                due_date=date(2024, 6, 30),
+                user_id=user_id_1,
+            )
+            for i in range(2)
+        ]
+    )
+
+    first, second = (task_manager.tasks[user_id_1][task.id] for task in tasks)
+    assert first.labels is second.labels
+    assert first.due_date is second.due_date
+
+    # Tasks are copies of what is stored, so changing one doesn't change the other
+    tasks[0].labels.add("garden")
+    tasks[0].sub_tasks.append("Rinse")
+    assert task_manager.get_task(tasks[0].id, user_id_1) == Task(
+        **{**tasks[0].model_dump(), "labels": {"kitchen", "daily"}, "sub_tasks": []}
+    )
+
+
+def test_get_tasks_page(
+    task_manager: TaskManager, user_id_1: UUID, user_id_2: UUID
+) -> None:
+    tasks = [
+        task_manager.create_task(CreateTask(name=f"Task {i}", user_id=user_id_1))
+        for i in range(5)
+    ]
+    task_manager.create_task(CreateTask(name="Wash Clothes", user_id=user_id_2))
+
+    first_page = task_manager.get_tasks_page(user_id_1, limit=2)
+    assert first_page.tasks == tasks[:2]
+
+    # Deleting a task that was already returned doesn't shift the next pages
+    task_manager.delete_task(tasks[0].id, user_id_1)
+
+    second_page = task_manager.get_tasks_page(
+        user_id_1, limit=2, cursor=first_page.next_cursor
+    )
+    assert second_page.tasks == tasks[2:4]
+
+    last_page = task_manager.get_tasks_page(
+        user_id_1, limit=2, cursor=second_page.next_cursor
+    )
+    assert last_page == TaskPage(tasks=tasks[4:], next_cursor=None)
+
+    assert task_manager.get_tasks_page(user_id_2, limit=2).next_cursor is None
+    assert task_manager.get_tasks_page(uuid4(), limit=2) == TaskPage(tasks=[])
+
+
+def test_get_tasks_page_after_the_last_tasks_are_deleted(
+    task_manager: TaskManager, user_id_1: UUID
+) -> None:
+    tasks = task_manager.create_tasks(
+        [CreateTask(name=f"Task {i}", user_id=user_id_1) for i in range(3)]
+    )
+    first_page = task_manager.get_tasks_page(user_id_1, limit=2)
+    assert first_page.tasks == tasks[:2]
+
+    # The new task mustn't take the deleted tasks' place, before the cursor
+    task_manager.delete_tasks([tasks[1].id, tasks[2].id], user_id_1)
+    created_task = task_manager.create_task(CreateTask(name="New", user_id=user_id_1))
+
+    next_page = task_manager.get_tasks_page(
+        user_id_1, limit=2, cursor=first_page.next_cursor
+    )
+    assert next_page == TaskPage(tasks=[created_task], next_cursor=None)
+    assert task_manager.get_tasks(user_id_1) == [tasks[0], created_task]
+
+
+def test_get_tasks_page_invalid_cursor(
+    task_manager: TaskManager, user_id_1: UUID
+) -> None:
+    for cursor in ["not a cursor", encode_cursor(["1"]), encode_cursor([1, 2])]:
+        with pytest.raises(InvalidCursor):
+            task_manager.get_tasks_page(user_id_1, limit=2, cursor=cursor)
+
+
+@pytest.fixture
+def tasks_to_query(task_manager: TaskManager, user_id_1: UUID) -> List[Task]:
+    today = date.today()
+    yesterday = today - timedelta(days=1)
+    tomorrow = today + timedelta(days=1)
+    return [
+        task_manager.create_task(task)
+        for task in [
+            CreateTask(
+                name="Dishes",
+                user_id=user_id_1,
+                due_date=yesterday,
+                labels={"kitchen", "daily"},
+            ),
+            CreateTask(
+                name="Cook",
+                user_id=user_id_1,
+                status=TaskStatus.DONE,
+                due_date=yesterday,
+                labels={"kitchen"},
+            ),
+            CreateTask(
+                name="Wash Clothes",
+                user_id=user_id_1,
+                status=TaskStatus.DOING,
+                labels={"daily"},
+            ),
+            CreateTask(
+                name="Bins",
+                user_id=user_id_1,
+                status=TaskStatus.BLOCKED,
+                due_date=tomorrow,
+                labels={"outside", "weekly"},
+            ),
+            CreateTask(name="Garden", user_id=user_id_1, due_date=today),
+        ]
+    ]
+
+
+def test_get_tasks_filtered(
+    task_manager: TaskManager,
+    user_id_1: UUID,
+    user_id_2: UUID,
+    tasks_to_query: List[Task],
+) -> None:
+    dishes, cook, wash_clothes, bins, garden = tasks_to_query
+    today = date.today()
+    task_manager.create_task(
+        CreateTask(name="Dishes", user_id=user_id_2, labels={"kitchen"})
+    )
+
+    def get_tasks(**query) -> List[Task]:
+        return task_manager.get_tasks(user_id_1, TaskQuery(**query))
+
+    assert get_tasks() == tasks_to_query
+    assert get_tasks(statuses={TaskStatus.DONE, TaskStatus.DOING}) == [
+        cook,
+        wash_clothes,
+    ]
+    assert get_tasks(labels_any={"kitchen", "outside"}) == [dishes, cook, bins]
+    assert get_tasks(labels_all={"kitchen", "daily"}) == [dishes]
+    assert get_tasks(due_after=today) == [bins, garden]
+    assert get_tasks(due_before=today) == [dishes, cook, garden]
+    assert get_tasks(due_after=today, due_before=today) == [garden]
+    assert get_tasks(overdue=True) == [dishes]
+    assert get_tasks(labels_any={"kitchen"}, statuses={TaskStatus.PENDING}) == [dishes]
+    assert get_tasks(labels_all={"missing"}) == []
+
+
+def test_in_memory_indexes_follow_writes(user_id_1: UUID) -> None:
+    task_manager = InMemoryTaskManager()
+    today = date.today()
+    random = Random(0)
+    labels = ["kitchen", "daily", "outside", "garden"]
+
+    def random_fields() -> dict:
+        return {
+            "status": random.choice(list(TaskStatus)),
+            "labels": set(random.sample(labels, random.randint(0, 2))),
+            "due_date": random.choice(
+                [None, today, today - timedelta(days=1), today + timedelta(days=1)]
+            ),
+        }
+
+    tasks = task_manager.create_tasks(
+        [
+            CreateTask(name=f"Task {i}", user_id=user_id_1, **random_fields())
+            for i in range(40)
+        ]
+    )
+    for task in tasks[:10]:
+        task_manager.update_task(
+            UpdateTask(**{**task.model_dump(), **random_fields()}), user_id_1
+        )
+    task_manager.delete_tasks([task.id for task in tasks[5:15]], user_id_1)
+    task_manager.restore_task(tasks[5].id, user_id_1)
+
+    queries = [
+        TaskQuery(statuses={TaskStatus.DONE, TaskStatus.BLOCKED}),
+        TaskQuery(labels_any={"kitchen", "garden"}, sort=TaskSortField.NAME),
+        TaskQuery(labels_all={"kitchen", "daily"}),
+        TaskQuery(due_after=today),
+        TaskQuery(due_before=today, statuses={TaskStatus.PENDING}),
+        TaskQuery(overdue=True, sort=TaskSortField.DUE_DATE),
+        TaskQuery(labels_all={"missing"}),
+    ]
+    all_tasks = task_manager.get_tasks(user_id_1)
+    indexes = task_manager.indexes[user_id_1]
+    for status in TaskStatus:
+        assert indexes.statuses.get(status, set()) == {
+            task.id for task in all_tasks if task.status == status
+        }
+    for label in labels:
+        assert indexes.labels.get(label, set()) == {
+            task.id for task in all_tasks if label in task.labels
+        }
+    assert indexes.sorted_due_dates == sorted(
+        {task.due_date for task in all_tasks if task.due_date is not None}
+    )
+    for query in queries:
+        assert task_manager.get_tasks(user_id_1, query) == [
+            task
+            for task, _ in sorted(
+                (
+                    (task, task_managers.sort_position(task, position, query.sort))
+                    for position, task in enumerate(all_tasks)
+                    if task_managers.task_matches(task, query, today)
+                ),
+                key=lambda row: row[1],
+            )
+        ]
+
+
+@pytest.mark.parametrize(
+    "sort, expected_order",
+    [
+        (TaskSortField.CREATED, [0, 1, 2, 3, 4]),
+        # Ties are broken by creation order, and tasks with no due date come last
+        (TaskSortField.DUE_DATE, [0, 1, 4, 3, 2]),
+        (TaskSortField.NAME, [3, 1, 0, 4, 2]),
+        (TaskSortField.STATUS, [3, 2, 1, 0, 4]),
+    ],
+)
+def test_get_tasks_sorted(
+    task_manager: TaskManager,
+    user_id_1: UUID,
+    tasks_to_query: List[Task],
+    sort: TaskSortField,
+    expected_order: List[int],
+) -> None:
+    expected_tasks = [tasks_to_query[i] for i in expected_order]
+    query = TaskQuery(sort=sort)
+
+    assert task_manager.get_tasks(user_id_1, query) == expected_tasks
+
+    paged_tasks = []
+    cursor = None
+    while True:
+        page = task_manager.get_tasks_page(user_id_1, 2, cursor, query)
+        paged_tasks.extend(page.tasks)
+        cursor = page.next_cursor
+        if cursor is None:
+            break
+    assert paged_tasks == expected_tasks
+
+
+def test_get_tasks_page_filtered(
+    task_manager: TaskManager, user_id_1: UUID, tasks_to_query: List[Task]
+) -> None:
+    dishes, cook, wash_clothes, bins, garden = tasks_to_query
+    query = TaskQuery(labels_any={"kitchen", "daily"}, sort=TaskSortField.NAME)
+
+    first_page = task_manager.get_tasks_page(user_id_1, 2, query=query)
+    assert first_page.tasks == [cook, dishes]
+
+    last_page = task_manager.get_tasks_page(user_id_1, 2, first_page.next_cursor, query)
+    assert last_page == TaskPage(tasks=[wash_clothes])
+
+    with pytest.raises(InvalidCursor):
+        task_manager.get_tasks_page(
+            user_id_1, 2, first_page.next_cursor, TaskQuery(sort=TaskSortField.STATUS)
+        )
+
+
 def test_get_task_returns_none(
     task_manager: TaskManager, user_id_1: UUID, user_id_2: UUID
 ) -> None:
@@ -116,12 +435,15 @@ def test_update_tasks(
     }
     expected_task = created_task_1.model_copy(update=fields_to_update)
 
-    updated_task = task_manager.update_task(
+    versioned_task = task_manager.update_task(
         UpdateTask(**{**created_task_1.model_dump(), **fields_to_update}),
         user_id_1,
     )
 
-    assert updated_task == expected_task
+    assert versioned_task.task == expected_task
+    assert versioned_task.version == task_manager.get_task_version(
+        created_task_1.id, user_id_1
+    )
     assert task_manager.get_task(created_task_1.id, user_id_1) == expected_task
 
 
@@ -172,6 +494,7 @@ def test_delete_task(
     assert task_deleted == HistoryEntry(
         id=task_deleted.id,
         entity_id=task_to_be_deleted.id,
+        user_id=user_id_1,
         type=HistoryEntryType.TASK_DELETED,
         version=HistoryEntryVersion.TASK,
         event=deleted_task.model_dump_json(),
@@ -201,6 +524,124 @@ def test_delete_task_returns_none(
     assert task_manager.get_task(created_task_1.id, user_id_1) == created_task_1
 
 
+def test_create_tasks(task_manager: TaskManager, user_id_1: UUID) -> None:
+    created_tasks = task_manager.create_tasks(
+        [
+            CreateTask(name="Dishes", user_id=user_id_1, labels={"kitchen", "daily"}),
+            CreateTask(name="Cook", user_id=user_id_1, due_date=date.today()),
+            CreateTask(name="Bins", user_id=user_id_1, labels={"kitchen"}),
+        ]
+    )
+
+    assert [task.name for task in created_tasks] == ["Dishes", "Cook", "Bins"]
+    assert task_manager.get_tasks(user_id_1) == created_tasks
+    assert task_manager.create_tasks([]) == []
+
+
+def test_update_tasks(task_manager: TaskManager, user_id_1: UUID, user_id_2: UUID):
+    task_1, task_2 = task_manager.create_tasks(
+        [
+            CreateTask(name="Dishes", user_id=user_id_1, labels={"kitchen"}),
+            CreateTask(name="Cook", user_id=user_id_1),
+        ]
+    )
+    other_users_task = task_manager.create_task(
+        CreateTask(name="Bins", user_id=user_id_2)
+    )
+
+    updated_tasks = task_manager.update_tasks(
+        [
+            UpdateTask(
+                **{**task_1.model_dump(), "status": TaskStatus.DONE, "labels": set()}
+            ),
+            UpdateTask(**{**other_users_task.model_dump(), "name": "Sweep"}),
+            UpdateTask(**{**task_2.model_dump(), "labels": {"kitchen", "daily"}}),
+        ],
+        user_id_1,
+    )
+
+    assert updated_tasks == [
+        Task(**{**task_1.model_dump(), "status": TaskStatus.DONE, "labels": set()}),
+        None,
+        Task(**{**task_2.model_dump(), "labels": {"kitchen", "daily"}}),
+    ]
+    assert task_manager.get_tasks(user_id_1) == [updated_tasks[0], updated_tasks[2]]
+    assert task_manager.get_task(other_users_task.id, user_id_2) == other_users_task
+
+
+def test_delete_tasks(
+    task_manager: TaskManager, user_id_1: UUID, user_id_2: UUID
+) -> None:
+    task_1, task_2, task_3 = task_manager.create_tasks(
+        [
+            CreateTask(name="Dishes", user_id=user_id_1, labels={"kitchen"}),
+            CreateTask(name="Cook", user_id=user_id_1),
+            CreateTask(name="Bins", user_id=user_id_1),
+        ]
+    )
+
+    deleted_tasks = task_manager.delete_tasks(
+        [task_1.id, uuid4(), task_3.id, task_1.id], user_id_1
+    )
+
+    assert deleted_tasks == [task_1, None, task_3, None]
+    assert task_manager.get_tasks(user_id_1) == [task_2]
+    assert task_manager.delete_tasks([task_2.id], user_id_2) == [None]
+
+    task_deleted = task_manager.get_last_history_entry(task_1.id, user_id_1)
+    assert task_deleted.type == HistoryEntryType.TASK_DELETED
+    assert task_manager.restore_task(task_1.id, user_id_1) == task_1
+
+
+def test_task_versions(
+    task_manager: TaskManager, user_id_1: UUID, user_id_2: UUID
+) -> None:
+    assert task_manager.get_tasks_version(user_id_1) == 0
+
+    task_1 = task_manager.create_task(CreateTask(name="Dishes", user_id=user_id_1))
+    task_2 = task_manager.create_task(CreateTask(name="Cook", user_id=user_id_1))
+    task_1_version = task_manager.get_task_version(task_1.id, user_id_1)
+    task_2_version = task_manager.get_task_version(task_2.id, user_id_1)
+    tasks_version = task_manager.get_tasks_version(user_id_1)
+    assert task_manager.get_task_version(task_1.id, user_id_2) is None
+    assert task_manager.get_tasks_version(user_id_2) == 0
+
+    updated_task_1_version = task_manager.update_task(
+        UpdateTask(**{**task_1.model_dump(), "name": "Wash Dishes"}), user_id_1
+    ).version
+    assert task_manager.get_task_version(task_1.id, user_id_1) == updated_task_1_version
+    assert updated_task_1_version > task_1_version
+    assert task_manager.get_task_version(task_2.id, user_id_1) == task_2_version
+    assert task_manager.get_tasks_version(user_id_1) > tasks_version
+
+    tasks_version = task_manager.get_tasks_version(user_id_1)
+    task_manager.delete_task(task_1.id, user_id_1)
+    assert task_manager.get_task_version(task_1.id, user_id_1) is None
+    assert task_manager.get_tasks_version(user_id_1) > tasks_version
+
+    # A restored task never goes back to a version it had before
+    task_manager.restore_task(task_1.id, user_id_1)
+    assert task_manager.get_task_version(task_1.id, user_id_1) > updated_task_1_version
+
+
+def test_write_with_expected_version(task_manager: TaskManager, user_id_1: UUID):
+    task = task_manager.create_task(CreateTask(name="Dishes", user_id=user_id_1))
+    version = task_manager.get_task_version(task.id, user_id_1)
+    update_task = UpdateTask(**{**task.model_dump(), "name": "Wash Dishes"})
+
+    updated_task = task_manager.update_task(update_task, user_id_1, version).task
+    assert updated_task.name == "Wash Dishes"
+
+    with pytest.raises(TaskVersionMismatch):
+        task_manager.update_task(update_task, user_id_1, version)
+    with pytest.raises(TaskVersionMismatch):
+        task_manager.delete_task(task.id, user_id_1, version)
+    assert task_manager.get_task(task.id, user_id_1) == updated_task
+
+    version = task_manager.get_task_version(task.id, user_id_1)
+    assert task_manager.delete_task(task.id, user_id_1, version) == updated_task
+
+
 def test_get_last_history_entry_returns_none(
     task_manager: TaskManager, user_id_1: UUID, user_id_2: UUID
 ) -> None:
@@ -228,6 +669,7 @@ def test_get_last_history_entry_returns_none(
     assert history_entry == HistoryEntry(
         id=history_entry.id,
         entity_id=created_task_1.id,
+        user_id=user_id_1,
         type=HistoryEntryType.TASK_DELETED,
         version=HistoryEntryVersion.TASK,
         event=created_task_1.model_dump_json(),
@@ -235,6 +677,22 @@ def test_get_last_history_entry_returns_none(
     )
 
 
+def test_get_last_history_entry_is_the_latest(
+    task_manager: TaskManager, user_id_1: UUID
+) -> None:
+    task = task_manager.create_task(CreateTask(name="Dishes", user_id=user_id_1))
+    task_manager.delete_task(task.id, user_id_1)
+    task_manager.restore_task(task.id, user_id_1)
+    updated_task = task_manager.update_task(
+        UpdateTask(**{**task.model_dump(), "name": "Dry dishes"}), user_id_1
+    ).task
+    task_manager.delete_task(task.id, user_id_1)
+
+    history_entry = task_manager.get_last_history_entry(task.id, user_id_1)
+
+    assert Task.model_validate_json(history_entry.event) == updated_task
+
+
 def test_restore_task(task_manager: TaskManager, user_id_1: UUID) -> None:
     created_task = task_manager.create_task(
         CreateTask(
@@ -292,3 +750,80 @@ def test_restore_task_already_exists(
         task_manager.restore_task(created_task.id, user_id_1)
 
     assert e.value.task_id == created_task.id
+
+
+def test_restore_tasks(
+    task_manager: TaskManager, user_id_1: UUID, user_id_2: UUID
+) -> None:
+    task_1, task_2, task_3, task_4 = task_manager.create_tasks(
+        [
+            CreateTask(name="Dishes", user_id=user_id_1, labels={"kitchen", "daily"}),
+            CreateTask(name="Cook", user_id=user_id_1, due_date=date.today()),
+            CreateTask(name="Bins", user_id=user_id_1, status=TaskStatus.DONE),
+            CreateTask(name="Hoover", user_id=user_id_1),
+        ]
+    )
+    task_manager.delete_tasks([task_3.id, task_1.id, task_2.id], user_id_1)
+    task_manager.restore_task(task_2.id, user_id_1)
+    tasks_version = task_manager.get_tasks_version(user_id_1)
+
+    restored_tasks = task_manager.restore_tasks(
+        user_id_1, [task_1.id, task_2.id, uuid4(), task_3.id, task_4.id, task_1.id]
+    )
+
+    assert restored_tasks == RestoredTasks(
+        restored=[task_3, task_1], conflicts=[task_2]
+    )
+    assert task_manager.get_tasks(user_id_1, TaskQuery(sort=TaskSortField.NAME)) == [
+        task_3,
+        task_2,
+        task_1,
+        task_4,
+    ]
+    assert task_manager.get_tasks_version(user_id_1) > tasks_version
+    assert task_manager.restore_tasks(user_id_2, [task_1.id]) == RestoredTasks()
+
+
+def test_restore_tasks_after_a_batch_delete(
+    task_manager: TaskManager, user_id_1: UUID
+) -> None:
+    tasks = task_manager.create_tasks(
+        [CreateTask(name=f"Task {i}", user_id=user_id_1) for i in range(30)]
+    )
+    # Every entry of the batch is created at the same time
+    task_manager.delete_tasks([task.id for task in reversed(tasks)], user_id_1)
+
+    restored_tasks = task_manager.restore_tasks(user_id_1)
+
+    assert restored_tasks.restored == list(reversed(tasks))
+    assert restored_tasks.conflicts == []
+
+
+def test_restore_tasks_deleted_since(
+    task_manager: TaskManager, user_id_1: UUID
+) -> None:
+    task_1, task_2, task_3 = task_manager.create_tasks(
+        [
+            CreateTask(name="Dishes", user_id=user_id_1, labels={"kitchen"}),
+            CreateTask(name="Cook", user_id=user_id_1),
+            CreateTask(name="Bins", user_id=user_id_1),
+        ]
+    )
+    task_manager.delete_task(task_1.id, user_id_1)
+    deleted_since = task_manager.get_last_history_entry(
+        task_1.id, user_id_1
+    ).created_at + timedelta(microseconds=1)
+    task_manager.delete_task(task_3.id, user_id_1)
+    task_manager.delete_task(task_2.id, user_id_1)
+    task_manager.restore_task(task_3.id, user_id_1)
+
+    restored_tasks = task_manager.restore_tasks(user_id_1, deleted_since=deleted_since)
+
+    assert restored_tasks == RestoredTasks(restored=[task_2], conflicts=[task_3])
+    assert task_manager.get_task(task_1.id, user_id_1) is None
+    assert task_manager.restore_tasks(
+        user_id_1, [task_1.id, task_2.id], deleted_since
+    ) == RestoredTasks(conflicts=[task_2])
+    assert task_manager.restore_tasks(user_id_1) == RestoredTasks(
+        restored=[task_1], conflicts=[task_3, task_2]
+    )
@@ -0,0 +1,119 @@
+"""Compare SqliteTaskManager batch writes with writing the same tasks one at a time.
+
+Run with ``python -m benchmarks.batch``. A fresh sqlite database is created in a
+temporary directory, so this never touches ``app/task.db``.
+"""
+
+import argparse
+import tempfile
+import time
+from typing import Callable, Dict, List
+from uuid import uuid4
+
+from app.database import Database
+from app.domain.models import CreateTask, Task, UpdateTask
+from app.domain.task_managers import SqliteTaskManager
+
+
+def timed(step: Callable[[], None]) -> float:
+    start = time.perf_counter()
+    step()
+    return time.perf_counter() - start
+
+
+def run(items: int, labels: int) -> Dict[str, Dict[str, float]]:
+    with tempfile.TemporaryDirectory() as directory:
+        database = Database(db_url=f"sqlite:///{directory}/task.db")
+        database.create_database()
+        task_manager = SqliteTaskManager(session_factory=database.session)
+
+        user_id = uuid4()
+        create_tasks = [
+            CreateTask(
+                name=f"Task {i}",
+                user_id=user_id,
+                labels={f"label {(i + j) % (labels * 2)}" for j in range(labels)},
+            )
+            for i in range(items)
+        ]
+
+        def update_tasks_for(tasks: List[Task]) -> List[UpdateTask]:
+            return [
+                UpdateTask(**{**task.model_dump(), "name": f"{task.name} updated"})
+                for task in tasks
+            ]
+
+        single_tasks: List[Task] = []
+        single = {
+            "create": timed(
+                lambda: single_tasks.extend(
+                    task_manager.create_task(create_task)
+                    for create_task in create_tasks
+                )
+            ),
+        }
+        single["update"] = timed(
+            lambda: [
+                task_manager.update_task(update_task, user_id)
+                for update_task in update_tasks_for(single_tasks)
+            ]
+        )
+        single["delete"] = timed(
+            lambda: [
+                task_manager.delete_task(task.id, user_id) for task in single_tasks
+            ]
+        )
+        single["restore"] = timed(
+            lambda: [
+                task_manager.restore_task(task.id, user_id) for task in single_tasks
+            ]
+        )
+
+        batch_tasks: List[Task] = []
+        batch = {
+            "create": timed(
+                lambda: batch_tasks.extend(task_manager.create_tasks(create_tasks))
+            ),
+        }
+        batch["update"] = timed(
+            lambda: task_manager.update_tasks(update_tasks_for(batch_tasks), user_id)
+        )
+        batch["delete"] = timed(
+            lambda: task_manager.delete_tasks(
+                [task.id for task in batch_tasks], user_id
+            )
+        )
+        batch["restore"] = timed(
+            lambda: task_manager.restore_tasks(
+                user_id, [task.id for task in batch_tasks]
+            )
+        )
+
+        database.engine.dispose()
+        return {
+            name: {
+                "single_items_per_second": items / single[name],
+                "batch_items_per_second": items / batch[name],
+                "speedup": single[name] / batch[name],
+            }
+            for name in single
+        }
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--items", type=int, default=1000)
+    parser.add_argument("--labels", type=int, default=3)
+    args = parser.parse_args()
+
+    results = run(args.items, args.labels)
+    print(f"{'operation':<10} {'single/s':>10} {'batch/s':>10} {'speedup':>8}")
+    for name, result in results.items():
+        print(
+            f"{name:<10} {result['single_items_per_second']:>10.0f} "
+            f"{result['batch_items_per_second']:>10.0f} {result['speedup']:>7.1f}x"
+        )
+
+
+if __name__ == "__main__":
+    main()
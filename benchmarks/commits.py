@@ -0,0 +1,89 @@
+"""Count the commits and time taken by each SqliteTaskManager write.
+
+Run with ``python -m benchmarks.commits``. A fresh sqlite database is created in a
+temporary directory, so this never touches ``app/task.db``.
+"""
+
+import argparse
+import tempfile
+import time
+from typing import Callable, Dict, List
+from uuid import uuid4
+
+from sqlalchemy import event
+
+from app.database import Database
+from app.domain.models import CreateTask, Task, UpdateTask
+from app.domain.task_managers import SqliteTaskManager
+
+
+def run(operations: int, labels: int) -> Dict[str, Dict[str, float]]:
+    with tempfile.TemporaryDirectory() as directory:
+        database = Database(db_url=f"sqlite:///{directory}/task.db")
+        database.create_database()
+        task_manager = SqliteTaskManager(session_factory=database.session)
+
+        commits = 0
+
+        def count_commit(conn) -> None:
+            nonlocal commits
+            commits += 1
+
+        event.listen(database.engine, "commit", count_commit)
+
+        user_id = uuid4()
+        task_labels = {f"label {i}" for i in range(labels)}
+        tasks: List[Task] = []
+
+        def create() -> None:
+            tasks.append(
+                task_manager.create_task(
+                    CreateTask(name="Dishes", user_id=user_id, labels=task_labels)
+                )
+            )
+
+        def update(task: Task) -> None:
+            task_manager.update_task(
+                UpdateTask(**{**task.model_dump(), "name": "Wash & Dry Dishes"}),
+                user_id,
+            )
+
+        results = {}
+        steps: Dict[str, Callable[[int], None]] = {
+            "create_task": lambda i: create(),
+            "update_task": lambda i: update(tasks[i]),
+            "delete_task": lambda i: task_manager.delete_task(tasks[i].id, user_id),
+            "restore_task": lambda i: task_manager.restore_task(tasks[i].id, user_id),
+        }
+        for name, step in steps.items():
+            commits = 0
+            start = time.perf_counter()
+            for i in range(operations):
+                step(i)
+            elapsed = time.perf_counter() - start
+            results[name] = {
+                "commits_per_operation": commits / operations,
+                "operations_per_second": operations / elapsed,
+            }
+
+        database.engine.dispose()
+        return results
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--operations", type=int, default=500)
+    parser.add_argument("--labels", type=int, default=5)
+    args = parser.parse_args()
+
+    results = run(args.operations, args.labels)
+    print(f"{'operation':<14} {'commits/op':>10} {'ops/s':>10}")
+    for name, result in results.items():
+        print(
+            f"{name:<14} {result['commits_per_operation']:>10.2f} "
+            f"{result['operations_per_second']:>10.0f}"
+        )
+
+
+if __name__ == "__main__":
+    main()
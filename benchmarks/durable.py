@@ -0,0 +1,138 @@
+"""Measure how long DurableInMemoryTaskManager takes to start with many tasks.
+
+Run with ``python -m benchmarks.durable``. The tasks are written in batches,
+snapshotted, then more are written to the log after the snapshot, so a restart
+loads the snapshot and replays the log tail. The concurrent writes compare
+fsyncs per write with writers sharing them. Everything is written to a temporary
+directory, so this never touches ``app/task_log``.
+"""
+
+import argparse
+import os
+import tempfile
+import threading
+import time
+from typing import Dict, List
+from uuid import UUID, uuid4
+
+from app.domain import durable_task_managers
+from app.domain.durable_task_managers import DurableInMemoryTaskManager
+from app.domain.models import CreateTask, TaskStatus
+
+
+def create_tasks(user_ids: List[UUID], start: int, count: int) -> List[CreateTask]:
+    return [
+        CreateTask(
+            name=f"Task {i}",
+            user_id=user_ids[i % len(user_ids)],
+            status=list(TaskStatus)[i % len(TaskStatus)],
+            labels={f"label {i % 20}"},
+        )
+        for i in range(start, start + count)
+    ]
+
+
+def write_concurrently(
+    task_manager: DurableInMemoryTaskManager, writers: int, writes: int
+) -> Dict[str, float]:
+    fsyncs = 0
+    fsync = os.fsync
+
+    def counted_fsync(fd: int) -> None:
+        nonlocal fsyncs
+        fsyncs += 1
+        fsync(fd)
+
+    def write() -> None:
+        user_id = uuid4()
+        for i in range(writes):
+            task_manager.create_task(CreateTask(name=f"Task {i}", user_id=user_id))
+
+    durable_task_managers.os.fsync = counted_fsync  # type: ignore[attr-defined]
+    try:
+        threads = [threading.Thread(target=write) for _ in range(writers)]
+        start = time.perf_counter()
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+        elapsed = time.perf_counter() - start
+    finally:
+        durable_task_managers.os.fsync = fsync  # type: ignore[attr-defined]
+    return {
+        "writes_per_second": writers * writes / elapsed,
+        "writes_per_fsync": writers * writes / fsyncs,
+    }
+
+
+def run(
+    tasks: int, tail: int, users: int, batch_size: int, writers: int
+) -> Dict[str, float]:
+    with tempfile.TemporaryDirectory() as directory:
+        # Snapshots are only written when asked for below
+        task_manager = DurableInMemoryTaskManager(directory, snapshot_every=tasks * 2)
+        user_ids = [uuid4() for _ in range(users)]
+
+        start = time.perf_counter()
+        for batch in range(0, tasks, batch_size):
+            task_manager.create_tasks(
+                create_tasks(user_ids, batch, min(batch_size, tasks - batch))
+            )
+        load = time.perf_counter() - start
+
+        start = time.perf_counter()
+        task_manager.start_snapshot()
+        task_manager.close()
+        snapshot = time.perf_counter() - start
+        snapshot_size = os.path.getsize(os.path.join(directory, "snapshot.json"))
+
+        task_manager = DurableInMemoryTaskManager(directory, snapshot_every=tasks * 2)
+        task_manager.create_tasks(create_tasks(user_ids, tasks, tail))
+        concurrent = write_concurrently(task_manager, writers, 50)
+        task_manager.close()
+        del task_manager
+
+        start = time.perf_counter()
+        task_manager = DurableInMemoryTaskManager(directory, snapshot_every=tasks * 2)
+        restart = time.perf_counter() - start
+        assert (
+            sum(len(user_tasks) for user_tasks in task_manager.tasks.values())
+            == tasks + tail + writers * 50
+        )
+        task_manager.close()
+
+        return {
+            "load": load,
+            "snapshot": snapshot,
+            "snapshot_mb": snapshot_size / 1024 / 1024,
+            "restart": restart,
+            **concurrent,
+        }
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--tasks", type=int, default=1_000_000)
+    parser.add_argument(
+        "--tail", type=int, default=10_000, help="tasks written after the snapshot"
+    )
+    parser.add_argument("--users", type=int, default=1000)
+    parser.add_argument("--batch-size", type=int, default=1000)
+    parser.add_argument("--writers", type=int, default=16)
+    args = parser.parse_args()
+
+    result = run(args.tasks, args.tail, args.users, args.batch_size, args.writers)
+    print(f"wrote {args.tasks} tasks in {result['load']:.1f}s")
+    print(f"snapshot of {result['snapshot_mb']:.0f}MB in {result['snapshot']:.1f}s")
+    print(
+        f"{args.writers} writers: {result['writes_per_second']:.0f} writes/s, "
+        f"{result['writes_per_fsync']:.1f} writes per fsync"
+    )
+    print(
+        f"restarted with {args.tasks} tasks and a {args.tail} task log tail in "
+        f"{result['restart']:.1f}s"
+    )
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,72 @@
+"""Time POST /tasks/import against a sqlite database.
+
+Run with ``python -m benchmarks.import_tasks``. The app is pointed at a fresh sqlite
+database in a temporary directory, so this never touches ``app/task.db``.
+"""
+
+import argparse
+import json
+import tempfile
+import time
+from typing import Dict
+from uuid import uuid4
+
+from starlette.testclient import TestClient
+
+from app.main import create_app
+
+
+def ndjson_body(tasks: int, labels: int) -> bytes:
+    lines = [
+        json.dumps(
+            {
+                "name": f"Task {i}",
+                "status": "Pending",
+                "labels": [f"label {(i + j) % (labels * 10)}" for j in range(labels)],
+                "due_date": "2024-06-30",
+            }
+        )
+        for i in range(tasks)
+    ]
+    return ("\n".join(lines) + "\n").encode()
+
+
+def run(tasks: int, labels: int, task_manager_type: str) -> Dict[str, float]:
+    with tempfile.TemporaryDirectory() as directory:
+        app = create_app()
+        app.container.config.db.url.from_value(f"sqlite:///{directory}/task.db")
+        app.container.config.task_manager.type.from_value(task_manager_type)
+        app.container.db().create_database()
+
+        body = ndjson_body(tasks, labels)
+        with TestClient(app) as client:
+            start = time.perf_counter()
+            response = client.post(
+                "/tasks/import", params={"user_id": str(uuid4())}, content=body
+            )
+            elapsed = time.perf_counter() - start
+        app.container.unwire()
+
+        result = response.json()["data"]
+        assert result["imported"] == tasks, result
+        return {"tasks": tasks, "seconds": elapsed, "tasks_per_second": tasks / elapsed}
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--tasks", type=int, default=100000)
+    parser.add_argument("--labels", type=int, default=3)
+    parser.add_argument(
+        "--task-manager-type", default="sqlite", choices=["sqlite", "in_memory"]
+    )
+    args = parser.parse_args()
+
+    result = run(args.tasks, args.labels, args.task_manager_type)
+    print(
+        f"imported {result['tasks']} tasks in {result['seconds']:.2f}s, "
+        f"{result['tasks_per_second']:.0f} tasks/s"
+    )
+
+
+if __name__ == "__main__":
+    main()
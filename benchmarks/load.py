@@ -0,0 +1,504 @@
+"""Drive the api over HTTP with concurrent clients and measure each endpoint.
+
+Run with ``python -m benchmarks.load``. For each ``TASK_MANAGER_TYPE``, the app
+from ``app.main.create_app`` is served by uvicorn in its own process, with its
+databases and task log in a temporary directory, so this never touches
+``app/task.db``. Each client is a user that creates some tasks, then sends
+requests to the endpoints in ``tasks_api.http`` for ``--duration`` seconds,
+picking each one at random by the weights in ``--mix``:
+
+    python -m benchmarks.load --mix get_task=10 update_task=1
+
+Latency is measured by the clients, so it includes the HTTP round trip as well
+as routing, dependency injection and response validation. The clients share
+the machine with the server, so on few cores they slow it down too.
+"""
+
+import argparse
+import asyncio
+import json
+import multiprocessing
+import socket
+import tempfile
+import time
+from dataclasses import dataclass, field
+from random import Random
+from typing import Any, Awaitable, Callable, Dict, List, Optional
+from uuid import uuid4
+
+import httpx
+import uvicorn
+
+from app.main import create_app
+from benchmarks.suite import environment, percentile
+
+TASK_MANAGER_TYPES = [
+    "in_memory",
+    "durable_in_memory",
+    "sqlite",
+    "cached_sqlite",
+    "sharded_sqlite",
+]
+PERCENTILES = (50, 95, 99)
+LABELS = [f"label {label}" for label in range(20)]
+STATUSES = ["Pending", "Doing", "Blocked", "Done"]
+
+
+def serve(task_manager_type: str, directory: str, port: int) -> None:
+    app = create_app()
+    config = app.container.config
+    config.task_manager.type.from_value(task_manager_type)
+    config.db.url.from_value(f"sqlite:///{directory}/task.db")
+    config.history.archive.url.from_value(f"sqlite:///{directory}/task_archive.db")
+    config.shards.urls.from_value(
+        [f"sqlite:///{directory}/task_shard_{shard}.db" for shard in range(4)]
+    )
+    config.durable.directory.from_value(f"{directory}/task_log")
+    if task_manager_type in ("sqlite", "cached_sqlite"):
+        app.container.db().create_database()
+    elif task_manager_type == "sharded_sqlite":
+        for database in app.container.shard_dbs():
+            database.create_database()
+    uvicorn.run(app, host="127.0.0.1", port=port, log_level="warning", access_log=False)
+
+
+def free_port() -> int:
+    with socket.socket() as sock:
+        sock.bind(("127.0.0.1", 0))
+        return sock.getsockname()[1]
+
+
+def task_body(random: Random, i: int) -> Dict[str, Any]:
+    return {
+        "name": f"Task {i}",
+        "status": random.choice(STATUSES),
+        "labels": random.sample(LABELS, 2),
+        "due_date": f"2024-06-{random.randrange(1, 29):02d}" if i % 2 else None,
+    }
+
+
+@dataclass
+class Client:
+    """A user, and the tasks they have created and deleted so far."""
+
+    http: httpx.AsyncClient
+    random: Random
+    batch_size: int
+    user_id: str = field(default_factory=lambda: str(uuid4()))
+    tasks: Dict[str, Dict[str, Any]] = field(default_factory=dict)
+    deleted: List[str] = field(default_factory=list)
+    etags: Dict[str, str] = field(default_factory=dict)
+    cursor: Optional[str] = None
+    created: int = 0
+
+    @property
+    def params(self) -> Dict[str, str]:
+        return {"user_id": self.user_id}
+
+    def new_task_bodies(self, count: int) -> List[Dict[str, Any]]:
+        bodies = [task_body(self.random, self.created + i) for i in range(count)]
+        self.created += count
+        return bodies
+
+    def pick(self, count: int = 1) -> List[str]:
+        return self.random.sample(list(self.tasks), min(count, len(self.tasks)))
+
+    def pick_deleted(self, count: int = 1) -> List[str]:
+        # The most recently deleted, so restores don't reach the archive
+        picked = self.deleted[-count:]
+        del self.deleted[-count:]
+        return picked
+
+    def removed(self, task_ids: List[str]) -> None:
+        for task_id in task_ids:
+            del self.tasks[task_id]
+        self.deleted += task_ids
+
+    def stored(self, response: httpx.Response) -> None:
+        if response.status_code < 400:
+            task = response.json()["data"]
+            self.tasks[task["id"]] = task
+
+    def stored_batch(self, response: httpx.Response) -> None:
+        if response.status_code < 400:
+            for result in response.json()["data"]:
+                if result["status"] < 400:
+                    self.tasks[result["data"]["id"]] = result["data"]
+
+    def updated_body(self, task_id: str) -> Dict[str, Any]:
+        return {**self.tasks[task_id], "status": self.random.choice(STATUSES)}
+
+
+# Sends one request, choosing what to send from the client's tasks. Returns None
+# when the client has no tasks it can send it for.
+Endpoint = Callable[[Client], Awaitable[Optional[httpx.Response]]]
+
+
+async def create_task(client: Client) -> httpx.Response:
+    response = await client.http.post(
+        "/tasks", params=client.params, json=client.new_task_bodies(1)[0]
+    )
+    client.stored(response)
+    return response
+
+
+async def get_task(client: Client) -> Optional[httpx.Response]:
+    if not client.tasks:
+        return None
+    [task_id] = client.pick()
+    response = await client.http.get(f"/tasks/{task_id}", params=client.params)
+    if "ETag" in response.headers:
+        client.etags[task_id] = response.headers["ETag"]
+    return response
+
+
+async def get_task_if_changed(client: Client) -> Optional[httpx.Response]:
+    task_ids = [task_id for task_id in client.etags if task_id in client.tasks]
+    if not task_ids:
+        return None
+    task_id = client.random.choice(task_ids)
+    return await client.http.get(
+        f"/tasks/{task_id}",
+        params=client.params,
+        headers={"If-None-Match": client.etags[task_id]},
+    )
+
+
+async def get_tasks(client: Client) -> httpx.Response:
+    return await client.http.get("/tasks", params=client.params)
+
+
+async def get_tasks_page(client: Client) -> httpx.Response:
+    params = {**client.params, "limit": "10"}
+    if client.cursor is not None:
+        params["cursor"] = client.cursor
+    response = await client.http.get("/tasks", params=params)
+    # Page through the tasks, starting again after the last page
+    client.cursor = response.json()["next_cursor"]
+    return response
+
+
+async def export_tasks(client: Client) -> httpx.Response:
+    return await client.http.get("/tasks/export", params=client.params)
+
+
+async def import_tasks(client: Client) -> httpx.Response:
+    # Imported tasks aren't returned, so they are only read by get_tasks
+    lines = [json.dumps(body) for body in client.new_task_bodies(client.batch_size)]
+    return await client.http.post(
+        "/tasks/import",
+        params=client.params,
+        content=("\n".join(lines) + "\n").encode(),
+        headers={"Content-Type": "application/x-ndjson"},
+    )
+
+
+async def update_task(client: Client) -> Optional[httpx.Response]:
+    if not client.tasks:
+        return None
+    [task_id] = client.pick()
+    response = await client.http.put(
+        f"/tasks/{task_id}", params=client.params, json=client.updated_body(task_id)
+    )
+    client.stored(response)
+    return response
+
+
+async def delete_task(client: Client) -> Optional[httpx.Response]:
+    if not client.tasks:
+        return None
+    [task_id] = client.pick()
+    response = await client.http.delete(f"/tasks/{task_id}", params=client.params)
+    client.removed([task_id])
+    return response
+
+
+async def restore_task(client: Client) -> Optional[httpx.Response]:
+    if not client.deleted:
+        return None
+    [task_id] = client.pick_deleted()
+    response = await client.http.post(f"/tasks/{task_id}/restore", params=client.params)
+    client.stored(response)
+    return response
+
+
+async def batch_create_tasks(client: Client) -> httpx.Response:
+    response = await client.http.post(
+        "/tasks/batch/create",
+        params=client.params,
+        json={"tasks": client.new_task_bodies(client.batch_size)},
+    )
+    client.stored_batch(response)
+    return response
+
+
+async def batch_update_tasks(client: Client) -> Optional[httpx.Response]:
+    task_ids = client.pick(client.batch_size)
+    if not task_ids:
+        return None
+    response = await client.http.post(
+        "/tasks/batch/update",
+        params=client.params,
+        json={"tasks": [client.updated_body(task_id) for task_id in task_ids]},
+    )
+    client.stored_batch(response)
+    return response
+
+
+async def batch_delete_tasks(client: Client) -> Optional[httpx.Response]:
+    task_ids = client.pick(client.batch_size)
+    if not task_ids:
+        return None
+    response = await client.http.post(
+        "/tasks/batch/delete", params=client.params, json={"task_ids": task_ids}
+    )
+    client.removed(task_ids)
+    return response
+
+
+async def batch_restore_tasks(client: Client) -> Optional[httpx.Response]:
+    task_ids = client.pick_deleted(client.batch_size)
+    if not task_ids:
+        return None
+    response = await client.http.post(
+        "/tasks/batch/restore", params=client.params, json={"task_ids": task_ids}
+    )
+    client.stored_batch(response)
+    return response
+
+
+ENDPOINTS: Dict[str, Endpoint] = {
+    "create_task": create_task,
+    "get_task": get_task,
+    "get_task_if_changed": get_task_if_changed,
+    "get_tasks": get_tasks,
+    "get_tasks_page": get_tasks_page,
+    "export_tasks": export_tasks,
+    "import_tasks": import_tasks,
+    "update_task": update_task,
+    "delete_task": delete_task,
+    "restore_task": restore_task,
+    "batch_create_tasks": batch_create_tasks,
+    "batch_update_tasks": batch_update_tasks,
+    "batch_delete_tasks": batch_delete_tasks,
+    "batch_restore_tasks": batch_restore_tasks,
+}
+# Mostly reads, with enough deletes that restores have something to restore
+DEFAULT_MIX = {
+    "create_task": 10,
+    "get_task": 25,
+    "get_task_if_changed": 5,
+    "get_tasks": 5,
+    "get_tasks_page": 10,
+    "export_tasks": 1,
+    "import_tasks": 1,
+    "update_task": 15,
+    "delete_task": 5,
+    "restore_task": 3,
+    "batch_create_tasks": 2,
+    "batch_update_tasks": 2,
+    "batch_delete_tasks": 2,
+    "batch_restore_tasks": 1,
+}
+
+
+@dataclass
+class Workload:
+    clients: int
+    tasks_per_client: int
+    batch_size: int
+    duration: float
+    mix: Dict[str, int]
+    seed: int
+
+
+async def drive(
+    client: Client, mix: Dict[str, int], deadline: float
+) -> Dict[str, List[float]]:
+    names = list(mix)
+    weights = list(mix.values())
+    latencies: Dict[str, List[float]] = {name: [] for name in names}
+    errors: Dict[str, List[float]] = {name: [] for name in names}
+    while time.perf_counter() < deadline:
+        name = client.random.choices(names, weights)[0]
+        start = time.perf_counter()
+        response = await ENDPOINTS[name](client)
+        if response is None:
+            continue
+        elapsed = time.perf_counter() - start
+        (errors if response.status_code >= 400 else latencies)[name].append(elapsed)
+    return {
+        **latencies,
+        **{f"{name} errors": values for name, values in errors.items()},
+    }
+
+
+async def wait_until_serving(http: httpx.AsyncClient, timeout: float = 30) -> None:
+    deadline = time.perf_counter() + timeout
+    while True:
+        try:
+            await http.get("/openapi.json")
+            return
+        except httpx.TransportError:
+            if time.perf_counter() > deadline:
+                raise
+            await asyncio.sleep(0.1)
+
+
+def summarize(latencies: List[float], errors: int, elapsed: float) -> Dict[str, Any]:
+    latencies.sort()
+    return {
+        "requests": len(latencies),
+        "errors": errors,
+        "requests_per_second": len(latencies) / elapsed,
+        "latency_ms": (
+            {f"p{p}": percentile(latencies, p) * 1000 for p in PERCENTILES}
+            if latencies
+            else {}
+        ),
+    }
+
+
+async def load(port: int, workload: Workload) -> Dict[str, Any]:
+    limits = httpx.Limits(max_connections=workload.clients)
+    async with httpx.AsyncClient(
+        base_url=f"http://127.0.0.1:{port}", limits=limits, timeout=60
+    ) as http:
+        await wait_until_serving(http)
+        random = Random(workload.seed)
+        clients = [
+            Client(http, Random(random.random()), workload.batch_size)
+            for _ in range(workload.clients)
+        ]
+        # Seeded before the clock starts, batch creates are capped at 1000 tasks
+        for client in clients:
+            for start in range(0, workload.tasks_per_client, 1000):
+                count = min(1000, workload.tasks_per_client - start)
+                response = await http.post(
+                    "/tasks/batch/create",
+                    params=client.params,
+                    json={"tasks": client.new_task_bodies(count)},
+                )
+                client.stored_batch(response)
+
+        start = time.perf_counter()
+        deadline = start + workload.duration
+        client_latencies = await asyncio.gather(
+            *(drive(client, workload.mix, deadline) for client in clients)
+        )
+        elapsed = time.perf_counter() - start
+
+    endpoints = {}
+    for name in workload.mix:
+        latencies = [value for client in client_latencies for value in client[name]]
+        errors = sum(len(client[f"{name} errors"]) for client in client_latencies)
+        endpoints[name] = summarize(latencies, errors, elapsed)
+    every_request = [
+        value
+        for client in client_latencies
+        for name in workload.mix
+        for value in client[name]
+    ]
+    total_errors = sum(result["errors"] for result in endpoints.values())
+    return {
+        "total": summarize(every_request, total_errors, elapsed),
+        "endpoints": endpoints,
+    }
+
+
+def run_type(task_manager_type: str, workload: Workload) -> Dict[str, Any]:
+    with tempfile.TemporaryDirectory() as directory:
+        port = free_port()
+        # Spawned rather than forked, so the server starts from a clean interpreter
+        server = multiprocessing.get_context("spawn").Process(
+            target=serve, args=(task_manager_type, directory, port), daemon=True
+        )
+        server.start()
+        try:
+            return asyncio.run(load(port, workload))
+        finally:
+            server.terminate()
+            server.join()
+
+
+def print_results(results: Dict[str, Any]) -> None:
+    header = f"{'task manager':<18} {'endpoint':<22} {'req/s':>8} {'errors':>6}"
+    header += "".join(f" {f'p{p} ms':>9}" for p in PERCENTILES)
+    print(header)
+    for task_manager_type, result in results["task_managers"].items():
+        for name, summary in [*result["endpoints"].items(), ("total", result["total"])]:
+            line = (
+                f"{task_manager_type:<18} {name:<22} "
+                f"{summary['requests_per_second']:>8.0f} {summary['errors']:>6}"
+            )
+            line += "".join(
+                f" {summary['latency_ms'].get(f'p{p}', 0):>9.2f}" for p in PERCENTILES
+            )
+            print(line)
+
+
+def parse_mix(weights: List[str]) -> Dict[str, int]:
+    mix = {}
+    for weight in weights:
+        name, _, value = weight.partition("=")
+        if name not in ENDPOINTS or not value.isdigit():
+            raise argparse.ArgumentTypeError(
+                f"{weight} isn't endpoint=weight, endpoints are {', '.join(ENDPOINTS)}"
+            )
+        if int(value):
+            mix[name] = int(value)
+    return mix
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument(
+        "--task-manager-types",
+        nargs="+",
+        choices=TASK_MANAGER_TYPES,
+        default=["in_memory", "sqlite"],
+    )
+    parser.add_argument("--clients", type=int, default=16)
+    parser.add_argument("--tasks-per-client", type=int, default=200)
+    parser.add_argument("--batch-size", type=int, default=20)
+    parser.add_argument("--duration", type=float, default=10, help="seconds")
+    parser.add_argument(
+        "--mix",
+        nargs="+",
+        metavar="ENDPOINT=WEIGHT",
+        help="defaults to " + " ".join(f"{n}={w}" for n, w in DEFAULT_MIX.items()),
+    )
+    parser.add_argument("--seed", type=int, default=0)
+    parser.add_argument("--output", help="write the results to this JSON file")
+    args = parser.parse_args()
+
+    try:
+        mix = DEFAULT_MIX if args.mix is None else parse_mix(args.mix)
+    except argparse.ArgumentTypeError as error:
+        parser.error(str(error))
+    workload = Workload(
+        clients=args.clients,
+        tasks_per_client=args.tasks_per_client,
+        batch_size=args.batch_size,
+        duration=args.duration,
+        mix=mix,
+        seed=args.seed,
+    )
+
+    results = {
+        "environment": environment(),
+        "workload": workload.__dict__,
+        "task_managers": {
+            task_manager_type: run_type(task_manager_type, workload)
+            for task_manager_type in args.task_manager_types
+        },
+    }
+    if args.output is not None:
+        with open(args.output, "w") as file:
+            json.dump(results, file, indent=2)
+            file.write("\n")
+    print_results(results)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,64 @@
+"""Measure how many bytes InMemoryTaskManager holds per stored task.
+
+Run with ``python -m benchmarks.memory``. Memory is measured with tracemalloc, so
+it counts everything the task manager allocates: the stored tasks, the indexes
+over them and the strings they hold, but not the interpreter's own overhead.
+"""
+
+import argparse
+import gc
+import tracemalloc
+from datetime import date, timedelta
+from typing import Dict
+from uuid import uuid4
+
+from app.domain.models import CreateTask, TaskStatus
+from app.domain.task_managers import InMemoryTaskManager
+
+STATUSES = list(TaskStatus)
+
+
+def run(tasks: int, users: int, labels: int) -> Dict[str, float]:
+    user_ids = [uuid4() for _ in range(users)]
+    gc.collect()
+    tracemalloc.start()
+
+    task_manager = InMemoryTaskManager()
+    for i in range(tasks):
+        # Built inside the measurement so that the task names are counted
+        task_manager.create_task(
+            CreateTask(
+                name=f"Task {i}",
+                status=STATUSES[i % len(STATUSES)],
+                labels={f"label {(i + j) % (labels * 10)}" for j in range(i % labels)},
+                due_date=date(2024, 6, 1) + timedelta(days=i % 90) if i % 2 else None,
+                user_id=user_ids[i % users],
+            )
+        )
+
+    gc.collect()
+    size, _ = tracemalloc.get_traced_memory()
+    tracemalloc.stop()
+    return {
+        "bytes_per_task": size / tasks,
+        "megabytes": size / 2**20,
+    }
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--tasks", type=int, default=1_000_000)
+    parser.add_argument("--users", type=int, default=1000)
+    parser.add_argument("--labels", type=int, default=4)
+    args = parser.parse_args()
+
+    result = run(args.tasks, args.users, args.labels)
+    print(
+        f"{args.tasks} tasks for {args.users} users: "
+        f"{result['bytes_per_task']:.0f} bytes per task, "
+        f"{result['megabytes']:.0f} MiB in total"
+    )
+
+
+if __name__ == "__main__":
+    main()
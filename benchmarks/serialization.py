@@ -0,0 +1,97 @@
+"""Compare the per-task cost of serializing a get_tasks response with how FastAPI
+serializes it from the route's response_model.
+
+Run with ``python -m benchmarks.serialization``. FastAPI's path is the one routes
+used before: convert each task to a TaskResource, validate the response against
+the response_model, then serialize it with json.dumps.
+"""
+
+import argparse
+import asyncio
+import time
+from datetime import date
+from typing import Callable, Dict, List
+from uuid import uuid4
+
+from fastapi.responses import JSONResponse
+from fastapi.routing import serialize_response
+from fastapi.utils import create_response_field
+
+from app.api.resources import PaginatedResponse, TaskResource
+from app.api.serialization import task_page_response
+from app.domain.models import Task, TaskStatus
+
+RESPONSE_FIELD = create_response_field(
+    name="response", type_=PaginatedResponse[TaskResource]
+)
+
+
+def make_tasks(count: int) -> List[Task]:
+    user_id = uuid4()
+    return [
+        Task(
+            id=uuid4(),
+            name=f"Task {i}",
+            status=TaskStatus.PENDING,
+            labels={f"label {(i + j) % 30}" for j in range(3)},
+            due_date=date(2024, 6, 30),
+            user_id=user_id,
+        )
+        for i in range(count)
+    ]
+
+
+def fastapi_body(tasks: List[Task]) -> bytes:
+    content = PaginatedResponse[TaskResource](
+        data=[TaskResource(**task.model_dump()) for task in tasks], next_cursor=None
+    )
+    return JSONResponse(
+        asyncio.run(serialize_response(field=RESPONSE_FIELD, response_content=content))
+    ).body
+
+
+def direct_body(tasks: List[Task]) -> bytes:
+    return task_page_response(tasks, None, '"1"').body
+
+
+def best_of(repeat: int, step: Callable[[], bytes]) -> float:
+    timings = []
+    for _ in range(repeat):
+        start = time.perf_counter()
+        step()
+        timings.append(time.perf_counter() - start)
+    return min(timings)
+
+
+def run(counts: List[int], repeat: int) -> Dict[int, Dict[str, float]]:
+    results = {}
+    for count in counts:
+        tasks = make_tasks(count)
+        assert fastapi_body(tasks) == direct_body(tasks)
+        fastapi = best_of(repeat, lambda: fastapi_body(tasks))
+        direct = best_of(repeat, lambda: direct_body(tasks))
+        results[count] = {
+            "fastapi_us_per_task": fastapi / count * 1e6,
+            "direct_us_per_task": direct / count * 1e6,
+            "speedup": fastapi / direct,
+        }
+    return results
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--tasks", type=int, nargs="+", default=[1000, 10000])
+    parser.add_argument("--repeat", type=int, default=5)
+    args = parser.parse_args()
+
+    results = run(args.tasks, args.repeat)
+    print(f"{'tasks':>6} {'fastapi us':>11} {'direct us':>10} {'speedup':>8}")
+    for count, result in results.items():
+        print(
+            f"{count:>6} {result['fastapi_us_per_task']:>11.2f} "
+            f"{result['direct_us_per_task']:>10.2f} {result['speedup']:>7.1f}x"
+        )
+
+
+if __name__ == "__main__":
+    main()
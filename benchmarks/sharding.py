@@ -0,0 +1,97 @@
+"""Measure how write throughput scales with the number of sqlite shards.
+
+Run with ``python -m benchmarks.sharding``. Each writer thread creates tasks one
+at a time for its own user, so every task is a transaction of its own. The users
+are picked so each shard gets the same number of writers, as it would with many
+users. Fresh shards are created in a temporary directory for every shard count,
+so this never touches ``app/task.db``.
+"""
+
+import argparse
+import tempfile
+import threading
+import time
+from typing import Dict, List
+from uuid import UUID, uuid4
+
+from app.database import create_shard_databases, DEFAULT_PRAGMAS
+from app.domain.models import CreateTask
+from app.domain.sharded_task_managers import shard_index, ShardedTaskManager
+from app.domain.task_managers import SqliteTaskManager
+
+
+def spread_users(writers: int, shards: int) -> List[UUID]:
+    """A user for each writer, with the users spread evenly over the shards."""
+    per_shard = -(-writers // shards)
+    users: Dict[int, List[UUID]] = {shard: [] for shard in range(shards)}
+    while sum(len(shard_users) for shard_users in users.values()) < writers:
+        user_id = uuid4()
+        shard_users = users[shard_index(user_id, shards)]
+        if len(shard_users) < per_shard:
+            shard_users.append(user_id)
+    return [user_id for shard_users in users.values() for user_id in shard_users]
+
+
+def run(shards: int, writers: int, tasks: int, synchronous: str) -> Dict[str, float]:
+    with tempfile.TemporaryDirectory() as directory:
+        databases = create_shard_databases(
+            [f"sqlite:///{directory}/task_shard_{shard}.db" for shard in range(shards)],
+            pragmas={**DEFAULT_PRAGMAS, "synchronous": synchronous},
+            pool_size=writers,
+        )
+        for database in databases:
+            database.create_database()
+        task_manager = ShardedTaskManager(
+            [
+                SqliteTaskManager(session_factory=database.session)
+                for database in databases
+            ]
+        )
+
+        def write(user_id: UUID) -> None:
+            for i in range(tasks):
+                task_manager.create_task(CreateTask(name=f"Task {i}", user_id=user_id))
+
+        threads = [
+            threading.Thread(target=write, args=(user_id,))
+            for user_id in spread_users(writers, shards)
+        ]
+        start = time.perf_counter()
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+        elapsed = time.perf_counter() - start
+
+        for database in databases:
+            database.engine.dispose()
+        return {"shards": shards, "writes_per_second": writers * tasks / elapsed}
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--shards", type=int, nargs="+", default=[1, 2, 4, 8])
+    parser.add_argument("--writers", type=int, default=8)
+    parser.add_argument("--tasks", type=int, default=200, help="per writer")
+    parser.add_argument(
+        "--synchronous",
+        default="NORMAL",
+        choices=["OFF", "NORMAL", "FULL"],
+        help="FULL fsyncs every commit, like a database that has to be durable",
+    )
+    args = parser.parse_args()
+
+    baseline = None
+    print(f"{'shards':>6} {'writes/s':>10} {'scaling':>8}")
+    for shards in args.shards:
+        result = run(shards, args.writers, args.tasks, args.synchronous)
+        if baseline is None:
+            baseline = result["writes_per_second"]
+        print(
+            f"{shards:>6} {result['writes_per_second']:>10.0f} "
+            f"{result['writes_per_second'] / baseline:>7.2f}x"
+        )
+
+
+if __name__ == "__main__":
+    main()
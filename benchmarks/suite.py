@@ -0,0 +1,540 @@
+"""Measure the throughput and latency of every TaskManager method on each backend.
+
+Run with ``python -m benchmarks.suite``. Each backend is seeded with the same
+synthetic users, tasks and labels, then every method is called ``--calls`` times
+with its arguments built beforehand, so only the task manager is timed. Writes
+run after the reads, on tasks created for them, so every backend is read in the
+same state. Sqlite backends use a fresh database in a temporary directory, so this
+never touches ``app/task.db``.
+
+Write the results as JSON with ``--output`` and compare two runs with
+``--compare``:
+
+    python -m benchmarks.suite --output before.json
+    python -m benchmarks.suite --output after.json --compare before.json
+"""
+
+import argparse
+import contextlib
+import datetime
+import json
+import math
+import os
+import platform
+import subprocess
+import tempfile
+import time
+from dataclasses import dataclass
+from random import Random
+from typing import Any, Callable, Dict, Iterator, List, Optional
+from uuid import UUID
+
+import pydantic
+import sqlalchemy
+
+from app.database import Database
+from app.domain.caching_task_managers import CachingTaskManager, TaskCache
+from app.domain.durable_task_managers import DurableInMemoryTaskManager
+from app.domain.models import (
+    CreateTask,
+    Task,
+    TaskQuery,
+    TaskStatus,
+    UpdateTask,
+)
+from app.domain.task_managers import InMemoryTaskManager, SqliteTaskManager, TaskManager
+
+STATUSES = list(TaskStatus)
+PERCENTILES = (50, 90, 99)
+
+
+@contextlib.contextmanager
+def in_memory() -> Iterator[TaskManager]:
+    yield InMemoryTaskManager()
+
+
+@contextlib.contextmanager
+def sqlite_database() -> Iterator[Database]:
+    with tempfile.TemporaryDirectory() as directory:
+        database = Database(db_url=f"sqlite:///{directory}/task.db")
+        database.create_database()
+        yield database
+        database.engine.dispose()
+
+
+@contextlib.contextmanager
+def sqlite() -> Iterator[TaskManager]:
+    with sqlite_database() as database:
+        yield SqliteTaskManager(session_factory=database.session)
+
+
+@contextlib.contextmanager
+def cached_sqlite() -> Iterator[TaskManager]:
+    with sqlite_database() as database:
+        yield CachingTaskManager(
+            task_manager=SqliteTaskManager(session_factory=database.session),
+            cache=TaskCache(),
+        )
+
+
+@contextlib.contextmanager
+def durable_in_memory() -> Iterator[TaskManager]:
+    with tempfile.TemporaryDirectory() as directory:
+        task_manager = DurableInMemoryTaskManager(directory)
+        yield task_manager
+        task_manager.close()
+
+
+BACKENDS: Dict[str, Callable[[], contextlib.AbstractContextManager]] = {
+    "in_memory": in_memory,
+    "sqlite": sqlite,
+    "cached_sqlite": cached_sqlite,
+    "durable_in_memory": durable_in_memory,
+}
+
+
+@dataclass
+class Workload:
+    users: int
+    tasks_per_user: int
+    labels: int
+    calls: int
+    batch_size: int
+    seed: int
+
+
+class Seeded:
+    """The synthetic data a backend was seeded with, and the source of the random
+    choices the operations make, so every backend gets the same calls."""
+
+    def __init__(self, task_manager: TaskManager, workload: Workload) -> None:
+        self.task_manager = task_manager
+        self.workload = workload
+        self.random = Random(workload.seed)
+        self.labels = [f"label {label}" for label in range(workload.labels)]
+        self.tasks: List[Task] = []
+        for _ in range(workload.users):
+            user_id = self.random_uuid()
+            self.tasks += task_manager.create_tasks(
+                [self.create_task(user_id, i) for i in range(workload.tasks_per_user)]
+            )
+        self.user_ids = list(dict.fromkeys(task.user_id for task in self.tasks))
+
+    def random_uuid(self) -> UUID:
+        return UUID(int=self.random.getrandbits(128), version=4)
+
+    def create_task(self, user_id: UUID, i: int) -> CreateTask:
+        return CreateTask(
+            name=f"Task {i}",
+            status=self.random.choice(STATUSES),
+            labels=set(self.random.sample(self.labels, min(2, len(self.labels)))),
+            due_date=(
+                datetime.date(2024, 6, 1)
+                + datetime.timedelta(days=self.random.randrange(90))
+                if i % 2
+                else None
+            ),
+            user_id=user_id,
+        )
+
+    def task(self) -> Task:
+        return self.random.choice(self.tasks)
+
+    def user_id(self) -> UUID:
+        return self.random.choice(self.user_ids)
+
+    def update_task(self, task: Task) -> UpdateTask:
+        return UpdateTask(
+            **{**task.model_dump(), "status": self.random.choice(STATUSES)}
+        )
+
+    def new_tasks(self, count: int) -> List[Task]:
+        """Creates tasks, untimed, for the writes that use them up."""
+        user_id = self.user_id()
+        return self.task_manager.create_tasks(
+            [self.create_task(user_id, i) for i in range(count)]
+        )
+
+    def deleted_tasks(self, count: int) -> List[Task]:
+        tasks = self.new_tasks(count)
+        self.task_manager.delete_tasks([task.id for task in tasks], tasks[0].user_id)
+        return tasks
+
+
+# Builds the calls an operation times, with everything they need done beforehand
+Prepare = Callable[[Seeded, int], List[Callable[[], Any]]]
+
+
+def prepare_get_tasks_page(seeded: Seeded, calls: int) -> List[Callable[[], Any]]:
+    task_manager = seeded.task_manager
+    prepared = []
+    for _ in range(calls):
+        user_id = seeded.user_id()
+        # The second page, so the cursor is decoded and seeked to
+        cursor = task_manager.get_tasks_page(user_id, 20).next_cursor
+        prepared.append(
+            lambda user_id=user_id, cursor=cursor: task_manager.get_tasks_page(
+                user_id, 20, cursor
+            )
+        )
+    return prepared
+
+
+def batches(seeded: Seeded, calls: int, deleted: bool) -> List[List[Task]]:
+    """A batch of a user's tasks for each call, created, or created and deleted,
+    for the call."""
+    batch_size = seeded.workload.batch_size
+    if deleted:
+        return [seeded.deleted_tasks(batch_size) for _ in range(calls)]
+    return [seeded.new_tasks(batch_size) for _ in range(calls)]
+
+
+def read(call: Callable[[TaskManager, Task], Any]) -> Prepare:
+    """Calls with a random seeded task."""
+
+    def prepare(seeded: Seeded, calls: int) -> List[Callable[[], Any]]:
+        return [
+            lambda task=seeded.task(): call(seeded.task_manager, task)
+            for _ in range(calls)
+        ]
+
+    return prepare
+
+
+def query(seeded: Seeded) -> TaskQuery:
+    return TaskQuery(
+        statuses={seeded.random.choice(STATUSES)},
+        labels_any={seeded.random.choice(seeded.labels)},
+    )
+
+
+def prepare_get_tasks_filtered(seeded: Seeded, calls: int) -> List[Callable[[], Any]]:
+    return [
+        lambda user_id=seeded.user_id(), query=query(seeded): (
+            seeded.task_manager.get_tasks(user_id, query)
+        )
+        for _ in range(calls)
+    ]
+
+
+def prepare_create_task(seeded: Seeded, calls: int) -> List[Callable[[], Any]]:
+    return [
+        lambda create_task=seeded.create_task(seeded.user_id(), i): (
+            seeded.task_manager.create_task(create_task)
+        )
+        for i in range(calls)
+    ]
+
+
+def prepare_create_tasks(seeded: Seeded, calls: int) -> List[Callable[[], Any]]:
+    prepared = []
+    for _ in range(calls):
+        user_id = seeded.user_id()
+        create_tasks = [
+            seeded.create_task(user_id, i) for i in range(seeded.workload.batch_size)
+        ]
+        prepared.append(
+            lambda create_tasks=create_tasks: seeded.task_manager.create_tasks(
+                create_tasks
+            )
+        )
+    return prepared
+
+
+def prepare_update_task(seeded: Seeded, calls: int) -> List[Callable[[], Any]]:
+    prepared = []
+    for _ in range(calls):
+        task = seeded.task()
+        update_task = seeded.update_task(task)
+        prepared.append(
+            lambda update_task=update_task, user_id=task.user_id: (
+                seeded.task_manager.update_task(update_task, user_id)
+            )
+        )
+    return prepared
+
+
+def prepare_get_last_history_entry(
+    seeded: Seeded, calls: int
+) -> List[Callable[[], Any]]:
+    tasks = seeded.deleted_tasks(calls)
+    return [
+        lambda task=task: seeded.task_manager.get_last_history_entry(
+            task.id, task.user_id
+        )
+        for task in tasks
+    ]
+
+
+def prepare_update_tasks(seeded: Seeded, calls: int) -> List[Callable[[], Any]]:
+    prepared = []
+    for tasks in batches(seeded, calls, deleted=False):
+        update_tasks = [seeded.update_task(task) for task in tasks]
+        prepared.append(
+            lambda update_tasks=update_tasks, user_id=tasks[0].user_id: (
+                seeded.task_manager.update_tasks(update_tasks, user_id)
+            )
+        )
+    return prepared
+
+
+def prepare_delete_tasks(seeded: Seeded, calls: int) -> List[Callable[[], Any]]:
+    prepared = []
+    for tasks in batches(seeded, calls, deleted=False):
+        task_ids = [task.id for task in tasks]
+        prepared.append(
+            lambda task_ids=task_ids, user_id=tasks[0].user_id: (
+                seeded.task_manager.delete_tasks(task_ids, user_id)
+            )
+        )
+    return prepared
+
+
+def prepare_restore_tasks(seeded: Seeded, calls: int) -> List[Callable[[], Any]]:
+    prepared = []
+    for tasks in batches(seeded, calls, deleted=True):
+        task_ids = [task.id for task in tasks]
+        prepared.append(
+            lambda task_ids=task_ids, user_id=tasks[0].user_id: (
+                seeded.task_manager.restore_tasks(user_id, task_ids)
+            )
+        )
+    return prepared
+
+
+def one_at_a_time(call: Callable[[TaskManager, Task], Any], deleted: bool) -> Prepare:
+    """Calls with tasks created, or created and deleted, for the call."""
+
+    def prepare(seeded: Seeded, calls: int) -> List[Callable[[], Any]]:
+        tasks = seeded.deleted_tasks(calls) if deleted else seeded.new_tasks(calls)
+        return [lambda task=task: call(seeded.task_manager, task) for task in tasks]
+
+    return prepare
+
+
+@dataclass
+class Operation:
+    name: str
+    prepare: Prepare
+    # How many tasks each call reads or writes, for items_per_second
+    batch: bool = False
+
+
+OPERATIONS = [
+    # Reads, on the seeded tasks
+    Operation(
+        "get_task",
+        read(lambda task_manager, task: task_manager.get_task(task.id, task.user_id)),
+    ),
+    Operation(
+        "get_task_version",
+        read(
+            lambda task_manager, task: task_manager.get_task_version(
+                task.id, task.user_id
+            )
+        ),
+    ),
+    Operation(
+        "get_tasks_version",
+        read(lambda task_manager, task: task_manager.get_tasks_version(task.user_id)),
+    ),
+    Operation(
+        "get_tasks",
+        read(lambda task_manager, task: task_manager.get_tasks(task.user_id)),
+    ),
+    Operation("get_tasks_filtered", prepare_get_tasks_filtered),
+    Operation(
+        "iter_tasks",
+        read(lambda task_manager, task: list(task_manager.iter_tasks(task.user_id))),
+    ),
+    Operation("get_tasks_page", prepare_get_tasks_page),
+    Operation("get_last_history_entry", prepare_get_last_history_entry),
+    # Writes
+    Operation("create_task", prepare_create_task),
+    Operation("update_task", prepare_update_task),
+    Operation(
+        "delete_task",
+        one_at_a_time(
+            lambda task_manager, task: task_manager.delete_task(task.id, task.user_id),
+            deleted=False,
+        ),
+    ),
+    Operation(
+        "restore_task",
+        one_at_a_time(
+            lambda task_manager, task: task_manager.restore_task(task.id, task.user_id),
+            deleted=True,
+        ),
+    ),
+    Operation("create_tasks", prepare_create_tasks, batch=True),
+    Operation("update_tasks", prepare_update_tasks, batch=True),
+    Operation("delete_tasks", prepare_delete_tasks, batch=True),
+    Operation("restore_tasks", prepare_restore_tasks, batch=True),
+]
+
+
+def percentile(latencies: List[float], percent: float) -> float:
+    """The nearest-rank percentile of sorted latencies."""
+    return latencies[max(0, math.ceil(percent / 100 * len(latencies)) - 1)]
+
+
+def summarize(latencies: List[float], items_per_call: int) -> Dict[str, Any]:
+    latencies.sort()
+    total = sum(latencies)
+    return {
+        "calls": len(latencies),
+        "ops_per_second": len(latencies) / total,
+        "items_per_second": len(latencies) * items_per_call / total,
+        "latency_ms": {
+            "mean": total / len(latencies) * 1000,
+            **{f"p{p}": percentile(latencies, p) * 1000 for p in PERCENTILES},
+            "max": latencies[-1] * 1000,
+        },
+    }
+
+
+def time_calls(calls: List[Callable[[], Any]]) -> List[float]:
+    latencies = []
+    for call in calls:
+        start = time.perf_counter()
+        call()
+        latencies.append(time.perf_counter() - start)
+    return latencies
+
+
+def run_backend(
+    backend: str, workload: Workload, operations: List[Operation]
+) -> Dict[str, Any]:
+    with BACKENDS[backend]() as task_manager:
+        start = time.perf_counter()
+        seeded = Seeded(task_manager, workload)
+        results: Dict[str, Any] = {"seed_seconds": time.perf_counter() - start}
+        # A few untimed calls first, so caches and connections are warm
+        warm_up = max(1, workload.calls // 20)
+        for operation in operations:
+            calls = operation.prepare(seeded, warm_up + workload.calls)
+            for call in calls[:warm_up]:
+                call()
+            results[operation.name] = summarize(
+                time_calls(calls[warm_up:]),
+                workload.batch_size if operation.batch else 1,
+            )
+        return results
+
+
+def git_commit() -> Optional[str]:
+    try:
+        return subprocess.run(
+            ["git", "rev-parse", "--short", "HEAD"],
+            capture_output=True,
+            text=True,
+            check=True,
+        ).stdout.strip()
+    except (OSError, subprocess.CalledProcessError):
+        return None
+
+
+def environment() -> Dict[str, Any]:
+    """What a run was measured on, so runs are only compared like for like."""
+    return {
+        "created_at": datetime.datetime.now(datetime.timezone.utc).isoformat(),
+        "commit": git_commit(),
+        "python": platform.python_version(),
+        "platform": platform.platform(),
+        "cpus": os.cpu_count(),
+        "sqlalchemy": sqlalchemy.__version__,
+        "pydantic": pydantic.VERSION,
+    }
+
+
+def run(
+    backends: List[str], workload: Workload, operations: List[Operation]
+) -> Dict[str, Any]:
+    return {
+        "environment": environment(),
+        "workload": workload.__dict__,
+        "backends": {
+            backend: run_backend(backend, workload, operations) for backend in backends
+        },
+    }
+
+
+def print_results(results: Dict[str, Any], baseline: Optional[Dict[str, Any]]) -> None:
+    header = f"{'backend':<18} {'operation':<24} {'ops/s':>10} {'items/s':>10}"
+    header += "".join(f" {f'p{p} ms':>9}" for p in PERCENTILES)
+    if baseline is not None:
+        header += f" {'ops/s vs baseline':>18}"
+    print(header)
+    for backend, operations in results["backends"].items():
+        for name, result in operations.items():
+            if name == "seed_seconds":
+                continue
+            line = (
+                f"{backend:<18} {name:<24} {result['ops_per_second']:>10.0f} "
+                f"{result['items_per_second']:>10.0f}"
+            )
+            line += "".join(
+                f" {result['latency_ms'][f'p{p}']:>9.3f}" for p in PERCENTILES
+            )
+            if baseline is not None:
+                before = baseline["backends"].get(backend, {}).get(name)
+                if before is not None:
+                    ratio = result["ops_per_second"] / before["ops_per_second"]
+                    line += f" {ratio:>17.2f}x"
+            print(line)
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument(
+        "--backends",
+        nargs="+",
+        choices=list(BACKENDS),
+        default=["in_memory", "sqlite"],
+    )
+    parser.add_argument(
+        "--operations",
+        nargs="+",
+        choices=[operation.name for operation in OPERATIONS],
+        help="defaults to every operation",
+    )
+    parser.add_argument("--users", type=int, default=100)
+    parser.add_argument("--tasks-per-user", type=int, default=100)
+    parser.add_argument("--labels", type=int, default=20)
+    parser.add_argument("--calls", type=int, default=500, help="per operation")
+    parser.add_argument(
+        "--batch-size", type=int, default=50, help="tasks per batch write"
+    )
+    parser.add_argument("--seed", type=int, default=0)
+    parser.add_argument("--output", help="write the results to this JSON file")
+    parser.add_argument("--compare", help="a JSON file from an earlier run")
+    args = parser.parse_args()
+
+    baseline = None
+    if args.compare is not None:
+        with open(args.compare) as file:
+            baseline = json.load(file)
+    operations = [
+        operation
+        for operation in OPERATIONS
+        if args.operations is None or operation.name in args.operations
+    ]
+    workload = Workload(
+        users=args.users,
+        tasks_per_user=args.tasks_per_user,
+        labels=args.labels,
+        calls=args.calls,
+        batch_size=args.batch_size,
+        seed=args.seed,
+    )
+
+    results = run(args.backends, workload, operations)
+    if args.output is not None:
+        with open(args.output, "w") as file:
+            json.dump(results, file, indent=2)
+            file.write("\n")
+    print_results(results, baseline)
+
+
+if __name__ == "__main__":
+    main()